@@ -8,8 +8,8 @@ import pandas as pd
 import os
 import logging
 
-from sorcha.ephemeris.simulation_driver import create_ephemeris
-from sorcha.ephemeris.simulation_setup import precompute_pointing_information
+from sorcha.ephemeris.simulation_driver import create_ephemeris, log_cache_counts
+from sorcha.ephemeris.simulation_setup import EphemerisContext, precompute_pointing_information
 
 from sorcha.modules.PPReadPointingDatabase import PPReadPointingDatabase
 from sorcha.modules.PPDistanceandMotionCuts import distance_cut, motion_cut
@@ -127,8 +127,12 @@ def runDESSimulation(args, sconfigs, return_only=False):
     # of the needed values derived from the pointing information.
 
     if sconfigs.input.ephemerides_type.casefold() != "external":
+        # the ASSIST ephemeris, SPICE kernels and observatory positions are set up once for the whole run
+        ephemeris_context = EphemerisContext(args, sconfigs)
         verboselog("Pre-computing pointing information for ephemeris generation")
-        filterpointing = precompute_pointing_information(filterpointing, args, sconfigs)
+        filterpointing = precompute_pointing_information(
+            filterpointing, args, sconfigs, context=ephemeris_context
+        )
 
     # Set up the data readers.
     ephem_type = sconfigs.input.ephemerides_type
@@ -198,6 +202,7 @@ def runDESSimulation(args, sconfigs, return_only=False):
                     sconfigs.filters.observing_filters,
                     sconfigs.lightcurve.lc_model,
                     sconfigs.activity.comet_activity,
+                    sun_states=ephemeris_context.sun_states,
                 )
                 verboselog(
                     "Number of rows After removing faint objects in faint object culling filter: "
@@ -212,7 +217,9 @@ def runDESSimulation(args, sconfigs, return_only=False):
                     continue
 
             verboselog("Starting ephemeris generation")
-            observations = create_ephemeris(orbits_df, filterpointing, args, sconfigs)
+            observations = create_ephemeris(
+                orbits_df, filterpointing, args, sconfigs, context=ephemeris_context
+            )
             verboselog("Ephemeris generation completed")
 
         verboselog("Start post processing for this chunk")
@@ -391,6 +398,10 @@ def runDESSimulation(args, sconfigs, return_only=False):
         loopCounter = loopCounter + 1
         # end for
 
+    if sconfigs.input.ephemerides_type.casefold() != "external":
+        log_cache_counts(ephemeris_context.cache_counts, verboselog)
+        ephemeris_context.close()
+
     if sconfigs.output.output_format == "sqlite3" and os.path.isfile(
         os.path.join(args.outpath, args.outfilestem + ".db")
     ):
@@ -13,12 +13,15 @@ from .simulation_geometry import (
     barycentricObservatoryRates,
     ecliptic_to_equatorial,
     integrate_light_time,
+    integrate_light_time_particles,
     ra_dec2vec,
 )
 from .simulation_parsing import (
     mjd_tai_to_epoch,
     Observatory,
+    parse_orbit_columns,
     parse_orbit_row,
+    SunStates,
 )
 from .simulation_setup import (
     create_assist_ephemeris,
@@ -30,5 +33,7 @@ from .simulation_driver import create_ephemeris
 
 from .orbit_conversion_utilities import (
     universal_cartesian,
+    universal_cartesian_array,
     universal_cometary,
+    universal_cometary_array,
 )
@@ -0,0 +1,176 @@
+import numpy as np
+
+from sorcha.ephemeris.orbit_conversion_utilities import universal_cartesian_array, universal_cometary_array
+from sorcha.ephemeris.simulation_constants import (
+    MAX_OBSERVER_DISTANCE,
+    PERTURBER_DISTANCE,
+    PERTURBER_GM,
+    PLUTO_DISTANCE,
+    PLUTO_GM,
+    SPEED_OF_LIGHT,
+)
+
+
+class KeplerParticle:
+    """
+    Position and velocity of one object of a KeplerSimulation, read like a REBOUND particle
+    """
+
+    def __init__(self, xyz, vxyz):
+        """
+        Initialization function for the class
+
+        Parameters
+        ----------
+        xyz: array (3 entries)
+            Position
+        vxyz: array (3 entries)
+            Velocity
+        """
+        self.xyz = xyz
+        self.vxyz = vxyz
+
+
+class KeplerSimulation:
+    """
+    Two-body propagation of objects about the Solar System barycentre, with the
+    universal variable formulation. It stands in for both an ASSIST simulation
+    and its extras in the simulation dictionary: integrate_or_interpolate moves
+    the objects to a new time, and their states are then read with
+    serialize_particle_data or particles, as from a REBOUND simulation.
+    """
+
+    def __init__(self, mu, states, t):
+        """
+        Initialization function for the class
+
+        Parameters
+        ----------
+        mu: float
+            Standard gravitational parameter GM of the Solar System barycentre (au^3/day^2)
+        states: array (N,6)
+            Barycentric positions (au) and velocities (au/day) of the objects
+        t: array
+            Time of the state of each object (days, in the time of the ASSIST simulations)
+        """
+        states = np.asarray(states, dtype=float)
+        self.mu = mu
+        self.elements = universal_cometary_array(mu, *states.T, np.asarray(t, dtype=float))
+        self.states = states.copy()
+        self.t = None
+
+    @property
+    def N(self):
+        """Number of objects"""
+        return len(self.states)
+
+    @property
+    def particles(self):
+        """The states of the objects, as REBOUND particles"""
+        return [KeplerParticle(state[:3], state[3:]) for state in self.states]
+
+    def integrate_or_interpolate(self, t):
+        """
+        Moves all the objects to a new time
+
+        Parameters
+        ----------
+        t: float
+            Target time (days, in the time of the ASSIST simulations)
+        """
+        if t != self.t:
+            self.states = universal_cartesian_array(self.mu, *self.elements.T, np.full(self.N, float(t)))
+            self.t = t
+
+    def serialize_particle_data(self, xyz=None, vxvyvz=None):
+        """
+        Copies the states of the objects into arrays, as REBOUND simulations do
+
+        Parameters
+        ----------
+        xyz: array (N,3), default=None
+            Filled with the positions of the objects
+        vxvyvz: array (N,3), default=None
+            Filled with the velocities of the objects
+        """
+        if xyz is not None:
+            xyz[:] = self.states[:, :3]
+        if vxvyvz is not None:
+            vxvyvz[:] = self.states[:, 3:]
+
+
+def kepler_error_bound(mu, states, t, t_start, t_end):
+    """
+    Bounds the angle, as seen from a ground-based observatory, between the
+    two-body propagation of objects about the Solar System barycentre and
+    their integration under the forces of the ASSIST ephemeris.
+
+    Away from the planets, the residual acceleration of an object is that of
+    the bodies of the ephemeris beyond their total mass placed at the
+    barycentre. By Taylor's theorem it is at most 3 GM d^2 / (r - d)^4 for
+    every body at a distance d from the barycentre, where r is the smallest
+    distance of the object from the barycentre over the propagation. Objects
+    coming closer than 1 au to Pluto's orbit are bounded as if they stayed
+    1 au away from Pluto itself. The relativistic correction is bounded by
+    GM / r^2 (4 GM / r + 4 v^2) / c^2. Over a propagation of dt days the
+    positions stay within half the residual acceleration times dt^2, which
+    holds as long as dt is short compared to the orbital periods.
+
+    Parameters
+    ----------
+    mu: float
+        Standard gravitational parameter GM of the Solar System barycentre (au^3/day^2)
+    states: array (N,6)
+        Barycentric positions (au) and velocities (au/day) of the objects
+    t: array
+        Time of the state of each object (days)
+    t_start: float
+        First time at which the objects are observed (days)
+    t_end: float
+        Last time at which the objects are observed (days)
+    Returns
+    -------
+    bound: array
+        Bound on the angular error (radians) of each object, infinite where
+        the object comes too close to the barycentre for the bound to hold
+    """
+    states = np.asarray(states, dtype=float)
+    t = np.asarray(t, dtype=float)
+    elements = universal_cometary_array(mu, *states.T, t)
+    q, e, tp = elements[:, 0], elements[:, 1], elements[:, 5]
+
+    # the objects are needed a light travel time before they are observed
+    r_start = np.linalg.norm(
+        universal_cartesian_array(mu, *elements.T, np.full(len(t), t_start))[:, :3], axis=1
+    )
+    t_lo = np.minimum(t_start - (r_start + MAX_OBSERVER_DISTANCE) / SPEED_OF_LIGHT, t)
+    t_hi = np.maximum(t_end, t)
+    dt = np.maximum(t_hi - t, t - t_lo)
+
+    # the distance from the barycentre is smallest at one end of the propagation,
+    # unless the object passes its perihelion in between
+    r_lo = np.linalg.norm(universal_cartesian_array(mu, *elements.T, t_lo)[:, :3], axis=1)
+    r_hi = np.linalg.norm(universal_cartesian_array(mu, *elements.T, t_hi)[:, :3], axis=1)
+    elliptic = e < 1
+    period = np.full(len(t), np.inf)
+    period[elliptic] = 2 * np.pi * np.sqrt((q[elliptic] / (1 - e[elliptic])) ** 3 / mu)
+    perihelion = np.where(elliptic, t_lo + np.mod(tp - t_lo, period), tp)
+    passes = (perihelion >= t_lo) & (perihelion <= t_hi)
+    r_min = np.where(passes, q, np.minimum(r_lo, r_hi))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        clearance = r_min[:, np.newaxis] - PERTURBER_DISTANCE
+        acceleration = np.sum(
+            np.where(clearance > 0, 3 * PERTURBER_GM * PERTURBER_DISTANCE**2 / clearance**4, np.inf), axis=1
+        )
+        acceleration += np.where(
+            r_min > PLUTO_DISTANCE + 1,
+            3 * PLUTO_GM * PLUTO_DISTANCE**2 / (r_min - PLUTO_DISTANCE) ** 4,
+            PLUTO_GM * (1 + 1 / r_min**2),
+        )
+        v2 = mu * (2 / r_min - (1 - e) / q)
+        acceleration += mu / r_min**2 * (4 * mu / r_min + 4 * v2) / SPEED_OF_LIGHT**2
+
+        distance = r_min - MAX_OBSERVER_DISTANCE
+        bound = np.where(distance > 0, 0.5 * acceleration * dt**2 / distance, np.inf)
+    return np.nan_to_num(bound, nan=np.inf, posinf=np.inf)
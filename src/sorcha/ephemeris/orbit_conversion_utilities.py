@@ -334,6 +334,55 @@ def universal_cartesian(mu, q, e, incl, longnode, argperi, tp, epochMJD_TDB):
     return xp[0], xp[1], xp[2], vp[0], vp[1], vp[2]
 
 
+@numba.njit(parallel=True)
+def universal_cartesian_array(mu, q, e, incl, longnode, argperi, tp, epochMJD_TDB):
+    """
+    Converts arrays of orbital elements into state vectors, running
+    `universal_cartesian` for the orbits in parallel
+
+    The same notes on orientation and units as in `universal_cartesian` apply.
+
+    Parameters
+    ----------
+    mu : float
+        Standard gravitational parameter GM, shared by all the orbits
+    q : array of floats
+        Perihelion
+    e : array of floats
+        Eccentricity
+    incl : array of floats
+        Inclination (radians)
+    longnode : array of floats
+        Longitude of ascending node (radians)
+    argperi : array of floats
+        Argument of perihelion (radians)
+    tp : array of floats
+        Time of perihelion passage in TDB scale
+    epochMJD_TDB : array of floats
+        Epoch (in TDB) when each set of elements is defined
+
+    Returns
+    ----------
+    states : array of floats
+        (N, 6) array with the position and velocity of each orbit. Orbits
+        whose conversion did not converge are filled with NaN
+    """
+    n = len(q)
+    states = np.empty((n, 6))
+    for i in numba.prange(n):
+        x, y, z, vx, vy, vz = universal_cartesian(
+            mu, q[i], e[i], incl[i], longnode[i], argperi[i], tp[i], epochMJD_TDB[i]
+        )
+        states[i, 0] = x
+        states[i, 1] = y
+        states[i, 2] = z
+        states[i, 3] = vx
+        states[i, 4] = vy
+        states[i, 5] = vz
+
+    return states
+
+
 @numba.njit
 def principal_value(theta):
     """
@@ -485,6 +534,55 @@ def universal_cometary(mu, x, y, z, vx, vy, vz, epochMJD_TDB):
     return q, e, incl, longnode, argperi, tp
 
 
+@numba.njit(parallel=True)
+def universal_cometary_array(mu, x, y, z, vx, vy, vz, epochMJD_TDB):
+    """
+    Converts arrays of state vectors into cometary orbital elements, running
+    `universal_cometary` for the orbits in parallel
+
+    The same notes on orientation and units as in `universal_cometary` apply.
+
+    Parameters
+    -----------
+    mu : float
+        Standard gravitational parameter GM, shared by all the orbits
+    x : array of floats
+        x coordinate
+    y : array of floats
+        y coordinate
+    z : array of floats
+        z coordinate
+    vx : array of floats
+        x velocity
+    vy : array of floats
+        y velocity
+    vz : array of floats
+        z velocity
+    epochMJD_TDB : array of floats
+        Epoch (in TDB) when each state vector is defined
+
+    Returns
+    ----------
+    elements : array of floats
+        (N, 6) array with the cometary elements (q, e, incl, longnode, argperi, tp)
+        of each orbit, with the angles in radians
+    """
+    n = len(x)
+    elements = np.empty((n, 6))
+    for i in numba.prange(n):
+        q, e, incl, longnode, argperi, tp = universal_cometary(
+            mu, x[i], y[i], z[i], vx[i], vy[i], vz[i], epochMJD_TDB[i]
+        )
+        elements[i, 0] = q
+        elements[i, 1] = e
+        elements[i, 2] = incl
+        elements[i, 3] = longnode
+        elements[i, 4] = argperi
+        elements[i, 5] = tp
+
+    return elements
+
+
 @numba.njit(fastmath=True)
 def universal_keplerian(mu, x, y, z, vx, vy, vz, epochMJD_TDB):
     """
@@ -1,8 +1,10 @@
+from collections import OrderedDict
+
 import numpy as np
 import healpy as hp
 import numba
-
-from collections import defaultdict
+import spiceypy as spice
+from scipy.spatial import cKDTree
 
 from sorcha.ephemeris.simulation_geometry import *
 from sorcha.ephemeris.simulation_constants import *
@@ -45,10 +47,202 @@ def lagrange3(t0, t1, t2, t):
     return L0, L1, L2
 
 
+def build_pixel_index(pixels, objects):
+    """Builds a compressed (CSR-style) index of the objects found in each
+    HEALPix pixel from a list of (pixel, object) pairs.
+
+    Parameters
+    ----------
+    pixels : 1D array of int
+        HEALPix pixel of each pair. Negative pixels (missing neighbours)
+        are ignored.
+    objects : 1D array of int
+        Object index of each pair
+
+    Returns
+    -------
+    unique_pixels : 1D array of int
+        Sorted pixels holding at least one object
+    offsets : 1D array of int
+        The objects in unique_pixels[i] are object_indices[offsets[i]:offsets[i + 1]]
+    object_indices : 1D array of int
+        Object indices, sorted within each pixel and without duplicates
+    """
+    keep = pixels >= 0
+    pixels, objects = pixels[keep].astype(np.int64), objects[keep].astype(np.int64)
+
+    # sort the pairs by pixel and then object with a single combined key, and drop repeated pairs
+    n_objects = objects.max() + 1 if len(objects) else 1
+    key = np.sort(pixels * n_objects + objects)
+    distinct = np.ones(len(key), dtype=bool)
+    distinct[1:] = key[1:] != key[:-1]
+    pixels, objects = np.divmod(key[distinct], n_objects)
+
+    first = np.ones(len(pixels), dtype=bool)
+    first[1:] = pixels[1:] != pixels[:-1]
+    starts = np.flatnonzero(first)
+    unique_pixels = pixels[starts]
+    offsets = np.append(starts, len(pixels))
+    return unique_pixels, offsets, objects
+
+
+def picket_interval_ladder(picket_interval, picket_min=None, picket_max=None):
+    """Lists the picket intervals available to the objects: the base interval
+    scaled by powers of two, between the shortest and the longest interval allowed.
+
+    Parameters
+    ----------
+    picket_interval : float
+        The base interval (days) between picket calculations
+    picket_min : float, default=None
+        Shortest interval (days). Defaults to picket_interval.
+    picket_max : float, default=None
+        Longest interval (days). Defaults to picket_interval.
+
+    Returns
+    -------
+    intervals : 1D array
+        The picket intervals (days), in increasing order
+    """
+    picket_min = picket_interval if picket_min is None else picket_min
+    picket_max = picket_interval if picket_max is None else picket_max
+
+    k_min = int(np.ceil(np.log2(picket_min / picket_interval) - 1e-9))
+    k_max = int(np.floor(np.log2(picket_max / picket_interval) + 1e-9))
+    return picket_interval * 2.0 ** np.arange(k_min, k_max + 1)
+
+
+def max_orbital_speed(r, v, gm=PERTURBER_GM.sum() + PLUTO_GM):
+    """Bounds the speed of objects over their two-body orbits: the speed is
+    largest at perihelion, where it is gm (1 + e) / h, with h the specific
+    angular momentum. This holds for hyperbolic orbits as well.
+
+    Parameters
+    ----------
+    r : array (N,3)
+        Barycentric positions of the objects (au)
+    v : array (N,3)
+        Barycentric velocities of the objects (au/day)
+    gm : float, default=PERTURBER_GM.sum() + PLUTO_GM
+        Standard gravitational parameter (au^3/day^2) of the bodies the objects orbit
+
+    Returns
+    -------
+    speed : 1D array
+        Perihelion speeds (au/day). Infinite for objects on radial orbits.
+    """
+    h = np.linalg.norm(np.cross(r, v), axis=1)
+    energy = 0.5 * np.sum(v * v, axis=1) - gm / np.linalg.norm(r, axis=1)
+    e = np.sqrt(np.maximum(1 + 2 * energy * h**2 / gm**2, 0))
+    with np.errstate(divide="ignore"):
+        speed = gm * (1 + e) / h
+    return np.maximum(speed, np.linalg.norm(v, axis=1))
+
+
+class PicketStateCache:
+    """
+    Light-time corrected barycentric states of the objects at recent picket times,
+    shared between the PixelDicts of several observatories built on the same
+    simulation dictionary, so that the objects are integrated to each picket time
+    only once. The PixelDicts of the other observatories only correct these states
+    for their own light travel times.
+    """
+
+    def __init__(self, max_times=64, time_resolution=1e-8):
+        """
+        Initialization function for the class
+
+        Parameters
+        ----------
+        max_times: int
+            Number of picket times kept, the least recently used being dropped first (default: 64)
+        time_resolution: float
+            Resolution (days) of the picket times the states are kept at (default: 1e-8)
+        """
+        self.max_times = max_times
+        self.time_resolution = time_resolution
+        self.states = OrderedDict()
+
+    def lookup(self, t, obj_indices):
+        """
+        Looks up the states of a set of objects at a picket time
+
+        Parameters
+        ----------
+        t: float
+            Picket time
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        Returns
+        -------
+        found: array of bool
+            Whether the state of each object is known
+        target: array (N,3)
+            Object positions at t-lt, where found
+        vtarget: array (N,3)
+            Object velocities at t-lt, where found
+        lt: array
+            Light travel times, where found
+        """
+        n = len(obj_indices)
+        found = np.zeros(n, dtype=bool)
+        target, vtarget, lt = np.empty((n, 3)), np.empty((n, 3)), np.empty(n)
+
+        for indices, chunk_target, chunk_vtarget, chunk_lt in self.states.get(self.get_key(t), []):
+            pos = np.minimum(np.searchsorted(indices, obj_indices), len(indices) - 1)
+            hit = (indices[pos] == obj_indices) & ~found
+            target[hit], vtarget[hit], lt[hit] = (
+                chunk_target[pos[hit]],
+                chunk_vtarget[pos[hit]],
+                chunk_lt[pos[hit]],
+            )
+            found |= hit
+
+        return found, target, vtarget, lt
+
+    def store(self, t, obj_indices, target, vtarget, lt):
+        """
+        Stores the states of a set of objects at a picket time
+
+        Parameters
+        ----------
+        t: float
+            Picket time
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        target: array (N,3)
+            Object positions at t-lt
+        vtarget: array (N,3)
+            Object velocities at t-lt
+        lt: array
+            Light travel times
+        """
+        key = self.get_key(t)
+        order = np.argsort(obj_indices)
+        self.states.setdefault(key, []).append((obj_indices[order], target[order], vtarget[order], lt[order]))
+        self.states.move_to_end(key)
+        while len(self.states) > self.max_times:
+            self.states.popitem(last=False)
+
+    def get_key(self, t):
+        """Rounds a picket time to the resolution of the cache"""
+        return round(t / self.time_resolution)
+
+
 class PixelDict:
     """
     Class with methods needed during the ephemerides generation
     Interfaces directly with the ASSIST+Rebound simulation objects as well as healpix
+
+    Every object belongs to a picket level, i.e. a picket interval of the
+    ladder given by picket_interval_ladder. The objects of a level share the
+    same three picket times, which are refreshed together, and are indexed by
+    pixel together. With more than one level, objects move between levels
+    according to their angular rate, measured when their pickets are refreshed.
+
+    With a prune_horizon, the objects that cannot reach any scheduled field
+    within the horizon are deferred when the pickets of their level are
+    refreshed: they are neither integrated nor indexed until the horizon is over.
     """
 
     def __init__(
@@ -62,6 +256,16 @@ class PixelDict:
         nside=128,
         nested=True,
         n_sub_intervals=101,
+        lt_tol=1e-9,
+        picket_min=None,
+        picket_max=None,
+        max_picket_motion=2.0,
+        state_cache=None,
+        schedule=None,
+        fields=None,
+        field_radius=None,
+        prune_horizon=None,
+        prune_speed_factor=1.1,
     ):
         """
         Initialization function for the class. Computes the initial positions required for the ephemerides interpolation
@@ -87,39 +291,126 @@ class PixelDict:
             Defines the ordering scheme for the healpix ordering. True (default) means a NESTED ordering
         n_sub_intervals: int
             Number of sub-intervals for the Lagrange interpolation (default: 101)
+        lt_tol: float
+            Convergence tolerance (days) of the light travel time iterations (default: 1e-9)
+        picket_min : float
+            Shortest picket interval (days) of fast-moving objects. Defaults to picket_interval.
+        picket_max : float
+            Longest picket interval (days) of slow-moving objects. Defaults to picket_interval.
+        max_picket_motion : float
+            Largest angular motion (degrees) of an object over one picket interval,
+            used to choose its interval (default: 2.0)
+        state_cache : PicketStateCache
+            Object states at picket times shared with the PixelDicts of other
+            observatories (default: None, the states are not shared)
+        schedule : array of float
+            Times (JD TDB) of the pointings of the observatory. When given, the
+            pixels traversed by the objects are only indexed around these times,
+            so that gaps in the pointings cost nothing (default: None, every time
+            is indexed)
+        fields : array (N,3)
+            Unit vectors of the centres of the pointings, in the order of schedule.
+            Needed with a prune_horizon (default: None)
+        field_radius : float
+            Angular radius (degrees) of the pointings, buffer included, within which
+            the objects must be found. Needed with a prune_horizon (default: None)
+        prune_horizon : float
+            Time (days) for which the objects that cannot reach any of the fields are
+            deferred (default: None, the objects are never deferred)
+        prune_speed_factor : float
+            Factor applied to the perihelion speed of the two-body orbit of an object
+            to bound its speed over the horizon, as a margin for the perturbations
+            by the planets (default: 1.1)
         """
         self.nside = nside
         self.picket_interval = picket_interval
         self.n_sub_intervals = n_sub_intervals
+        self.lt_tol = lt_tol
         self.obsCode = obsCode
         self.nested = nested
         self.sim_dict = sim_dict
         self.ephem = ephem
+        self.picket_min = picket_min
+        self.picket_max = picket_max
+        self.max_picket_motion = max_picket_motion
+        self.state_cache = state_cache
+        self.schedule, self.fields = None, None
+        if schedule is not None:
+            schedule = np.asarray(schedule, dtype=np.float64)
+            order = np.argsort(schedule, kind="stable")
+            self.schedule = schedule[order]
+            if fields is not None:
+                self.fields = np.asarray(fields, dtype=np.float64)[order]
+        # number of pickets jumped over instead of computed, across gaps in the pointings
+        self.skipped_pickets = 0
+
+        self.field_radius = field_radius
+        self.prune_horizon = prune_horizon
+        self.prune_speed_factor = prune_speed_factor
+        if prune_horizon is not None and (self.fields is None or field_radius is None):
+            raise ValueError("Pruning the picket refreshes needs the schedule, fields and field_radius.")
+        # number of picket refreshes of single objects deferred away from the fields
+        self.deferred_refreshes = 0
+
+        # Objects are referred to by their position in sim_dict
+        self.desigs = np.array(list(sim_dict.keys()), dtype=object)
+        self.desig_indices = {desig: i for i, desig in enumerate(self.desigs)}
         self.observatory = observatory
 
-        # Set the three times and compute the observatory position
-        # at those times
-        # Using a quadratic isn't very general, but that can be
-        # improved later
+        # The last sky position of each object that was computed, from which it is
+        # bounded over the horizon together with the largest speed along its orbit,
+        # and the times over which the deferred objects are left out
+        n_objects = len(self.desigs)
+        self.known_time = np.zeros(n_objects)
+        self.known_rho_hat = np.zeros((n_objects, 3))
+        self.known_distance = np.zeros(n_objects)
+        self.known_max_speed = np.zeros(n_objects)
+        self.deferred = np.zeros(n_objects, dtype=bool)
+        self.deferred_from = np.zeros(n_objects)
+        self.deferred_until = np.zeros(n_objects)
 
-        self.t0 = jd_tdb
-        self.r_obs_0 = self.get_observatory_position(self.t0)
+        self.initialize_pickets(jd_tdb)
+        self.compute_pixel_traversed()
+        self.adapt_picket_intervals(range(len(self.intervals)))
 
-        self.tp = self.t0 + picket_interval
-        self.r_obs_p = self.get_observatory_position(self.tp)
+    def initialize_pickets(self, jd_tdb):
+        """
+        Sets up the picket levels and computes the first pickets of all the objects
 
-        self.tm = self.t0 - picket_interval
-        self.r_obs_m = self.get_observatory_position(self.tm)
+        Parameters
+        ----------
+        jd_tdb: float
+            Reference time for the initialization
+        """
+        # All the objects start at the level of the base picket interval, and the
+        # pickets of every level are centred on the reference time.
+        # Using a quadratic isn't very general, but that can be
+        # improved later
+        self.intervals = picket_interval_ladder(self.picket_interval, self.picket_min, self.picket_max)
+        base_level = int(np.argmin(np.abs(self.intervals - self.picket_interval)))
+        self.level = np.full(len(self.desigs), base_level)
+        self.level_t0 = np.full(len(self.intervals), float(jd_tdb))
 
-        # Initialize the dictionary of positions
+        # Initialize the (N,3) arrays of unit vectors at the three pickets
+        self.rho_hat_m = np.empty((len(self.desigs), 3))
+        self.rho_hat_0 = np.empty((len(self.desigs), 3))
+        self.rho_hat_p = np.empty((len(self.desigs), 3))
+        self.compute_pickets(np.arange(len(self.desigs)), base_level)
 
-        self.pixel_dict = defaultdict(list)
+    @property
+    def t0(self):
+        """Central picket time of the object at each level"""
+        return self.level_t0
 
-        self.rho_hat_m_dict = self.get_all_object_unit_vectors(self.r_obs_m, self.tm)
-        self.rho_hat_0_dict = self.get_all_object_unit_vectors(self.r_obs_0, self.t0)
-        self.rho_hat_p_dict = self.get_all_object_unit_vectors(self.r_obs_p, self.tp)
+    @property
+    def tm(self):
+        """First picket time at each level"""
+        return self.level_t0 - self.intervals
 
-        self.compute_pixel_traversed()
+    @property
+    def tp(self):
+        """Last picket time at each level"""
+        return self.level_t0 + self.intervals
 
     def get_observatory_position(self, t):
         """
@@ -135,8 +426,8 @@ class PixelDict:
                 Barycentric position of the observatory (x,y,z)
         """
         et = (t - spice.j2000()) * 24 * 60 * 60
-        r_obs = self.observatory.barycentricObservatory(et, self.obsCode) / AU_KM
-        return r_obs
+        r_obs, _ = self.observatory.barycentricObservatoryStates(et, self.obsCode)
+        return r_obs[0] / AU_KM
 
     def get_object_unit_vectors(self, desigs, r_obs, t, lt0=0.01):
         """
@@ -155,21 +446,47 @@ class PixelDict:
             Initial guess (in days) for light-time correction (default: 0.01 days)
         Returns
         -------
-        rho_hat_dict: dict
-            Dictionary of unit vectors
+        rho_hat: array (N,3)
+            Unit vectors, in the order of desigs
         """
-        rho_hat_dict = {}
-        for k in desigs:
-            v = self.sim_dict[k]
-            sim, ex = v["sim"], v["ex"]
-
-            # Get the topocentric unit vectors
-            rho, rho_mag, lt, r_ast, v_ast = integrate_light_time(
-                sim, ex, t - self.ephem.jd_ref, r_obs, lt0=lt0
+        # Get the topocentric unit vectors
+        desigs = np.asarray(desigs, dtype=object)
+        obj_indices = np.array([self.desig_indices[desig] for desig in desigs], dtype=np.int64)
+        if self.state_cache is None:
+            rho, rho_mag, lt, r_ast, v_ast = integrate_light_time_objects(
+                self.sim_dict, desigs, t - self.ephem.jd_ref, r_obs, lt0=lt0, lt_tol=self.lt_tol
             )
-            rho_hat = rho / rho_mag
-            rho_hat_dict[k] = rho_hat
-        return rho_hat_dict
+        else:
+            # Objects already integrated to this time for another observatory only
+            # have their light travel time corrected for this one
+            found, r_ast, v_ast, lt = self.state_cache.lookup(t, obj_indices)
+
+            rho, rho_mag = np.empty((len(desigs), 3)), np.empty(len(desigs))
+            if np.any(found):
+                rho[found], rho_mag[found], _ = extrapolate_light_time(
+                    r_ast[found], v_ast[found], lt[found], r_obs, lt_tol=self.lt_tol
+                )
+            if not np.all(found):
+                missing = ~found
+                rho[missing], rho_mag[missing], lt[missing], r_ast[missing], v_ast[missing] = (
+                    integrate_light_time_objects(
+                        self.sim_dict,
+                        desigs[missing],
+                        t - self.ephem.jd_ref,
+                        r_obs,
+                        lt0=lt0,
+                        lt_tol=self.lt_tol,
+                    )
+                )
+                self.state_cache.store(t, obj_indices[missing], r_ast[missing], v_ast[missing], lt[missing])
+
+        rho_hat = rho / rho_mag[:, np.newaxis]
+        if self.prune_horizon is not None:
+            self.known_time[obj_indices] = t
+            self.known_rho_hat[obj_indices] = rho_hat
+            self.known_distance[obj_indices] = rho_mag
+            self.known_max_speed[obj_indices] = max_orbital_speed(r_ast, v_ast)
+        return rho_hat
 
     def get_all_object_unit_vectors(self, r_obs, t, lt0=0.01):
         """
@@ -186,12 +503,11 @@ class PixelDict:
             Initial guess (in days) for light-time correction (default: 0.01 days)
         Returns
         -------
-        rho_hat_dict: dict
-            Dictionary of unit vectors
+        rho_hat: array (N,3)
+            Unit vectors, in the order of sim_dict
         """
 
-        desigs = self.sim_dict.keys()
-        return self.get_object_unit_vectors(desigs, r_obs, t, lt0=lt0)
+        return self.get_object_unit_vectors(self.desigs, r_obs, t, lt0=lt0)
 
     def get_interp_factors(self, tm, t0, tp, n_sub_intervals):
         """
@@ -223,69 +539,269 @@ class PixelDict:
         Lp = Lp[:, np.newaxis]
         return Lm, L0, Lp
 
-    def interpolate_unit_vectors(self, desigs, jd_tdb):
+    def compute_pickets(self, obj_indices, level):
         """
-        Interpolates the unit vectors for a list of designations towards the new target time
+        Computes the unit vectors of a set of objects at the three picket times of a level
 
         Parameters
         ----------
-        desigs: list
-            List of designations (consistent with the simulation dictionary)
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        level: int
+            The picket level
+        """
+        for t, rho_hat in zip(
+            (self.tm[level], self.t0[level], self.tp[level]), (self.rho_hat_m, self.rho_hat_0, self.rho_hat_p)
+        ):
+            r_obs = self.get_observatory_position(t)
+            rho_hat[obj_indices] = self.get_object_unit_vectors(self.desigs[obj_indices], r_obs, t)
+
+    def interpolate_unit_vectors(self, obj_indices, jd_tdb):
+        """
+        Interpolates the unit vectors for a set of objects towards the new target time
+
+        Parameters
+        ----------
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
         jd_tdb: float
             Target time
         Returns
         -------
-        unit_vector_dict: dict
-            Dictionary of unit vectors
+        unit_vectors: array (N,3)
+            Unit vectors, in the order of obj_indices
         """
         # Update the table of unit vectors if needed.
         # Should not normally need to, if this routine is being
         # called properly
         self.update_pickets(jd_tdb)
 
-        Lm, L0, Lp = lagrange3(self.tm, self.t0, self.tp, jd_tdb)
+        level = self.level[obj_indices]
+        Lm, L0, Lp = lagrange3(self.tm[level], self.t0[level], self.tp[level], jd_tdb)
 
-        unit_vector_dict = {}
+        return (
+            self.rho_hat_m[obj_indices] * Lm[:, np.newaxis]
+            + self.rho_hat_0[obj_indices] * L0[:, np.newaxis]
+            + self.rho_hat_p[obj_indices] * Lp[:, np.newaxis]
+        )
 
-        for k in desigs:
-            rho_hat_m = self.rho_hat_m_dict[k]
-            rho_hat_0 = self.rho_hat_0_dict[k]
-            rho_hat_p = self.rho_hat_p_dict[k]
+    def get_traversal_times(self, level):
+        """
+        Computes the n_sub_intervals times, between tm and tp, at which the pixels
+        traversed by the objects of a level are found
 
-            # Interpolate the unit vectors over a finer sampled set of times
-            vec = rho_hat_m * Lm + rho_hat_0 * L0 + rho_hat_p * Lp
+        Parameters
+        ----------
+        level: int
+            The picket level
+        Returns
+        -------
+        : array
+            The times (JD TDB), matching the rows of get_traversal_basis
+        """
+        return np.linspace(self.tm[level], self.tp[level], self.n_sub_intervals)
 
-            unit_vector_dict[k] = vec
+    def get_traversal_basis(self, level):
+        """
+        Computes the interpolation factors of a level at the n_sub_intervals times,
+        between tm and tp, used to find the pixels traversed by its objects
 
-        return unit_vector_dict
+        Parameters
+        ----------
+        level: int
+            The picket level
+        Returns
+        -------
+        : 2D array
+            Array of shape (n_sub_intervals, 3) of the Lagrange coefficients at tm, t0 and tp
+        """
+        Lm, L0, Lp = self.get_interp_factors(
+            self.tm[level], self.t0[level], self.tp[level], self.n_sub_intervals
+        )
+        return np.hstack([Lm, L0, Lp])
 
-    def compute_pixel_traversed(self):
+    def get_coefficients(self, obj_indices):
+        """
+        Gathers the interpolation coefficients of a set of objects, matching the columns
+        of get_traversal_basis
+
+        Parameters
+        ----------
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        Returns
+        -------
+        : 3D array
+            Array of shape (N, 3, 3) of the unit vectors at tm, t0 and tp
+        """
+        return np.stack(
+            [self.rho_hat_m[obj_indices], self.rho_hat_0[obj_indices], self.rho_hat_p[obj_indices]], axis=1
+        )
+
+    def get_scheduled_samples(self, times):
+        """
+        Selects the traversal times needed to find the objects seen by the scheduled
+        pointings, i.e. those with a pointing between them and one of their neighbours
+
+        Parameters
+        ----------
+        times: array
+            Increasing traversal times (JD TDB)
+        Returns
+        -------
+        : array of bool
+            Whether each time is needed. All are when there is no schedule.
+        """
+        if self.schedule is None:
+            return np.ones(len(times), dtype=bool)
+
+        before = np.concatenate([times[:1], times[:-1]])
+        after = np.concatenate([times[1:], times[-1:]])
+        first = np.searchsorted(self.schedule, before, side="left")
+        last = np.searchsorted(self.schedule, after, side="right")
+        return last > first
+
+    def can_reach_fields(self, obj_indices, t_start, t_end):
+        """
+        Checks which objects might come within field_radius of a scheduled field
+        between two times, from their last known sky positions. The positions are
+        bounded by caps grown with the largest speeds of the object along its orbit
+        and of the observatory over the time since the sky position was computed.
+
+        Parameters
+        ----------
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        t_start: float
+            Start of the time span (JD TDB)
+        t_end: float
+            End of the time span (JD TDB)
+        Returns
+        -------
+        : array of bool
+            Whether each object might be in one of the fields
+        """
+        first = np.searchsorted(self.schedule, t_start, side="left")
+        last = np.searchsorted(self.schedule, t_end, side="right")
+        if first == last or len(obj_indices) == 0:
+            return np.zeros(len(obj_indices), dtype=bool)
+
+        # the object moves by at most displacement relative to the observatory,
+        # so that its direction turns by at most arcsin(displacement / distance)
+        known_time = self.known_time[obj_indices]
+        elapsed = np.maximum(np.abs(t_start - known_time), np.abs(t_end - known_time))
+        speed = self.prune_speed_factor * self.known_max_speed[obj_indices] + MAX_OBSERVER_SPEED
+        ratio = speed * elapsed / self.known_distance[obj_indices]
+        cap = np.where(ratio < 1, np.arcsin(np.minimum(ratio, 1)), np.pi)
+
+        angle = np.minimum(cap + np.radians(self.field_radius), np.pi)
+        tree = cKDTree(self.fields[first:last])
+        counts = tree.query_ball_point(
+            self.known_rho_hat[obj_indices], 2 * np.sin(0.5 * angle), return_length=True
+        )
+        return counts > 0
+
+    def select_members(self, level, jd_tdb):
+        """
+        Finds the objects of a level whose pickets are refreshed for a target time.
+        With a prune_horizon, the objects that cannot reach any field before the
+        horizon is over are deferred instead, and those whose deferral is over are
+        brought back.
+
+        Parameters
+        ----------
+        level: int
+            The picket level, with its pickets about to be refreshed
+        jd_tdb: float
+            Target time
+        Returns
+        -------
+        members: array of int
+            Objects refreshed from their previous pickets
+        resumed: array of int
+            Objects coming back from a deferral, whose pickets all need computing
+        """
+        members = np.flatnonzero(self.level == level)
+        if self.prune_horizon is None:
+            return members, np.empty(0, dtype=np.int64)
+
+        deferred = self.deferred[members]
+        expired = (jd_tdb >= self.deferred_until[members]) | (jd_tdb < self.deferred_from[members])
+        candidates = members[~deferred | expired]
+
+        # the pickets set now serve the times within an interval of the target time,
+        # up to the last refresh before the deferral is over
+        interval = self.intervals[level]
+        reach = self.can_reach_fields(candidates, jd_tdb - interval, jd_tdb + self.prune_horizon + interval)
+
+        defer = candidates[~reach]
+        self.deferred[defer] = True
+        self.deferred_from[defer] = jd_tdb
+        self.deferred_until[defer] = jd_tdb + self.prune_horizon
+        self.deferred_refreshes += len(defer)
+
+        active = candidates[reach]
+        resumed = active[self.deferred[active]]
+        self.deferred[resumed] = False
+        return active[~np.isin(active, resumed)], resumed
+
+    def compute_pixel_traversed(self, levels=None, block_samples=2_000_000):
         """
         Computes the healpix pixels traversed by all the objects during between times tm and tp
+
+        Parameters
+        ----------
+        levels: list of int
+            Picket levels whose objects are indexed. Defaults to all the levels.
+        block_samples: int
+            Largest number of interpolated unit vectors held in memory at once.
+            The objects are processed in blocks of block_samples // n_sub_intervals
+            objects (default: 2,000,000 samples, about 50 MB of vectors)
         """
-        # These don't need to be recomputed, if the interval stays the same
-        Lm, L0, Lp = self.get_interp_factors(self.tm, self.t0, self.tp, self.n_sub_intervals)
+        if levels is None:
+            self.pixel_index = [None] * len(self.intervals)
+            levels = range(len(self.intervals))
+
+        for level in levels:
+            # These don't need to be recomputed, if the interval stays the same
+            L = self.get_traversal_basis(level)
+            # Times away from the scheduled pointings are not indexed
+            L = L[self.get_scheduled_samples(self.get_traversal_times(level))]
 
-        self.pixel_dict = defaultdict(list)
+            # deferred objects are left out of the index
+            members = (
+                np.flatnonzero((self.level == level) & ~self.deferred)
+                if len(L)
+                else np.empty(0, dtype=np.int64)
+            )
+            block_size = max(1, block_samples // self.n_sub_intervals)
 
-        for k, v in self.sim_dict.items():
-            rho_hat_m = self.rho_hat_m_dict[k]
-            rho_hat_0 = self.rho_hat_0_dict[k]
-            rho_hat_p = self.rho_hat_p_dict[k]
+            pixel_list, object_list = [], []
+            for block_start in range(0, len(members), block_size):
+                block = members[block_start : block_start + block_size]
 
-            # Interpolate the unit vectors over a finer sampled set of times
-            vec = rho_hat_m * Lm + rho_hat_0 * L0 + rho_hat_p * Lp
+                # Interpolate the unit vectors of the block over a finer sampled set of times,
+                # giving an array of shape (objects, n_sub_intervals, 3)
+                vec = L @ self.get_coefficients(block)
 
-            # Find the healpix locations
-            pixels = hp.vec2pix(self.nside, vec[:, 0], vec[:, 1], vec[:, 2], nest=self.nested)
-            pixels = list(set(pixels))
+                # Find the healpix locations, and keep each object's distinct pixels
+                pixels = hp.vec2pix(self.nside, vec[..., 0], vec[..., 1], vec[..., 2], nest=self.nested)
+                pixels.sort(axis=1)
+                distinct = np.ones(pixels.shape, dtype=bool)
+                distinct[:, 1:] = pixels[:, 1:] != pixels[:, :-1]
+                objects = np.broadcast_to(block[:, np.newaxis], pixels.shape)
 
-            # Add the neighboring pixels
-            pixels = set(hp.get_all_neighbours(self.nside, pixels, nest=self.nested).flatten())
+                # Add the neighboring pixels
+                neighbours = hp.get_all_neighbours(self.nside, pixels[distinct], nest=self.nested)
 
-            # Add the pixels that the object traverse, and the neighbors, to the pixel_dict
-            for pix in pixels:
-                self.pixel_dict[pix].append(k)
+                pixel_list.append(neighbours.ravel())
+                object_list.append(np.tile(objects[distinct], neighbours.shape[0]))
+
+            # Index the objects by the neighbors of the pixels they traverse
+            self.pixel_index[level] = build_pixel_index(
+                np.concatenate(pixel_list or [np.empty(0, dtype=np.int64)]),
+                np.concatenate(object_list or [np.empty(0, dtype=np.int64)]),
+            )
 
     def update_pickets(self, jd_tdb):
         """
@@ -296,59 +812,144 @@ class PixelDict:
         jd_tdb: float
             Target time
         """
-        if abs(jd_tdb - self.t0) > 0.5 * self.picket_interval:
-            # Need to update
-            if abs(jd_tdb - self.t0) <= 1.5 * self.picket_interval:
-                # Can compute just one new set and shift the others
+        updated = []
+        for level, interval in enumerate(self.intervals):
+            t0 = self.level_t0[level]
+            if abs(jd_tdb - t0) <= 0.5 * interval:
+                continue
 
-                if jd_tdb <= self.tm:
+            members, resumed = self.select_members(level, jd_tdb)
+            if abs(jd_tdb - t0) <= 1.5 * interval:
+                # Can compute just one new set and shift the others
+                if jd_tdb <= t0 - interval:
                     # shift earlier
-                    self.tp = self.t0
-                    self.r_obs_p = self.r_obs_0
-                    self.rho_hat_p_dict = self.rho_hat_0_dict
-
-                    self.t0 = self.tm
-                    self.r_obs_0 = self.r_obs_m
-                    self.rho_hat_0_dict = self.rho_hat_m_dict
-
-                    self.tm = self.t0 - self.picket_interval
-                    self.r_obs_m = self.get_observatory_position(self.tm)
-                    self.rho_hat_m_dict = self.get_all_object_unit_vectors(self.r_obs_m, self.tm)
-
+                    self.rho_hat_p[members] = self.rho_hat_0[members]
+                    self.rho_hat_0[members] = self.rho_hat_m[members]
+                    self.level_t0[level] = t0 - interval
+                    new_t, new_rho_hat = self.tm[level], self.rho_hat_m
                 else:
                     # shift later
-                    self.tm = self.t0
-                    self.r_obs_m = self.r_obs_0
-                    self.rho_hat_m_dict = self.rho_hat_0_dict
+                    self.rho_hat_m[members] = self.rho_hat_0[members]
+                    self.rho_hat_0[members] = self.rho_hat_p[members]
+                    self.level_t0[level] = t0 + interval
+                    new_t, new_rho_hat = self.tp[level], self.rho_hat_p
+
+                if len(members):
+                    r_obs = self.get_observatory_position(new_t)
+                    new_rho_hat[members] = self.get_object_unit_vectors(self.desigs[members], r_obs, new_t)
 
-                    self.t0 = self.tp
-                    self.r_obs_0 = self.r_obs_p
-                    self.rho_hat_0_dict = self.rho_hat_p_dict
+            elif abs(jd_tdb - t0) <= 2.5 * interval:
+                # The last picket before the jump is the first one after it
+                if jd_tdb < t0:
+                    self.rho_hat_p[members] = self.rho_hat_m[members]
+                    self.level_t0[level] = t0 - 2 * interval
+                    new_pickets = ((self.tm[level], self.rho_hat_m), (self.t0[level], self.rho_hat_0))
+                else:
+                    self.rho_hat_m[members] = self.rho_hat_p[members]
+                    self.level_t0[level] = t0 + 2 * interval
+                    new_pickets = ((self.t0[level], self.rho_hat_0), (self.tp[level], self.rho_hat_p))
 
-                    self.tp = self.t0 + self.picket_interval
-                    self.r_obs_p = self.get_observatory_position(self.tp)
-                    self.rho_hat_p_dict = self.get_all_object_unit_vectors(self.r_obs_p, self.tp)
+                if len(members):
+                    for new_t, new_rho_hat in new_pickets:
+                        r_obs = self.get_observatory_position(new_t)
+                        new_rho_hat[members] = self.get_object_unit_vectors(
+                            self.desigs[members], r_obs, new_t
+                        )
 
             else:
-                # Need to compute three new sets
-                n = round((jd_tdb - self.t0) / self.picket_interval)
+                # Need to compute three new sets, jumping over the pickets in between
+                n = round((jd_tdb - t0) / interval)
+                self.level_t0[level] = t0 + n * interval
+                if len(members):
+                    self.compute_pickets(members, level)
+                    self.skipped_pickets += abs(n) - 3
 
-                # This is repeated code
-                self.t0 += n * self.picket_interval
-                self.r_obs_0 = self.get_observatory_position(self.t0)
-                self.rho_hat_0_dict = self.get_all_object_unit_vectors(self.r_obs_0, self.t0)
+            if len(resumed):
+                self.compute_pickets(resumed, level)
+            updated.append(level)
 
-                self.tp = self.t0 + self.picket_interval
-                self.r_obs_p = self.get_observatory_position(self.tp)
-                self.rho_hat_p_dict = self.get_all_object_unit_vectors(self.r_obs_p, self.tp)
+        if updated:
+            self.compute_pixel_traversed(updated)
+            self.adapt_picket_intervals(updated)
 
-                self.tm = self.t0 - self.picket_interval
-                self.r_obs_m = self.get_observatory_position(self.tm)
-                self.rho_hat_m_dict = self.get_all_object_unit_vectors(self.r_obs_m, self.tm)
+    def adapt_picket_intervals(self, levels):
+        """
+        Moves the objects of the given levels to the longest picket interval over
+        which their angular motion stays below max_picket_motion, computing their
+        pickets at the times of their new level.
 
-            self.compute_pixel_traversed()
-        else:
-            pass
+        Parameters
+        ----------
+        levels: list of int
+            Picket levels whose objects are checked. Their pickets must be up to date.
+        """
+        if len(self.intervals) == 1:
+            return
+
+        members = np.flatnonzero(np.isin(self.level, levels) & ~self.deferred)
+        level = self.level[members]
+
+        # angular rate (deg/day) between the first and last pickets
+        cos_angle = np.clip(np.sum(self.rho_hat_m[members] * self.rho_hat_p[members], axis=1), -1.0, 1.0)
+        rate = np.degrees(np.arccos(cos_angle)) / (2 * self.intervals[level])
+
+        allowed = rate[:, np.newaxis] * self.intervals <= self.max_picket_motion
+        new_level = np.maximum(np.sum(allowed, axis=1) - 1, 0)
+
+        moved = new_level != level
+        if not np.any(moved):
+            return
+
+        movers, new_level = members[moved], new_level[moved]
+        changed = set(level[moved]) | set(new_level)
+        self.level[movers] = new_level
+        for target in np.unique(new_level):
+            self.compute_pickets(movers[new_level == target], target)
+
+        self.compute_pixel_traversed(sorted(changed))
+
+    def get_object_indices(self, jd_tdb, ra, dec, ang_fov, pixels=None):
+        """
+        Get the indices of the objects that are within an angular radius of a topocentric unit
+        vector at a given time.
+
+        Parameters
+        ----------
+        jd_tdb: float
+            Target time
+        ra: float
+            right ascension (degrees)
+        dec: float
+            declination (degrees)
+        ang_fov: float
+            Field of view radius
+        pixels: array of int
+            Healpix pixels of the field, precomputed with get_hp_discs at the nside of
+            the PixelDict. By default they are queried from ra, dec and ang_fov.
+        Returns
+        -------
+        obj_indices : array of int
+            Sorted indices of the objects (their position in the simulation dictionary)
+        """
+        # Update the table of unit vectors if needed.
+        self.update_pickets(jd_tdb)
+
+        if pixels is None:
+            pixels = get_hp_neighbors(ra, dec, ang_fov, nside=self.nside, nested=self.nested)
+
+        # Look the pixels up in the index of each level, and gather the objects of those present
+        gathered = []
+        for index_pixels, offsets, objects in self.pixel_index:
+            pos = np.searchsorted(index_pixels, pixels)
+            found = pos < len(index_pixels)
+            found[found] = index_pixels[pos[found]] == pixels[found]
+            pos = pos[found]
+            starts, ends = offsets[pos], offsets[pos + 1]
+            lengths = ends - starts
+            gather = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            gathered.append(objects[gather])
+
+        return np.unique(np.concatenate(gathered))
 
     def get_designations(self, jd_tdb, ra, dec, ang_fov):
         """
@@ -367,16 +968,288 @@ class PixelDict:
             Field of view radius
         Returns
         -------
-        desigs : list
-            List of designations
+        desigs : array
+            Array of designations, in the order of the simulation dictionary
+        """
+        return self.desigs[self.get_object_indices(jd_tdb, ra, dec, ang_fov)]
+
+
+class ChebyshevPixelDict(PixelDict):
+    """
+    PixelDict that interpolates the topocentric unit vector of each object with a
+    Chebyshev polynomial fitted over a time window, instead of the quadratic
+    through three pickets.
+
+    The windows of the levels halve from the longest one, and each object uses
+    the longest window over which the estimated interpolation error stays below
+    a tolerance. Windows are aligned on the reference time, so that a window of a
+    level always lies within a single window of the levels above.
+    """
+
+    def __init__(
+        self,
+        jd_tdb,
+        sim_dict,
+        ephem,
+        obsCode,
+        observatory,
+        order=8,
+        window=16.0,
+        tolerance=1e-3,
+        max_halvings=8,
+        **kwargs,
+    ):
+        """
+        Initialization function for the class. Fits the initial polynomials of all the objects
+
+        Parameters
+        ----------
+        jd_tdb: float
+            Reference time for the initialization
+        sim_dict: dictionary
+            dictionary of ASSIST simulation objects
+        ephem: Ephem
+            ASSIST Ephem object
+        obsCode: str
+            MPC Observatory code
+        observatories: Observatory
+            Observatory object
+        order: int
+            Order of the Chebyshev polynomials (default: 8)
+        window: float
+            Longest window (days) a polynomial is fitted over (default: 16.0)
+        tolerance: float
+            Largest estimated interpolation error (degrees) of an object before its
+            window is halved (default: 1e-3)
+        max_halvings: int
+            Number of times the longest window can be halved (default: 8)
+        **kwargs:
+            Other keyword arguments of PixelDict (nside, nested, n_sub_intervals, lt_tol)
+        """
+        self.order = order
+        self.window = window
+        self.tolerance = tolerance
+        self.max_halvings = max_halvings
+        super().__init__(jd_tdb, sim_dict, ephem, obsCode, observatory, **kwargs)
+
+    def initialize_pickets(self, jd_tdb):
+        """
+        Sets up the window levels and fits the first polynomials of all the objects,
+        over the longest window
+
+        Parameters
+        ----------
+        jd_tdb: float
+            Reference time for the initialization
+        """
+        self.t_ref = float(jd_tdb)
+        self.intervals = self.window * 2.0 ** np.arange(-self.max_halvings, 1)
+        self.level_start = np.array([self.get_window_start(jd_tdb, window) for window in self.intervals])
+
+        top_level = len(self.intervals) - 1
+        self.level = np.full(len(self.desigs), top_level)
+        self.coeffs = np.empty((len(self.desigs), self.order + 1, 3))
+        self.compute_pickets(np.arange(len(self.desigs)), top_level)
+
+    def get_window_start(self, jd_tdb, window):
+        """
+        Computes the start of the window of a given length that contains a time
+
+        Parameters
+        ----------
+        jd_tdb: float
+            Target time
+        window: float
+            Window length (days)
+        Returns
+        -------
+        : float
+            Start of the window
+        """
+        start = self.t_ref + np.floor((jd_tdb - self.t_ref) / window) * window
+        return start - window if start > jd_tdb else start
+
+    def compute_pickets(self, obj_indices, level):
+        """
+        Fits the Chebyshev polynomials of a set of objects over the current window of a level,
+        from their unit vectors at the Chebyshev nodes of the window
+
+        Parameters
+        ----------
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        level: int
+            The window level
+        """
+        n_nodes = self.order + 1
+        x = np.cos(np.pi * (np.arange(n_nodes)[::-1] + 0.5) / n_nodes)
+        times = self.level_start[level] + 0.5 * self.intervals[level] * (x + 1)
+
+        samples = np.empty((n_nodes, len(obj_indices), 3))
+        for j, t in enumerate(times):
+            r_obs = self.get_observatory_position(t)
+            samples[j] = self.get_object_unit_vectors(self.desigs[obj_indices], r_obs, t)
+
+        # discrete orthogonality of the Chebyshev polynomials over their nodes
+        coeffs = (
+            2.0
+            / n_nodes
+            * np.einsum("jk,jni->nki", np.polynomial.chebyshev.chebvander(x, self.order), samples)
+        )
+        coeffs[:, 0] *= 0.5
+        self.coeffs[obj_indices] = coeffs
+
+    def get_error_estimate(self, obj_indices):
+        """
+        Estimates the interpolation error of a set of objects from the size of the
+        highest-order terms of their polynomials
+
+        Parameters
+        ----------
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        Returns
+        -------
+        : array
+            Estimated errors (degrees)
+        """
+        tail = np.linalg.norm(self.coeffs[obj_indices, -2:], axis=-1).sum(axis=-1)
+        return np.degrees(tail)
+
+    def interpolate_unit_vectors(self, obj_indices, jd_tdb):
+        """
+        Evaluates the unit vectors for a set of objects at the new target time
+
+        Parameters
+        ----------
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        jd_tdb: float
+            Target time
+        Returns
+        -------
+        unit_vectors: array (N,3)
+            Unit vectors, in the order of obj_indices
         """
-        # Update the table of unit vectors if needed.
         self.update_pickets(jd_tdb)
 
-        pixels = get_hp_neighbors(ra, dec, ang_fov, nside=self.nside, nested=self.nested)
+        level = self.level[obj_indices]
+        x = 2 * (jd_tdb - self.level_start[level]) / self.intervals[level] - 1
+        T = np.polynomial.chebyshev.chebvander(x, self.order)
+        return np.einsum("nk,nki->ni", T, self.coeffs[obj_indices])
+
+    def get_traversal_times(self, level):
+        """
+        Computes the n_sub_intervals times spanning the window of a level at which
+        the pixels traversed by its objects are found
+
+        Parameters
+        ----------
+        level: int
+            The window level
+        Returns
+        -------
+        : array
+            The times (JD TDB), matching the rows of get_traversal_basis
+        """
+        return self.level_start[level] + 0.5 * self.intervals[level] * (
+            np.linspace(-1, 1, self.n_sub_intervals) + 1
+        )
+
+    def get_traversal_basis(self, level):
+        """
+        Computes the Chebyshev polynomials at the n_sub_intervals times spanning the
+        window of a level, used to find the pixels traversed by its objects
+
+        Parameters
+        ----------
+        level: int
+            The window level
+        Returns
+        -------
+        : 2D array
+            Array of shape (n_sub_intervals, order + 1)
+        """
+        return np.polynomial.chebyshev.chebvander(np.linspace(-1, 1, self.n_sub_intervals), self.order)
+
+    def get_coefficients(self, obj_indices):
+        """
+        Gathers the Chebyshev coefficients of a set of objects
+
+        Parameters
+        ----------
+        obj_indices: array of int
+            Indices of the objects (their position in the simulation dictionary)
+        Returns
+        -------
+        : 3D array
+            Array of shape (N, order + 1, 3)
+        """
+        return self.coeffs[obj_indices]
+
+    def update_pickets(self, jd_tdb):
+        """
+        Refits the polynomials of the levels whose window does not contain the target time
+
+        Parameters
+        ----------
+        jd_tdb: float
+            Target time
+        """
+        updated = []
+        for level, window in enumerate(self.intervals):
+            start = self.level_start[level]
+            if start <= jd_tdb < start + window:
+                continue
+
+            self.level_start[level] = self.get_window_start(jd_tdb, window)
+            members, resumed = self.select_members(level, jd_tdb)
+            if len(members):
+                self.compute_pickets(members, level)
+                # the windows in between are jumped over
+                self.skipped_pickets += max(round(abs(self.level_start[level] - start) / window) - 1, 0)
+            if len(resumed):
+                self.compute_pickets(resumed, level)
+            updated.append(level)
+
+        if updated:
+            self.compute_pixel_traversed(updated)
+            self.adapt_picket_intervals(updated)
+
+    def adapt_picket_intervals(self, levels):
+        """
+        Moves the objects of the given levels to a longer window when the error
+        predicted for it is well within the tolerance, and to shorter windows for
+        as long as their estimated error is above the tolerance.
+
+        Parameters
+        ----------
+        levels: list of int
+            Window levels whose objects are checked. Their polynomials must be up to date.
+        """
+        members = np.flatnonzero(np.isin(self.level, levels) & ~self.deferred)
+        top_level = len(self.intervals) - 1
+        changed = set()
+
+        def move(obj_indices, step):
+            changed.update(self.level[obj_indices])
+            self.level[obj_indices] += step
+            changed.update(self.level[obj_indices])
+            for level in np.unique(self.level[obj_indices]):
+                self.compute_pickets(obj_indices[self.level[obj_indices] == level], level)
+
+        # the error of a smooth function scales as the window to the power order + 1
+        predicted = self.get_error_estimate(members) * 2.0 ** (self.order + 1)
+        grow = members[(predicted < 0.5 * self.tolerance) & (self.level[members] < top_level)]
+        if len(grow):
+            move(grow, 1)
 
-        desigs = set()
-        for pix in pixels:
-            desigs.update(self.pixel_dict[pix])
+        candidates = members
+        while len(candidates):
+            error = self.get_error_estimate(candidates)
+            candidates = candidates[(error > self.tolerance) & (self.level[candidates] > 0)]
+            if len(candidates):
+                move(candidates, -1)
 
-        return desigs
+        if changed:
+            self.compute_pixel_traversed(sorted(changed))
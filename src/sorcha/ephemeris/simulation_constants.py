@@ -5,6 +5,41 @@ AU_M = 149597870700
 AU_KM = AU_M / 1000.0
 SPEED_OF_LIGHT = 2.99792458e5 * 86400.0 / AU_KM
 OBLIQUITY_ECLIPTIC = 84381.448 * (1.0 / 3600) * np.pi / 180.0
+EARTH_ROTATION_RATE = 7.292115855e-5  # rad/s, from the rate of the Earth rotation angle
+# au/day, bounds the barycentric speed of a ground-based observatory: the orbital speed of the
+# Earth at perihelion, its motion about the Earth-Moon barycentre and the rotation of its surface
+MAX_OBSERVER_SPEED = 0.0178
+# au, bounds the distance of a ground-based observatory from the Solar System barycentre
+MAX_OBSERVER_DISTANCE = 1.03
+
+# GM (au^3/day^2) of the bodies of the ASSIST ephemeris, from DE440, and bounds on their distance (au)
+# from the Solar System barycentre: the Sun, Mercury, Venus, the Earth and the Moon, Mars, Jupiter,
+# Saturn, Uranus, Neptune and the massive asteroids of the small body ephemeris, taken together
+PERTURBER_GM = np.array(
+    [
+        2.9591220828e-4,
+        4.9125e-11,
+        7.2435e-10,
+        8.9970e-10,
+        9.5496e-11,
+        2.8254e-7,
+        8.4597e-8,
+        1.2920e-8,
+        1.5244e-8,
+        2.8e-13,
+    ]
+)
+PERTURBER_DISTANCE = np.array([0.0102, 0.478, 0.739, 1.03, 1.677, 5.47, 10.13, 20.11, 30.34, 4.0])
+# Pluto, whose orbit crosses the Kuiper belt, is kept apart from the other bodies
+PLUTO_GM = 2.1751e-12
+PLUTO_DISTANCE = 49.32
+
+# time scale constants (seconds, radians), from the DELTET variables of the NAIF leapseconds kernel
+MJD_J2000 = 51544.5
+TT_MINUS_TAI = 32.184
+TDB_MINUS_TT_K = 1.657e-3
+TDB_MINUS_TT_EB = 1.671e-2
+TDB_MINUS_TT_M = (6.239996, 1.99096871e-7)
 
 
 def create_ecl_to_eq_rotation_matrix(ecl):
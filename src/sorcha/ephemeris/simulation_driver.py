@@ -1,27 +1,43 @@
+import os
 from dataclasses import dataclass
-from collections import defaultdict
-from csv import writer
-from io import StringIO
+from collections import Counter, defaultdict
 
 import numpy as np
 import pandas as pd
 import spiceypy as spice
+from scipy.spatial import cKDTree
 
+from sorcha.ephemeris.kepler_propagation import KeplerSimulation
 from sorcha.ephemeris.simulation_setup import (
-    create_assist_ephemeris,
-    furnish_spiceypy,
+    EphemerisContext,
     generate_simulations,
 )
 from sorcha.ephemeris.simulation_constants import *
 from sorcha.ephemeris.simulation_geometry import *
 from sorcha.ephemeris.simulation_parsing import *
-from sorcha.ephemeris.pixel_dict import PixelDict
+from sorcha.ephemeris.pixel_dict import PixelDict, ChebyshevPixelDict, PicketStateCache, lagrange3
 from sorcha.modules.PPOutput import PPOutWriteCSV, PPOutWriteHDF5
 
+# with ar_sweep set to auto, the objects are followed through the survey when
+# there are more than this many pointings per object
+OBJECT_SWEEP_RATIO = 10
+
+# with ar_state_grid_spacing set, the states of the objects in the fields are kept on
+# a ParticleStateGrid over blocks of pointings, typically the visits of a night, which
+# end at a gap of more than VISIT_BLOCK_GAP days between pointings or after VISIT_BLOCK_SPAN days
+# the candidates of each field are still found per pointing, only the integrations are shared
+VISIT_BLOCK_GAP = 0.1
+VISIT_BLOCK_SPAN = 1.0
+
 
 @dataclass
 class EphemerisGeometryParameters:
-    """Data class for holding parameters related to ephemeris geometry"""
+    """Data class for holding parameters related to ephemeris geometry.
+
+    The vector quantities may either describe a single object (shape (3,))
+    or a batch of N objects observed in the same pointing (shape (N, 3)),
+    in which case obj_id and rho_mag are arrays of length N.
+    """
 
     obj_id: str = None
     mjd_tai: float = None
@@ -48,7 +64,68 @@ def get_vec(row, vecname):
     return np.asarray([row[f"{vecname}_x"], row[f"{vecname}_y"], row[f"{vecname}_z"]])
 
 
-def create_ephemeris(orbits_df, pointings_df, args, sconfigs):
+class EphemerisAccumulator:
+    """Collects ephemeris rows in preallocated, growable NumPy column buffers
+    that are turned directly into the ephemeris dataframe, avoiding any
+    conversion of the values to and from text.
+    """
+
+    def __init__(self, column_names, column_types, initial_capacity=1024):
+        """
+        Parameters
+        ----------
+        column_names : tuple of str
+            Names of the ephemeris columns, in output order.
+        column_types : dict
+            Mapping of column name to the NumPy dtype stored for that column.
+        initial_capacity : int, default=1024
+            Number of rows preallocated for each column. The buffers double
+            in size whenever they fill up.
+        """
+        self.column_names = column_names
+        self.n_rows = 0
+        self._capacity = initial_capacity
+        self._buffers = {name: np.empty(initial_capacity, dtype=column_types[name]) for name in column_names}
+
+    def append(self, columns):
+        """
+        Appends a batch of rows to the accumulator.
+
+        Parameters
+        ----------
+        columns : tuple
+            One entry per column, in the order of column_names. Each entry is
+            either an array holding one value per row or a scalar shared by
+            all the rows of the batch.
+        """
+        n_new = max((np.size(col) for col in columns if np.ndim(col)), default=1)
+        n_total = self.n_rows + n_new
+
+        if n_total > self._capacity:
+            while n_total > self._capacity:
+                self._capacity *= 2
+            for name, buffer in self._buffers.items():
+                grown = np.empty(self._capacity, dtype=buffer.dtype)
+                grown[: self.n_rows] = buffer[: self.n_rows]
+                self._buffers[name] = grown
+
+        for name, col in zip(self.column_names, columns):
+            self._buffers[name][self.n_rows : n_total] = col
+        self.n_rows = n_total
+
+    def to_dataframe(self):
+        """
+        Builds the ephemeris dataframe from the accumulated rows.
+
+        Returns
+        -------
+        : pandas dataframe
+            Dataframe with one column per entry of column_names.
+        """
+        return pd.DataFrame({name: self._buffers[name][: self.n_rows] for name in self.column_names})
+
+
+def create_ephemeris(orbits_df, pointings_df, args, sconfigs, context=None):
     """Generate a set of observations given a collection of orbits
     and set of pointings.
 
@@ -71,18 +148,39 @@ def create_ephemeris(orbits_df, pointings_df, args, sconfigs):
             of the observation and the time of the picket (t_picket)
         picket_interval : float
             The interval (days) between picket calculations.  This is 1 day
-            by default.  Current there is only one such interval, used for
-            all objects.  It is currently possible for extremely fast-moving
-            objects to be missed.  This will be remedied in future releases.
+            by default.
+        picket_min, picket_max : float
+            The shortest and longest picket intervals (days).  When they
+            differ, each object's interval is picked, by powers of two from
+            picket_interval, so that its angular motion over an interval stays
+            below max_picket_motion (degrees).  Otherwise, the same interval
+            is used for all objects, and it is possible for extremely
+            fast-moving objects to be missed.
+        interpolation : string
+            'lagrange' interpolates the sky positions through three pickets;
+            'chebyshev' fits a Chebyshev polynomial to each object over a
+            window that halves until its estimated error is below a tolerance.
         obsCode : string
-            The MPC code for the observatory.  (This is current a configuration
-            parameter, but these should be included in the visit information,
-            to allow for multiple observatories.
+            The MPC code of the observatory of the pointings that do not give
+            their own in an observatoryCode column.  The objects are integrated
+            once for all the observatories; only their projection onto the sky
+            is done for each observatory.
         nside : integer
             The nside value used for the HEALPIx calculations.  Must be a
             power of 2 (1, 2, 4, ...)  nside=64 is current default.
         n_sub_intervals: int
             Number of sub-intervals for the Lagrange interpolation (default: 101)
+        n_workers: int
+            Number of worker processes the orbits are shared between (default: 1)
+        particles_per_sim: int
+            Largest number of objects with the same epoch integrated together
+            in one ASSIST simulation (default: 1)
+        lt_tol: float
+            Convergence tolerance (days) of the light travel time iterations (default: 1e-9)
+    context : EphemerisContext, default=None
+        The ephemeris context of the run, with the ASSIST ephemeris, SPICE kernels,
+        observatory positions and pool of worker processes reused by every chunk.
+        By default, one is set up for this call only.
 
     Returns
     -------
@@ -104,6 +202,102 @@ def create_ephemeris(orbits_df, pointings_df, args, sconfigs):
     locations of just those objects within that set of HEALPix tiles are
     computed.  Details for those that actually do land within the field
     of view are passed along.
+
+    With more than one worker, each worker process builds its own ASSIST
+    ephemeris object and SPICE state and carries out the above for a
+    contiguous shard of the orbits.  The output does not depend on the
+    number of workers.  The worker processes are kept in the context, so
+    that they are only set up once for all the chunks of a run.
+    """
+    verboselog = args.pplogger.info if args.loglevel else lambda *a, **k: None
+
+    ephemeris_csv_filename = None
+    if args.output_ephemeris_file and args.outpath:
+        ephemeris_csv_filename = os.path.join(args.outpath, args.output_ephemeris_file)
+
+    # the orbits are split into contiguous shards, one per worker process. Every
+    # object is propagated independently of the others, so the shards can be
+    # merged back into exactly the ephemeris a single process would produce.
+    own_context = context is None
+    if own_context:
+        context = EphemerisContext(args, sconfigs)
+
+    sweep = select_sweep(len(orbits_df), len(pointings_df), sconfigs)
+    verboselog(f"Finding the objects in the fields with the {sweep} sweep.")
+
+    n_workers = min(sconfigs.simulation.ar_n_workers, len(orbits_df))
+    if n_workers > 1:
+        verboselog(f"Generating ephemeris for {len(orbits_df)} objects in {n_workers} worker processes.")
+        shards = [orbits_df.iloc[shard] for shard in np.array_split(np.arange(len(orbits_df)), n_workers)]
+        # the pool is started with the largest number of workers, so that it can be
+        # reused by the chunks with fewer orbits than workers
+        executor = context.get_executor(
+            sconfigs.simulation.ar_n_workers, _init_ephemeris_worker, (pointings_df, args, sconfigs)
+        )
+        shard_results = list(executor.map(_ephemeris_worker, shards, [sweep] * len(shards)))
+    else:
+        shard_results = [generate_ephemeris_shard(orbits_df, pointings_df, args, sconfigs, context, sweep)]
+
+    # the cache counts of all the shards are summed over the run, and logged once it is over
+    for _, _, cache_counts in shard_results:
+        context.cache_counts.update(cache_counts)
+
+    if own_context:
+        log_cache_counts(context.cache_counts, verboselog)
+        context.close()
+
+    ephemeris_df = merge_ephemeris_shards([shard_result[:2] for shard_result in shard_results])
+    verboselog("Ephemeris generated.")
+
+    # if the user has defined an output file name for the ephemeris results, write out to that file
+    if ephemeris_csv_filename:
+        verboselog("Writing out ephemeris results to file.")
+        write_out_ephemeris_file(ephemeris_df, ephemeris_csv_filename, args, sconfigs)
+
+    # join the ephemeris and input orbits dataframe, take special care to make
+    # sure the 'ObjID' column types match.
+    verboselog("Joining ephemeris to orbits dataframe.")
+    ephemeris_df["ObjID"] = ephemeris_df["ObjID"].astype("string")
+    orbits_df["ObjID"] = orbits_df["ObjID"].astype("string")
+    observations = ephemeris_df.join(orbits_df.set_index("ObjID"), on="ObjID")
+
+    # Return the dataframe needed for Sorcha to continue
+    return observations
+
+
+def generate_ephemeris_shard(orbits_df, pointings_df, args, sconfigs, context, sweep="pointing"):
+    """Runs the ephemeris generator for a set of orbits, using the ASSIST
+    ephemeris object and SPICE kernels of the ephemeris context of its process,
+    so that it can run in a separate worker process.
+
+    Parameters
+    ----------
+    orbits_df : pandas dataframe
+        The dataframe containing the orbits of this shard.
+    pointings_df : pandas dataframe
+        The dataframe containing the collection of telescope/camera pointings.
+    args :
+        Various arguments necessary for the calculation
+    sconfigs:
+        Dataclass of configuration file arguments.
+    context : EphemerisContext
+        The ephemeris context of the process.
+    sweep : string, default="pointing"
+        How the objects that may be in each field are found: "pointing" walks
+        through the pointings (sweep_pointings), "object" follows the objects
+        (sweep_objects)
+
+    Returns
+    -------
+    ephemeris_df : pandas dataframe
+        The ephemeris of the objects of this shard, ordered by pointing (in the
+        order of sweep) and then by position in orbits_df.
+    pointing_index : numpy array
+        For each row of ephemeris_df, the position in pointings_df of the
+        pointing the row belongs to.
+    cache_counts : Counter
+        The hits and misses of the observatory position and Sun state caches of
+        the process while generating this shard.
     """
     verboselog = args.pplogger.info if args.loglevel else lambda *a, **k: None
 
@@ -112,25 +306,34 @@ def create_ephemeris(orbits_df, pointings_df, args, sconfigs):
 
     ang_fov_buffer = ang_fov + buffer
 
-    picket_interval = sconfigs.simulation.ar_picket
-    obsCode = sconfigs.simulation.ar_obs_code
-    nside = 2**sconfigs.simulation.ar_healpix_order
-    n_sub_intervals = sconfigs.simulation.ar_n_sub_intervals
-
-    ephemeris_csv_filename = None
-    if args.output_ephemeris_file and args.outpath:
-        ephemeris_csv_filename = os.path.join(args.outpath, args.output_ephemeris_file)
+    lt_tol = sconfigs.simulation.ar_lt_tolerance
 
-    verboselog("Building ASSIST ephemeris object.")
-    ephem, gm_sun, gm_total = create_assist_ephemeris(args, sconfigs.auxiliary)
-    verboselog("Furnishing SPICE kernels.")
-    furnish_spiceypy(args, sconfigs.auxiliary)
+    ephem = context.ephem
+    observatories = context.observatories
+    sun_states = context.sun_states
+    # the caches are kept for the whole run by each process, so only what this shard adds is counted
+    cache_counts_before = get_cache_counts(context)
+    # objects whose two-body propagation is close enough to their integration skip ASSIST
+    kepler_arguments = {}
+    if sconfigs.simulation.ar_propagator == "kepler":
+        kepler_arguments = dict(
+            kepler_tolerance=sconfigs.simulation.ar_kepler_tolerance,
+            jd_span=(pointings_df["fieldJD_TDB"].min(), pointings_df["fieldJD_TDB"].max()),
+        )
     verboselog("Generating ASSIST+REBOUND simulations.")
-    sim_dict = generate_simulations(ephem, gm_sun, gm_total, orbits_df, args)
-    observatories = Observatory(args, sconfigs.auxiliary)
-
-    output = StringIO()
-    in_memory_csv = writer(output)
+    sim_dict = generate_simulations(
+        ephem,
+        context.gm_sun,
+        context.gm_total,
+        orbits_df,
+        args,
+        particles_per_sim=sconfigs.simulation.ar_particles_per_sim,
+        sun_states=sun_states,
+        **kepler_arguments,
+    )
+    if sconfigs.simulation.ar_propagator == "kepler":
+        n_kepler = sum(isinstance(v["sim"], KeplerSimulation) for v in sim_dict.values())
+        verboselog(f"Propagating {n_kepler} of {len(sim_dict)} objects on two-body orbits.")
 
     column_names = (
         "ObjID",
@@ -157,22 +360,435 @@ def create_ephemeris(orbits_df, pointings_df, args, sconfigs):
         "Obs_Sun_vz_km_s",
         "phase_deg",
     )
-    column_types = defaultdict(ObjID=str, FieldID=str).setdefault(float)
-    in_memory_csv.writerow(column_names)
+    # the FieldID keeps the type used in the pointing database so that the
+    # ephemeris can later be matched back to the pointings
+    column_types = defaultdict(lambda: np.float64, ObjID=object, FieldID=pointings_df["FieldID"].dtype)
+    ephemeris = EphemerisAccumulator(column_names, column_types)
 
-    # t_picket is the last time at which the sky positions of all the objects
-    # were calculated and placed into a healpix dictionary, i.e. the
-    # update_pixel_dict() function is called.  That calculation is redone at
-    # regular (tunable) intervals.
-    # Setting t_picket to 0 ensures that the function is called on the
-    # first run.
+    verboselog("Generating ephemeris...")
+    if sweep == "object":
+        candidates = sweep_objects(sim_dict, pointings_df, ephem, observatories, sconfigs)
+    else:
+        candidates = sweep_pointings(sim_dict, pointings_df, ephem, observatories, sconfigs, verboselog)
 
-    t_picket = 0.0
+    pointing_index = []
+    # by default the objects are integrated to each pointing
+    grid = None
+    if sconfigs.simulation.ar_state_grid_spacing is not None:
+        grid = ParticleStateGrid(node_spacing=sconfigs.simulation.ar_state_grid_spacing)
+    t_block, t_previous, n_blocks = None, None, 0
+    for i_pointing, pointing, obj_ids in candidates:
+        mjd_tai = float(pointing["observationMidpointMJD_TAI"])
+        visit_vector = get_vec(pointing, "visit_vector")
+        r_obs = get_vec(pointing, "r_obs")
 
-    verboselog("Generating ephemeris...")
+        # Objects revisited within a block of pointings are interpolated from
+        # the same nodes, so the nodes are only dropped once the block is over.
+        t = pointing["fieldJD_TDB"]
+        if grid is not None and (
+            t_block is None or t - t_previous > VISIT_BLOCK_GAP or t - t_block > VISIT_BLOCK_SPAN
+        ):
+            grid.clear()
+            t_block, n_blocks = t, n_blocks + 1
+        t_previous = t
+
+        # Evaluate all the candidates for this pointing at once. The object
+        # indices follow the order of the input orbits, and so does the output.
+        rho, rho_mag, _, r_ast, v_ast = integrate_light_time_objects(
+            sim_dict, obj_ids, t - ephem.jd_ref, r_obs, lt0=0.01, lt_tol=lt_tol, grid=grid
+        )
+        rho_hat = rho / rho_mag[:, np.newaxis]
+
+        ang_from_center = 180 / np.pi * np.arccos(rho_hat @ visit_vector)
+        in_fov = ang_from_center < ang_fov_buffer
+        if not np.any(in_fov):
+            continue
+
+        ephem_geom_params = EphemerisGeometryParameters()
+        ephem_geom_params.obj_id = obj_ids[in_fov]
+        ephem_geom_params.mjd_tai = mjd_tai
+        ephem_geom_params.rho = rho[in_fov]
+        ephem_geom_params.rho_hat = rho_hat[in_fov]
+        ephem_geom_params.rho_mag = rho_mag[in_fov]
+        ephem_geom_params.r_ast = r_ast[in_fov]
+        ephem_geom_params.v_ast = v_ast[in_fov]
+
+        ephemeris.append(calculate_rates_and_geometry(pointing, ephem_geom_params))
+        pointing_index.append(np.full(np.count_nonzero(in_fov), i_pointing))
+
+    if grid is not None:
+        verboselog(
+            f"Evaluated the objects in the fields over {n_blocks} blocks of visits, "
+            f"with {grid.integrations} integrations."
+        )
+    cache_counts = get_cache_counts(context)
+    cache_counts.subtract(cache_counts_before)
+
+    pointing_index = np.concatenate(pointing_index or [np.empty(0, dtype=np.int64)])
+    return ephemeris.to_dataframe(), pointing_index, cache_counts
+
+
+def get_cache_counts(context):
+    """Returns the hits and misses of the observatory position and Sun state
+    caches of an ephemeris context.
+
+    Parameters
+    ----------
+    context : EphemerisContext
+        The ephemeris context of the process.
+
+    Returns
+    -------
+    cache_counts : Counter
+        The number of hits and misses of each cache so far.
+    """
+    return Counter(
+        observatory_hits=context.observatories.cacheHits,
+        observatory_misses=context.observatories.cacheMisses,
+        sun_hits=context.sun_states.cacheHits,
+        sun_misses=context.sun_states.cacheMisses,
+    )
+
+
+def log_cache_counts(cache_counts, log):
+    """Logs the hits and misses of the observatory position and Sun state caches.
+
+    Parameters
+    ----------
+    cache_counts : Counter
+        The number of hits and misses of each cache, as returned by get_cache_counts.
+    log : function
+        Logs each line.
+    """
+    log(
+        f"Observatory position cache: {cache_counts['observatory_hits']} hits, "
+        f"{cache_counts['observatory_misses']} misses."
+    )
+    log(f"Sun state cache: {cache_counts['sun_hits']} hits, {cache_counts['sun_misses']} misses.")
+
+
+def sweep_pointings(sim_dict, pointings_df, ephem, observatories, sconfigs, verboselog):
+    """Finds the objects that may be in each field by walking through the pointings
+    in order, keeping the sky positions of all the objects in a PixelDict per
+    observatory, refreshed as the pointings move on.
+
+    Parameters
+    ----------
+    sim_dict : dictionary
+        Dictionary of ASSIST simulation objects
+    pointings_df : pandas dataframe
+        The dataframe containing the collection of telescope/camera pointings.
+    ephem : Ephem
+        ASSIST Ephem object
+    observatories : Observatory
+        Observatory object
+    sconfigs:
+        Dataclass of configuration file arguments.
+    verboselog : function
+        Logs the progress of the sweep
+
+    Yields
+    ------
+    i_pointing : int
+        Position of the pointing in pointings_df
+    pointing : pandas Series
+        The pointing
+    obj_ids : array
+        The designations of the objects that may be in the field, in the order
+        of the simulation dictionary
+    """
+    ang_fov = sconfigs.simulation.ar_ang_fov
+    ang_fov_buffer = ang_fov + sconfigs.simulation.ar_fov_buffer
+
+    # Each observatory has its own PixelDict, as the sky positions of nearby
+    # objects depend on the site. They are created when the first pointing of
+    # their site comes up, with pickets aligned on the first pointing, so that
+    # the objects are integrated to the same times for all the sites and only
+    # the projection onto the sky is done per site.
+    jd_ref = pointings_df["fieldJD_TDB"].iloc[0]
+    pixdicts = {}
+    state_cache = PicketStateCache() if pointings_df["observatoryCode"].nunique() > 1 else None
+    schedules = {
+        obsCode: times.to_numpy()
+        for obsCode, times in pointings_df.groupby("observatoryCode", observed=True)["fieldJD_TDB"]
+    }
+    fields = {
+        obsCode: vectors.to_numpy()
+        for obsCode, vectors in pointings_df.groupby("observatoryCode", observed=True)[
+            ["visit_vector_x", "visit_vector_y", "visit_vector_z"]
+        ]
+    }
+
+    # the healpix pixels of the fields, when they were precomputed with the pointings
+    if "pixels" in pointings_df.attrs and "pixels_begin" in pointings_df:
+        field_pixels = pointings_df.attrs["pixels"]
+        pixels_begin = pointings_df["pixels_begin"].to_numpy()
+        pixels_end = pointings_df["pixels_end"].to_numpy()
+    else:
+        field_pixels = None
+
+    for i_pointing, (_, pointing) in enumerate(pointings_df.iterrows()):
+        # If the observation time is too far from the
+        # time of the last set of ballpark sky position,
+        # compute a new set
+
+        obsCode = pointing["observatoryCode"]
+        if obsCode not in pixdicts:
+            verboselog(f"Building the sky position dictionary of observatory {obsCode}.")
+            pixdicts[obsCode] = create_pixel_dict(
+                jd_ref,
+                pointing["fieldJD_TDB"],
+                sim_dict,
+                ephem,
+                obsCode,
+                observatories,
+                sconfigs,
+                state_cache,
+                schedules[obsCode],
+                fields[obsCode],
+            )
+        pixdict = pixdicts[obsCode]
 
-    pixdict = PixelDict(
-        pointings_df["fieldJD_TDB"].iloc[0],
+        pixels = None
+        if field_pixels is not None:
+            pixels = field_pixels[pixels_begin[i_pointing] : pixels_end[i_pointing]]
+        obj_indices = pixdict.get_object_indices(
+            pointing["fieldJD_TDB"], pointing["fieldRA_deg"], pointing["fieldDec_deg"], ang_fov, pixels
+        )
+        if len(obj_indices) == 0:
+            continue
+        uv = pixdict.interpolate_unit_vectors(obj_indices, pointing["fieldJD_TDB"])
+
+        visit_vector = get_vec(pointing, "visit_vector")
+
+        # the objects whose interpolated position is in the field are candidates
+        uv /= np.linalg.norm(uv, axis=1)[:, np.newaxis]
+        ang = np.arccos(uv @ visit_vector) * 180 / np.pi
+        obj_ids = pixdict.desigs[obj_indices[ang < ang_fov_buffer]]
+        if len(obj_ids):
+            yield i_pointing, pointing, obj_ids
+
+    for obsCode, pixdict in pixdicts.items():
+        verboselog(
+            f"Skipped {pixdict.skipped_pickets} pickets over gaps in the pointings of observatory {obsCode}."
+        )
+        if sconfigs.simulation.ar_prune_horizon is not None:
+            verboselog(
+                f"Deferred {pixdict.deferred_refreshes} picket refreshes of objects away from the "
+                f"pointings of observatory {obsCode}."
+            )
+
+
+def sweep_objects(sim_dict, pointings_df, ephem, observatories, sconfigs):
+    """Finds the objects that may be in each field by following the objects through
+    the survey instead: their sky positions are computed once at nodes spaced by the
+    picket interval, aligned on the first pointing as the pickets of sweep_pointings
+    are, and matched against the fields pointed at around each node.
+
+    The pointings are binned by their nearest node. Within a bin, the sky position of
+    an object is interpolated through the nodes before, at and after it, as with
+    three pickets, and stays within a distance of its position at the node set by
+    the differences between the three: the fields within that distance, plus their
+    radius, are found in a k-d tree of the fields of the bin. Only the nodes next to
+    a bin with pointings are computed, in increasing time, so that each object is
+    integrated once along its trajectory.
+
+    Parameters
+    ----------
+    sim_dict : dictionary
+        Dictionary of ASSIST simulation objects
+    pointings_df : pandas dataframe
+        The dataframe containing the collection of telescope/camera pointings.
+    ephem : Ephem
+        ASSIST Ephem object
+    observatories : Observatory
+        Observatory object
+    sconfigs:
+        Dataclass of configuration file arguments.
+
+    Yields
+    ------
+    i_pointing : int
+        Position of the pointing in pointings_df
+    pointing : pandas Series
+        The pointing
+    obj_ids : array
+        The designations of the objects that may be in the field, in the order
+        of the simulation dictionary
+    """
+    interval = sconfigs.simulation.ar_picket
+    ang_fov_buffer = sconfigs.simulation.ar_ang_fov + sconfigs.simulation.ar_fov_buffer
+    lt_tol = sconfigs.simulation.ar_lt_tolerance
+    desigs = np.array(list(sim_dict.keys()), dtype=object)
+
+    times = pointings_df["fieldJD_TDB"].to_numpy()
+    obs_codes = pointings_df["observatoryCode"].to_numpy()
+    fields = pointings_df[["visit_vector_x", "visit_vector_y", "visit_vector_z"]].to_numpy()
+    jd_ref = times[0]
+    node_index = np.rint((times - jd_ref) / interval).astype(np.int64)
+    # chord between a field centre and the edge of the field, buffer included
+    field_chord = 2 * np.sin(0.5 * np.radians(ang_fov_buffer))
+
+    # unit vectors of all the objects at the nodes, by node and observatory. The
+    # objects are integrated to each node once, for the first observatory, and
+    # only their light travel times are corrected for the other observatories.
+    nodes, node_states = {}, {}
+
+    def get_node(k, obsCode):
+        if (k, obsCode) not in nodes:
+            t = jd_ref + k * interval
+            et = (t - spice.j2000()) * 24 * 60 * 60
+            r_obs, _ = observatories.barycentricObservatoryStates(et, obsCode)
+            r_obs = r_obs[0] / AU_KM
+            if k in node_states:
+                rho, rho_mag, _ = extrapolate_light_time(*node_states[k], r_obs, lt_tol=lt_tol)
+            else:
+                rho, rho_mag, lt, r_ast, v_ast = integrate_light_time_objects(
+                    sim_dict, desigs, t - ephem.jd_ref, r_obs, lt0=0.01, lt_tol=lt_tol
+                )
+                node_states[k] = (r_ast, v_ast, lt)
+            nodes[(k, obsCode)] = rho / rho_mag[:, np.newaxis]
+        return nodes[(k, obsCode)]
+
+    order = np.lexsort((np.arange(len(times)), node_index))
+    bins, bin_starts = np.unique(node_index[order], return_index=True)
+    bin_ends = np.append(bin_starts[1:], len(order))
+
+    for k, bin_start, bin_end in zip(bins, bin_starts, bin_ends):
+        in_bin = order[bin_start:bin_end]
+        bin_codes = pd.unique(obs_codes[in_bin])
+        for key in [key for key in nodes if key[0] < k - 1]:
+            del nodes[key]
+        for key in [key for key in node_states if key < k - 1]:
+            del node_states[key]
+        for j in (-1, 0, 1):
+            for obsCode in bin_codes:
+                get_node(k + j, obsCode)
+
+        t_node = jd_ref + k * interval
+        found_pointings, found_objects = [], []
+        for obsCode in bin_codes:
+            rows = in_bin[obs_codes[in_bin] == obsCode]
+            rho_hat_m, rho_hat_0, rho_hat_p = (get_node(k + j, obsCode) for j in (-1, 0, 1))
+
+            # over the bin, the interpolated unit vectors stray from the node by at most reach,
+            # and by twice that once normalised
+            reach = 0.25 * np.linalg.norm(rho_hat_p - rho_hat_m, axis=1) + 0.125 * np.linalg.norm(
+                rho_hat_p - 2 * rho_hat_0 + rho_hat_m, axis=1
+            )
+            hits = cKDTree(fields[rows]).query_ball_point(rho_hat_0, field_chord + 2 * reach)
+            lengths = np.array([len(hit) for hit in hits], dtype=np.int64)
+            if lengths.sum() == 0:
+                continue
+            objects = np.repeat(np.arange(len(desigs)), lengths)
+            pointings = rows[np.concatenate(hits).astype(np.int64)]
+
+            # the objects whose interpolated position is in the field are candidates
+            Lm, L0, Lp = lagrange3(t_node - interval, t_node, t_node + interval, times[pointings])
+            uv = (
+                rho_hat_m[objects] * Lm[:, np.newaxis]
+                + rho_hat_0[objects] * L0[:, np.newaxis]
+                + rho_hat_p[objects] * Lp[:, np.newaxis]
+            )
+            uv /= np.linalg.norm(uv, axis=1)[:, np.newaxis]
+            ang = np.arccos(np.sum(uv * fields[pointings], axis=1)) * 180 / np.pi
+            in_field = ang < ang_fov_buffer
+            found_pointings.append(pointings[in_field])
+            found_objects.append(objects[in_field])
+
+        if not found_pointings:
+            continue
+        pointings, objects = np.concatenate(found_pointings), np.concatenate(found_objects)
+        if len(pointings) == 0:
+            continue
+        by_pointing = np.lexsort((objects, pointings))
+        pointings, objects = pointings[by_pointing], objects[by_pointing]
+        starts = np.flatnonzero(np.append(True, pointings[1:] != pointings[:-1]))
+        for start, end in zip(starts, np.append(starts[1:], len(pointings))):
+            i_pointing = int(pointings[start])
+            yield i_pointing, pointings_df.iloc[i_pointing], desigs[objects[start:end]]
+
+
+def create_pixel_dict(
+    jd_ref,
+    jd_tdb,
+    sim_dict,
+    ephem,
+    obsCode,
+    observatories,
+    sconfigs,
+    state_cache=None,
+    schedule=None,
+    fields=None,
+):
+    """Creates the PixelDict of an observatory, with the interpolation set in
+    the configs, for a first pointing at a given time.
+
+    The pickets (or Chebyshev windows) start at the time of the first pointing
+    rounded to the base picket interval (or longest window) from a reference
+    time, so that the PixelDicts of all the observatories share their picket times.
+
+    Parameters
+    ----------
+    jd_ref : float
+        The reference time (JD TDB) the pickets are aligned on
+    jd_tdb : float
+        The time (JD TDB) of the first pointing of the observatory
+    sim_dict : dictionary
+        Dictionary of ASSIST simulation objects
+    ephem : Ephem
+        ASSIST Ephem object
+    obsCode : string
+        The MPC code for the observatory
+    observatories : Observatory
+        Observatory object
+    sconfigs:
+        Dataclass of configuration file arguments.
+    state_cache : PicketStateCache, default=None
+        Object states at picket times shared between the PixelDicts of the observatories
+    schedule : array of float, default=None
+        The times (JD TDB) of the pointings of the observatory, around which the
+        sky positions of the objects are indexed
+    fields : array (N,3), default=None
+        Unit vectors of the centres of the pointings, in the order of schedule.
+        Needed when ar_prune_horizon is set
+
+    Returns
+    -------
+    : PixelDict
+        The PixelDict of the observatory
+    """
+    nside = 2**sconfigs.simulation.ar_healpix_order
+    n_sub_intervals = sconfigs.simulation.ar_n_sub_intervals
+    lt_tol = sconfigs.simulation.ar_lt_tolerance
+    pruning = dict(
+        fields=fields,
+        field_radius=sconfigs.simulation.ar_ang_fov + sconfigs.simulation.ar_fov_buffer,
+        prune_horizon=sconfigs.simulation.ar_prune_horizon,
+    )
+
+    if sconfigs.simulation.ar_interpolation == "chebyshev":
+        window = sconfigs.simulation.ar_chebyshev_window
+        return ChebyshevPixelDict(
+            jd_ref + np.floor((jd_tdb - jd_ref) / window) * window,
+            sim_dict,
+            ephem,
+            obsCode,
+            observatories,
+            order=sconfigs.simulation.ar_chebyshev_order,
+            window=window,
+            tolerance=sconfigs.simulation.ar_chebyshev_tolerance,
+            nside=nside,
+            n_sub_intervals=n_sub_intervals,
+            lt_tol=lt_tol,
+            state_cache=state_cache,
+            schedule=schedule,
+            **pruning,
+        )
+
+    picket_interval = sconfigs.simulation.ar_picket
+    return PixelDict(
+        jd_ref + np.round((jd_tdb - jd_ref) / picket_interval) * picket_interval,
         sim_dict,
         ephem,
         obsCode,
@@ -180,66 +796,102 @@ def create_ephemeris(orbits_df, pointings_df, args, sconfigs):
         picket_interval,
         nside,
         n_sub_intervals=n_sub_intervals,
+        lt_tol=lt_tol,
+        picket_min=sconfigs.simulation.ar_picket_min,
+        picket_max=sconfigs.simulation.ar_picket_max,
+        max_picket_motion=sconfigs.simulation.ar_picket_max_motion,
+        state_cache=state_cache,
+        schedule=schedule,
+        **pruning,
     )
-    for _, pointing in pointings_df.iterrows():
-        mjd_tai = float(pointing["observationMidpointMJD_TAI"])
 
-        # If the observation time is too far from the
-        # time of the last set of ballpark sky position,
-        # compute a new set
 
-        desigs = pixdict.get_designations(
-            pointing["fieldJD_TDB"], pointing["fieldRA_deg"], pointing["fieldDec_deg"], ang_fov
-        )
-        unit_vectors = pixdict.interpolate_unit_vectors(desigs, pointing["fieldJD_TDB"])
-        visit_vector = get_vec(pointing, "visit_vector")
-        r_obs = get_vec(pointing, "r_obs")
+def select_sweep(n_objects, n_pointings, sconfigs):
+    """Chooses how the ephemeris generator finds the objects that may be in each field.
 
-        for k, uv in unit_vectors.items():
-            ephem_geom_params = EphemerisGeometryParameters()
-            ephem_geom_params.obj_id = k
-            ephem_geom_params.mjd_tai = mjd_tai
-
-            v = sim_dict[k]
-            sim, ex = v["sim"], v["ex"]
-            uv /= np.linalg.norm(uv)
-            ang = np.arccos(np.dot(uv, visit_vector)) * 180 / np.pi
-            if ang < ang_fov_buffer:
-                (
-                    ephem_geom_params.rho,
-                    ephem_geom_params.rho_mag,
-                    _,
-                    ephem_geom_params.r_ast,
-                    ephem_geom_params.v_ast,
-                ) = integrate_light_time(sim, ex, pointing["fieldJD_TDB"] - ephem.jd_ref, r_obs, lt0=0.01)
-                ephem_geom_params.rho_hat = ephem_geom_params.rho / ephem_geom_params.rho_mag
-
-                ang_from_center = 180 / np.pi * np.arccos(np.dot(ephem_geom_params.rho_hat, visit_vector))
-                if ang_from_center < ang_fov_buffer:
-                    out_tuple = calculate_rates_and_geometry(pointing, ephem_geom_params)
-                    in_memory_csv.writerow(out_tuple)
+    The pointing sweep (sweep_pointings) is used unless ar_sweep asks for
+    another. With ar_sweep set to auto, the objects are followed through the survey
+    (sweep_objects) when there are far fewer of them than pointings, as the cost
+    of walking through the pointings (sweep_pointings) is then dominated by the
+    work done for every pointing. The pointing sweep is kept when the configs
+    turn on one of its own features: adaptive picket intervals, Chebyshev
+    interpolation or the pruning of picket refreshes.
 
-    verboselog("Ephemeris generated.")
-    # reset to the beginning of the in-memory CSV
-    output.seek(0)
-    ephemeris_df = pd.read_csv(output, dtype=column_types)
+    Parameters
+    ----------
+    n_objects : int
+        Number of objects
+    n_pointings : int
+        Number of pointings
+    sconfigs:
+        Dataclass of configuration file arguments.
 
-    # if the user has defined an output file name for the ephemeris results, write out to that file
-    if ephemeris_csv_filename:
-        verboselog("Writing out ephemeris results to file.")
-        write_out_ephemeris_file(ephemeris_df, ephemeris_csv_filename, args, sconfigs)
+    Returns
+    -------
+    : string
+        "pointing" or "object"
+    """
+    simulation = sconfigs.simulation
+    if simulation.ar_sweep != "auto":
+        return simulation.ar_sweep
 
-    # join the ephemeris and input orbits dataframe, take special care to make
-    # sure the 'ObjID' column types match.
-    verboselog("Joining ephemeris to orbits dataframe.")
-    ephemeris_df["ObjID"] = ephemeris_df["ObjID"].astype("string")
-    orbits_df["ObjID"] = orbits_df["ObjID"].astype("string")
-    observations = ephemeris_df.join(orbits_df.set_index("ObjID"), on="ObjID")
+    pointing_features = (
+        simulation.ar_picket_min != simulation.ar_picket_max
+        or simulation.ar_interpolation != "lagrange"
+        or simulation.ar_prune_horizon is not None
+    )
+    if pointing_features or n_objects * OBJECT_SWEEP_RATIO > n_pointings:
+        return "pointing"
+    return "object"
 
-    spice.kclear()
 
-    # Return the dataframe needed for Sorcha to continue
-    return observations
+def merge_ephemeris_shards(shard_results):
+    """Merges the ephemerides of the orbit shards into a single dataframe.
+
+    Parameters
+    ----------
+    shard_results : list of tuples
+        The (ephemeris_df, pointing_index) output of generate_ephemeris_shard for
+        each shard, in the order of the shards in the input orbits.
+
+    Returns
+    -------
+    : pandas dataframe
+        The ephemeris ordered by pointing and then by position of the object in
+        the input orbits, independently of the number of shards.
+    """
+    ephemeris_dfs, pointing_indices = zip(*shard_results)
+    # a stable sort keeps the input orbit order within each pointing, since the
+    # shards are contiguous slices of the orbits and each is sorted already
+    order = np.argsort(np.concatenate(pointing_indices), kind="stable")
+    return pd.concat(ephemeris_dfs, ignore_index=True).iloc[order].reset_index(drop=True)
+
+
+# state of a worker process of the ephemeris generation pool, set by _init_ephemeris_worker
+_worker_state = {}
+
+
+def _init_ephemeris_worker(pointings_df, args, sconfigs):
+    """Stores the inputs shared by all the shards in the worker process, so that
+    only the orbits are sent with each task, and sets up the ephemeris context
+    of the worker, which is reused by all its tasks.
+    """
+    _worker_state["pointings_df"] = pointings_df
+    _worker_state["args"] = args
+    _worker_state["sconfigs"] = sconfigs
+    _worker_state["context"] = EphemerisContext(args, sconfigs)
+
+
+def _ephemeris_worker(orbits_df, sweep):
+    """Generates the ephemeris of one shard of orbits inside a worker process."""
+    return generate_ephemeris_shard(
+        orbits_df,
+        _worker_state["pointings_df"],
+        _worker_state["args"],
+        _worker_state["sconfigs"],
+        _worker_state["context"],
+        sweep,
+    )
 
 
 def get_residual_vectors(v1):
@@ -251,20 +903,21 @@ def get_residual_vectors(v1):
 
     Parameters
     ----------
-    v1 : array, shape = (3,))
-        The vector to be decomposed
+    v1 : array, shape = (3,) or (N, 3)
+        The vector(s) to be decomposed
 
     Returns
     -------
-    A :  array, shape = (3,))
+    A :  array, shape = (3,) or (N, 3)
         A  vector
-    D : array, shape = (3,))
+    D : array, shape = (3,) or (N, 3)
         D vector
     """
-    x, y, z = v1
+    v1 = np.asarray(v1)
+    x, y, z = v1[..., 0], v1[..., 1], v1[..., 2]
     cosd = np.sqrt(1 - z * z)
-    A = np.array((-y, x, 0.0)) / cosd
-    D = np.array((-z * x / cosd, -z * y / cosd, cosd))
+    A = np.stack((-y, x, np.zeros_like(x)), axis=-1) / cosd[..., np.newaxis]
+    D = np.stack((-z * x / cosd, -z * y / cosd, cosd), axis=-1)
     return A, D
 
 
@@ -276,35 +929,42 @@ def calculate_rates_and_geometry(pointing: pd.DataFrame, ephem_geom_params: Ephe
     pointing : pandas dataframe
         The dataframe containing the pointing database.
     ephem_geom_params : EphemerisGeometryParameters
-        Various parameters necessary to calculate the ephemeris
+        Various parameters necessary to calculate the ephemeris, either for a
+        single object or for a batch of objects observed in this pointing.
 
     Returns
     -------
     : tuple
         Tuple containing the ephemeris parameters needed for Sorcha post processing.
+        For a batch of objects, the per-object entries are arrays of length N
+        while the pointing entries remain scalars.
     """
     r_sun = get_vec(pointing, "r_sun")
     r_obs = get_vec(pointing, "r_obs")
     v_sun = get_vec(pointing, "v_sun")
     v_obs = get_vec(pointing, "v_obs")
 
-    ra0, dec0 = vec2ra_dec(ephem_geom_params.rho_hat)
-    drhodt = ephem_geom_params.v_ast - v_obs
-    drho_magdt = (1 / ephem_geom_params.rho_mag) * np.dot(ephem_geom_params.rho, drhodt)
+    rho = ephem_geom_params.rho
+    rho_hat = ephem_geom_params.rho_hat
+    rho_mag = np.asarray(ephem_geom_params.rho_mag)
+    r_ast = ephem_geom_params.r_ast
+    v_ast = ephem_geom_params.v_ast
+
+    ra0, dec0 = vec2ra_dec(rho_hat)
+    drhodt = v_ast - v_obs
+    drho_magdt = (1 / rho_mag) * np.sum(rho * drhodt, axis=-1)
     ddeltatdt = drho_magdt / (SPEED_OF_LIGHT)
-    drhodt = ephem_geom_params.v_ast * (1 - ddeltatdt) - v_obs
-    A, D = get_residual_vectors(ephem_geom_params.rho_hat)
-    drho_hatdt = (
-        drhodt / ephem_geom_params.rho_mag
-        - drho_magdt * ephem_geom_params.rho_hat / ephem_geom_params.rho_mag
-    )
-    dradt = np.dot(A, drho_hatdt)
-    ddecdt = np.dot(D, drho_hatdt)
-    r_ast_sun = ephem_geom_params.r_ast - r_sun
-    v_ast_sun = ephem_geom_params.v_ast - v_sun
-    r_ast_obs = ephem_geom_params.r_ast - r_obs
+    drhodt = v_ast * (1 - ddeltatdt)[..., np.newaxis] - v_obs
+    A, D = get_residual_vectors(rho_hat)
+    drho_hatdt = drhodt / rho_mag[..., np.newaxis] - (drho_magdt / rho_mag)[..., np.newaxis] * rho_hat
+    dradt = np.sum(A * drho_hatdt, axis=-1)
+    ddecdt = np.sum(D * drho_hatdt, axis=-1)
+    r_ast_sun = r_ast - r_sun
+    v_ast_sun = v_ast - v_sun
+    r_ast_obs = r_ast - r_obs
     phase_angle = np.arccos(
-        np.dot(r_ast_sun, r_ast_obs) / (np.linalg.norm(r_ast_sun) * np.linalg.norm(r_ast_obs))
+        np.sum(r_ast_sun * r_ast_obs, axis=-1)
+        / (np.linalg.norm(r_ast_sun, axis=-1) * np.linalg.norm(r_ast_obs, axis=-1))
     )
     obs_sun = r_obs - r_sun
     dobs_sundt = v_obs - v_sun
@@ -314,18 +974,18 @@ def calculate_rates_and_geometry(pointing: pd.DataFrame, ephem_geom_params: Ephe
         pointing["FieldID"],
         ephem_geom_params.mjd_tai,
         pointing["fieldJD_TDB"],
-        ephem_geom_params.rho_mag * AU_KM,
+        rho_mag * AU_KM,
         drho_magdt * AU_KM / (24 * 60 * 60),
         ra0,
         dradt * 180 / np.pi,
         dec0,
         ddecdt * 180 / np.pi,
-        r_ast_sun[0] * AU_KM,
-        r_ast_sun[1] * AU_KM,
-        r_ast_sun[2] * AU_KM,
-        v_ast_sun[0] * AU_KM / (24 * 60 * 60),
-        v_ast_sun[1] * AU_KM / (24 * 60 * 60),
-        v_ast_sun[2] * AU_KM / (24 * 60 * 60),
+        r_ast_sun[..., 0] * AU_KM,
+        r_ast_sun[..., 1] * AU_KM,
+        r_ast_sun[..., 2] * AU_KM,
+        v_ast_sun[..., 0] * AU_KM / (24 * 60 * 60),
+        v_ast_sun[..., 1] * AU_KM / (24 * 60 * 60),
+        v_ast_sun[..., 2] * AU_KM / (24 * 60 * 60),
         obs_sun[0] * AU_KM,
         obs_sun[1] * AU_KM,
         obs_sun[2] * AU_KM,
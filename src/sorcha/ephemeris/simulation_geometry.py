@@ -6,7 +6,6 @@ from sorcha.ephemeris.simulation_constants import (
     ECL_TO_EQ_ROTATION_MATRIX,
     EQ_TO_ECL_ROTATION_MATRIX,
 )
-import spiceypy as spice
 
 
 def ecliptic_to_equatorial(v, rot_mat=ECL_TO_EQ_ROTATION_MATRIX):
@@ -45,7 +44,7 @@ def equatorial_to_ecliptic(v, rot_mat=EQ_TO_ECL_ROTATION_MATRIX):
     return np.dot(v, rot_mat)
 
 
-def integrate_light_time(sim, ex, t, r_obs, lt0=0, iter=3, speed_of_light=SPEED_OF_LIGHT):
+def integrate_light_time(sim, ex, t, r_obs, lt0=0, iter=3, speed_of_light=SPEED_OF_LIGHT, index=0):
     """
     Performs the light travel time correction between object and observatory iteratively for the object at a given reference time
 
@@ -65,6 +64,8 @@ def integrate_light_time(sim, ex, t, r_obs, lt0=0, iter=3, speed_of_light=SPEED_
         Number of iterations
     speed_of_light: float, default=SPEED_OF_LIGHT
         Speed of light for the calculation (default is SPEED_OF_LIGHT constant)
+    index: int, default=0
+        Index of the object's particle in the simulation
     Returns
     -------
     rho: array
@@ -81,8 +82,8 @@ def integrate_light_time(sim, ex, t, r_obs, lt0=0, iter=3, speed_of_light=SPEED_
     lt = lt0
     for i in range(iter):
         ex.integrate_or_interpolate(t - lt)
-        target = np.array(sim.particles[0].xyz)
-        vtarget = np.array(sim.particles[0].vxyz)
+        target = np.array(sim.particles[index].xyz)
+        vtarget = np.array(sim.particles[index].vxyz)
         rho = target - r_obs
         rho_mag = np.linalg.norm(rho)
         lt = rho_mag / speed_of_light
@@ -90,6 +91,355 @@ def integrate_light_time(sim, ex, t, r_obs, lt0=0, iter=3, speed_of_light=SPEED_
     return rho, rho_mag, lt, target, vtarget
 
 
+def get_particle_states(sim, ex, index, t, max_node_spacing=0.01):
+    """
+    Computes the positions and velocities of several particles of a simulation,
+    each at its own time.
+
+    All the particles are advanced together to a set of equally spaced nodes
+    covering the requested times, no more than max_node_spacing apart, and the
+    states at the requested times are obtained by cubic Hermite interpolation
+    between the nodes. If all the times are equal the states are exact.
+
+    Parameters
+    ----------
+    sim: simulation
+        Rebound simulation object
+    ex: simulation extras
+        ASSIST simulation extras
+    index: array of int
+        Indices of the particles in the simulation
+    t: array
+        Time at which the state of each particle is needed
+    max_node_spacing: float, default=0.01
+        Largest interval (days) between the interpolation nodes
+    Returns
+    -------
+    xyz: array (N,3)
+        Particle positions
+    vxyz: array (N,3)
+        Particle velocities
+    """
+    t = np.asarray(t, dtype=float)
+    t_lo, t_hi = t.min(), t.max()
+    n_nodes = 1 if t_hi == t_lo else int(np.ceil((t_hi - t_lo) / max_node_spacing)) + 1
+    nodes = np.linspace(t_lo, t_hi, n_nodes)
+
+    xyz = np.empty((n_nodes, sim.N, 3))
+    vxyz = np.empty((n_nodes, sim.N, 3))
+    for j, t_node in enumerate(nodes):
+        ex.integrate_or_interpolate(t_node)
+        sim.serialize_particle_data(xyz=xyz[j], vxvyvz=vxyz[j])
+    xyz = xyz[:, index]
+    vxyz = vxyz[:, index]
+    if n_nodes == 1:
+        return xyz[0], vxyz[0]
+
+    h = nodes[1] - nodes[0]
+    seg = np.clip(np.searchsorted(nodes, t, side="right") - 1, 0, n_nodes - 2)
+    cols = np.arange(len(t))
+    return hermite_states(
+        (t - nodes[seg]) / h, h, xyz[seg, cols], vxyz[seg, cols], xyz[seg + 1, cols], vxyz[seg + 1, cols]
+    )
+
+
+def hermite_states(s, h, xyz0, vxyz0, xyz1, vxyz1):
+    """
+    Interpolates the states of particles between two nodes with cubic Hermite
+    polynomials through their positions and velocities at the nodes
+
+    Parameters
+    ----------
+    s: array
+        Fraction of the interval between the nodes at which each state is needed
+    h: float
+        Interval (days) between the nodes
+    xyz0, vxyz0: arrays (N,3)
+        Positions and velocities at the first node
+    xyz1, vxyz1: arrays (N,3)
+        Positions and velocities at the second node
+    Returns
+    -------
+    xyz: array (N,3)
+        Interpolated positions
+    vxyz: array (N,3)
+        Interpolated velocities
+    """
+    s = np.asarray(s, dtype=float)[:, np.newaxis]
+    m0, m1 = h * vxyz0, h * vxyz1
+
+    s2, s3 = s * s, s * s * s
+    pos = (2 * s3 - 3 * s2 + 1) * xyz0 + (s3 - 2 * s2 + s) * m0 + (-2 * s3 + 3 * s2) * xyz1 + (s3 - s2) * m1
+    vel = (
+        (6 * s2 - 6 * s) * xyz0 + (3 * s2 - 4 * s + 1) * m0 + (6 * s - 6 * s2) * xyz1 + (3 * s2 - 2 * s) * m1
+    ) / h
+    return pos, vel
+
+
+class ParticleStateGrid:
+    """
+    States of the particles of ASSIST simulations at nodes equally spaced in time,
+    aligned on the start of the simulations, kept while a block of pointings is
+    evaluated. The states at any time are interpolated between the two nodes
+    around it, so that objects observed several times within the block, and the
+    iterations of their light travel time corrections, only integrate their
+    simulations to the few nodes covering the block.
+    """
+
+    def __init__(self, node_spacing=0.01):
+        """
+        Initialization function for the class
+
+        Parameters
+        ----------
+        node_spacing: float
+            Interval (days) between the nodes (default: 0.01)
+        """
+        self.node_spacing = node_spacing
+        self.nodes = {}
+        self.integrations = 0
+
+    def get_states(self, sim, ex, index, t):
+        """
+        Computes the positions and velocities of several particles of a simulation,
+        each at its own time, integrating the simulation to the nodes it is
+        missing.
+
+        Parameters
+        ----------
+        sim: simulation
+            Rebound simulation object
+        ex: simulation extras
+            ASSIST simulation extras
+        index: array of int
+            Indices of the particles in the simulation
+        t: array
+            Time at which the state of each particle is needed
+        Returns
+        -------
+        xyz: array (N,3)
+            Particle positions
+        vxyz: array (N,3)
+            Particle velocities
+        """
+        h = self.node_spacing
+        t = np.asarray(t, dtype=float)
+        k = np.floor(t / h).astype(np.int64)
+
+        nodes = self.nodes.setdefault(id(sim), {})
+        for k_node in np.unique(np.concatenate([k, k + 1])):
+            if k_node not in nodes:
+                ex.integrate_or_interpolate(k_node * h)
+                xyz, vxyz = np.empty((sim.N, 3)), np.empty((sim.N, 3))
+                sim.serialize_particle_data(xyz=xyz, vxvyvz=vxyz)
+                nodes[k_node] = (xyz, vxyz)
+                self.integrations += 1
+
+        index = np.asarray(index)
+        xyz0, vxyz0, xyz1, vxyz1 = (np.empty((len(t), 3)) for _ in range(4))
+        for k_node in np.unique(k):
+            at = k == k_node
+            xyz0[at], vxyz0[at] = nodes[k_node][0][index[at]], nodes[k_node][1][index[at]]
+            xyz1[at], vxyz1[at] = nodes[k_node + 1][0][index[at]], nodes[k_node + 1][1][index[at]]
+        return hermite_states(t / h - k, h, xyz0, vxyz0, xyz1, vxyz1)
+
+    def clear(self):
+        """Drops the states at all the nodes, at the end of a block of pointings"""
+        self.nodes.clear()
+
+
+def integrate_light_time_particles(
+    sim, ex, index, t, r_obs, lt0=0, iter=3, speed_of_light=SPEED_OF_LIGHT, lt_tol=None, grid=None
+):
+    """
+    Performs the light travel time correction between objects and observatory iteratively
+    for several objects sharing the same simulation, at a given reference time
+
+    Parameters
+    ----------
+    sim: simulation
+        Rebound simulation object
+    ex: simulation extras
+        ASSIST simulation extras
+    index: array of int
+        Indices of the objects' particles in the simulation
+    t: float
+        Target time
+    r_obs: array (3 entries)
+        Observatory position at time t
+    lt0: float, default=0
+        First guess for light travel time
+    iter: int, default=3
+        Number of iterations, or largest number of iterations if lt_tol is given
+    speed_of_light: float, default=SPEED_OF_LIGHT
+        Speed of light for the calculation (default is SPEED_OF_LIGHT constant)
+    lt_tol: float, default=None
+        If given, the iterations stop once no light travel time changes by more
+        than lt_tol (days) from one iteration to the next
+    grid: ParticleStateGrid, default=None
+        If given, the states of the objects are interpolated from the nodes of
+        the grid instead of being computed with get_particle_states
+    Returns
+    -------
+    rho: array (N,3)
+        Object-observatory vectors
+    rho_mag: array
+        Magnitudes of the rho vectors
+    lt: array
+        Light travel times
+    target: array (N,3)
+        Object positions at t-lt
+    vtarget: array (N,3)
+        Object velocities at t-lt
+    """
+    lt = np.full(len(index), float(lt0))
+    for i in range(iter):
+        if grid is None:
+            target, vtarget = get_particle_states(sim, ex, index, t - lt)
+        else:
+            target, vtarget = grid.get_states(sim, ex, index, t - lt)
+        rho = target - r_obs
+        rho_mag = np.linalg.norm(rho, axis=-1)
+        lt_previous, lt = lt, rho_mag / speed_of_light
+        if lt_tol is not None and np.max(np.abs(lt - lt_previous)) <= lt_tol:
+            break
+    return rho, rho_mag, lt, target, vtarget
+
+
+def integrate_light_time_objects(
+    sim_dict, desigs, t, r_obs, lt0=0, lt_tol=1e-9, max_iter=10, speed_of_light=SPEED_OF_LIGHT, grid=None
+):
+    """
+    Performs the light travel time correction between objects and observatory
+    for a list of objects at once, at a given reference time
+
+    Parameters
+    ----------
+    sim_dict: dictionary
+        dictionary of ASSIST simulation objects
+    desigs: list
+        List of designations (consistent with the simulation dictionary)
+    t: float
+        Target time
+    r_obs: array (3 entries)
+        Observatory position at time t
+    lt0: float, default=0
+        First guess for light travel time
+    lt_tol: float, default=1e-9
+        Convergence tolerance (days) of the light travel times
+    max_iter: int, default=10
+        Largest number of iterations
+    speed_of_light: float, default=SPEED_OF_LIGHT
+        Speed of light for the calculation (default is SPEED_OF_LIGHT constant)
+    grid: ParticleStateGrid, default=None
+        If given, the states of the objects are interpolated from the nodes of
+        the grid
+    Returns
+    -------
+    rho: array (N,3)
+        Object-observatory vectors, in the order of desigs
+    rho_mag: array
+        Magnitudes of the rho vectors
+    lt: array
+        Light travel times
+    target: array (N,3)
+        Object positions at t-lt
+    vtarget: array (N,3)
+        Object velocities at t-lt
+    """
+    n = len(desigs)
+    rho, target, vtarget = np.empty((n, 3)), np.empty((n, 3)), np.empty((n, 3))
+    rho_mag, lt = np.empty(n), np.empty(n)
+    for sim, ex, positions, index in group_by_simulation(sim_dict, desigs):
+        rho[positions], rho_mag[positions], lt[positions], target[positions], vtarget[positions] = (
+            integrate_light_time_particles(
+                sim,
+                ex,
+                index,
+                t,
+                r_obs,
+                lt0=lt0,
+                iter=max_iter,
+                speed_of_light=speed_of_light,
+                lt_tol=lt_tol,
+                grid=grid,
+            )
+        )
+    return rho, rho_mag, lt, target, vtarget
+
+
+def extrapolate_light_time(
+    target, vtarget, lt, r_obs, lt_tol=1e-9, max_iter=10, speed_of_light=SPEED_OF_LIGHT
+):
+    """
+    Performs the light travel time correction between objects and an observatory,
+    starting from the light-time corrected states of the objects for another,
+    nearby observatory at the same time. The objects are moved linearly along their
+    velocities, which is accurate as long as the light travel times differ by much
+    less than a day, e.g. for two observatories on the Earth's surface.
+
+    Parameters
+    ----------
+    target: array (N,3)
+        Object positions at t-lt
+    vtarget: array (N,3)
+        Object velocities at t-lt
+    lt: array
+        Light travel times to the other observatory
+    r_obs: array (3 entries)
+        Observatory position at time t
+    lt_tol: float, default=1e-9
+        Convergence tolerance (days) of the light travel times
+    max_iter: int, default=10
+        Largest number of iterations
+    speed_of_light: float, default=SPEED_OF_LIGHT
+        Speed of light for the calculation (default is SPEED_OF_LIGHT constant)
+    Returns
+    -------
+    rho: array (N,3)
+        Object-observatory vectors
+    rho_mag: array
+        Magnitudes of the rho vectors
+    lt_obs: array
+        Light travel times to the observatory
+    """
+    lt_obs = lt
+    for _ in range(max_iter):
+        rho = target - vtarget * (lt_obs - lt)[:, np.newaxis] - r_obs
+        rho_mag = np.linalg.norm(rho, axis=1)
+        dlt = rho_mag / speed_of_light - lt_obs
+        lt_obs = lt_obs + dlt
+        if np.max(np.abs(dlt), initial=0) <= lt_tol:
+            break
+    return rho, rho_mag, lt_obs
+
+
+def group_by_simulation(sim_dict, desigs):
+    """
+    Groups a list of objects by the simulation their particles belong to
+
+    Parameters
+    ----------
+    sim_dict: dictionary
+        dictionary of ASSIST simulation objects
+    desigs: list
+        List of designations (consistent with the simulation dictionary)
+    Returns
+    -------
+    groups: list
+        One (sim, ex, positions, index) tuple per simulation, where positions
+        are the positions of the simulation's objects in desigs and index the
+        indices of their particles in the simulation
+    """
+    groups = {}
+    for pos, k in enumerate(desigs):
+        v = sim_dict[k]
+        sim, ex, positions, index = groups.setdefault(id(v["sim"]), (v["sim"], v["ex"], [], []))
+        positions.append(pos)
+        index.append(v["index"])
+    return list(groups.values())
+
+
 def get_hp_neighbors(ra_c, dec_c, search_radius, nside=32, nested=True):
     """
     Queries the healpix grid for pixels near the given RA/Dec with a given search radius
@@ -121,6 +471,85 @@ def get_hp_neighbors(ra_c, dec_c, search_radius, nside=32, nested=True):
     return res
 
 
+def get_hp_discs(ra_c, dec_c, search_radius, nside=32, nested=True, block_size=100_000):
+    """
+    Finds the healpix pixels near many RA/Dec pairs at once, as a compressed
+    (CSR-style) index. As with the inclusive queries of get_hp_neighbors, every
+    pixel overlapping the disc is kept, along with a few more: those whose centre
+    is within the search radius plus the largest pixel radius.
+
+    The candidate pixels are only queried once for all the targets falling in the
+    same pixel, and the targets are processed in blocks of block_size.
+
+    Parameters
+    ----------
+    ra_c: array
+        Target RAs
+    dec_c: array
+        Target decs
+    search_radius: float
+        Radius for the query
+    nside: int, default=32
+        healpix nside
+    nested: boolean, default=True
+        Defines the ordering scheme for the healpix ordering. True (default) means a NESTED ordering
+    block_size: int, default=100,000
+        Number of targets processed at once
+    Returns
+    -------
+    begin: array of int
+        The pixels near target i are pixels[begin[i]:end[i]]
+    end: array of int
+        End of the pixels near each target
+    pixels: array of int
+        Healpix pixels, sorted for each target
+    """
+    max_pixrad = hp.max_pixrad(nside)
+    cos_radius = np.cos(np.radians(search_radius) + max_pixrad)
+    centres = ra_dec2vec(np.asarray(ra_c, dtype=np.float64), np.asarray(dec_c, dtype=np.float64))
+    centres = centres.reshape(-1, 3)
+
+    # every pixel kept for a target is within two pixel radii more of the centre
+    # of the pixel the target falls in, so that the candidates are shared
+    home, home_index = np.unique(
+        hp.vec2pix(nside, centres[:, 0], centres[:, 1], centres[:, 2], nest=nested), return_inverse=True
+    )
+    candidates = [
+        np.sort(
+            hp.query_disc(
+                nside,
+                hp.pix2vec(nside, pixel, nest=nested),
+                np.radians(search_radius) + 2 * max_pixrad,
+                nest=nested,
+            )
+        )
+        for pixel in home
+    ]
+    lengths = np.array([len(c) for c in candidates], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    candidates = np.concatenate(candidates) if len(candidates) else np.empty(0, dtype=np.int64)
+    candidate_vectors = np.column_stack(hp.pix2vec(nside, candidates, nest=nested))
+
+    kept = []
+    for block_start in range(0, len(centres), block_size):
+        block = slice(block_start, block_start + block_size)
+        block_lengths = lengths[home_index[block]]
+        targets = np.repeat(np.arange(len(block_lengths)), block_lengths)
+        gather = np.repeat(
+            starts[home_index[block]] - np.cumsum(block_lengths) + block_lengths, block_lengths
+        )
+        gather += np.arange(block_lengths.sum())
+
+        near = np.sum(candidate_vectors[gather] * centres[block][targets], axis=1) >= cos_radius
+        kept.append((block_start + targets[near], candidates[gather[near]]))
+
+    targets = np.concatenate([t for t, _ in kept] or [np.empty(0, dtype=np.int64)])
+    pixels = np.concatenate([p for _, p in kept] or [np.empty(0, dtype=np.int64)]).astype(np.int64)
+    end = np.cumsum(np.bincount(targets, minlength=len(centres)))
+    begin = end - np.bincount(targets, minlength=len(centres))
+    return begin, end, pixels
+
+
 def ra_dec2vec(ra, dec):
     """
     Converts a RA/Dec pair to a unit vector on the sphere
@@ -147,27 +576,29 @@ def vec2ra_dec(vec):
     Decomposes a unit vector on the sphere into a RA/Dec pair
     Parameters
     ----------
-    vec : array
-        Unit vector
+    vec : array, shape = (3,) or (N, 3)
+        Unit vector(s)
     Returns
     -------
-    ra: float
+    ra: float or array
         Target RA
-    dec: float
+    dec: float or array
         Target dec
     """
     radeg = 180.0 / np.pi
-    x = vec[0]
-    y = vec[1]
-    z = vec[2]
+    vec = np.asarray(vec)
+    x = vec[..., 0]
+    y = vec[..., 1]
+    z = vec[..., 2]
     ra = radeg * np.arctan2(y, x) % 360
     dec = radeg * np.arcsin(z)
     return ra, dec
 
 
-def barycentricObservatoryRates(et, obsCode, observatories, Rearth=RADIUS_EARTH_KM, delta_et=10):
+def barycentricObservatoryRates(et, obsCode, observatories, Rearth=RADIUS_EARTH_KM):
     """
-    Computes the position and rate of motion for the observatory in barycentric coordinates
+    Computes the position and rate of motion for the observatory in barycentric coordinates,
+    at a single time, with Observatory.barycentricObservatoryStates
 
     Parameters
     ----------
@@ -179,8 +610,6 @@ def barycentricObservatoryRates(et, obsCode, observatories, Rearth=RADIUS_EARTH_
         Observatory object with spherical representations for the obsCode
     Rearth: float, default=RADIUS_EARTH_KM
         Radius of the Earth units[km]
-    delta_et: float, default=10
-        Difference in ephemeris time (in seconds) to derive the rotation matrix from the fixed Earth equatorial frame to J2000
     Returns
     -------
      : array
@@ -188,29 +617,5 @@ def barycentricObservatoryRates(et, obsCode, observatories, Rearth=RADIUS_EARTH_
      : array
         Velocity of the observatory (baricentric)
     """
-    # This JPL's quoted Earth radius (km)
-    # et is JPL's internal time
-    # Get the barycentric position of Earth
-    posvel, _ = spice.spkezr("EARTH", et, "J2000", "NONE", "SSB")
-    pos = posvel[0:3]
-    vel = posvel[3:6]
-    # Get the matrix that rotates from the Earth's equatorial body fixed frame to the J2000 equatorial frame.
-    # We don't need to compute this repeatedly
-    et_1962 = spice.str2et("1962-Jan-20")
-    if et >= et_1962:
-        m = spice.pxform("ITRF93", "J2000", et)
-        mp = spice.pxform("ITRF93", "J2000", et + delta_et)
-        mm = spice.pxform("ITRF93", "J2000", et - delta_et)
-    else:
-        m = spice.pxform("IAU_EARTH", "J2000", et)
-        mp = spice.pxform("IAU_EARTH", "J2000", et + delta_et)
-        mm = spice.pxform("IAU_EARTH", "J2000", et - delta_et)
-    # Get the MPC's unit vector from the geocenter to
-    # the observatory
-    obsVec = observatories.ObservatoryXYZ[obsCode]
-    obsVec = np.array(obsVec)
-    # Carry out the rotation and scale
-    mVec = np.dot(m, obsVec) * Rearth
-    mVecp = np.dot(mp, obsVec) * Rearth
-    mVecm = np.dot(mm, obsVec) * Rearth
-    return pos + mVec, vel + (mVecp - mVecm) / (2 * delta_et)
+    pos, vel = observatories.barycentricObservatoryStates(np.array([et]), obsCode, Rearth)
+    return pos[0], vel[0]
@@ -1,31 +1,72 @@
 import json
 import os
+from collections import OrderedDict
 import numpy as np
 import spiceypy as spice
 from pooch import Decompress
-from sorcha.ephemeris.simulation_constants import RADIUS_EARTH_KM
+from sorcha.ephemeris.simulation_constants import (
+    RADIUS_EARTH_KM,
+    EARTH_ROTATION_RATE,
+    MJD_J2000,
+    TT_MINUS_TAI,
+    TDB_MINUS_TT_K,
+    TDB_MINUS_TT_EB,
+    TDB_MINUS_TT_M,
+)
 from sorcha.ephemeris.simulation_geometry import ecliptic_to_equatorial, equatorial_to_ecliptic
 from sorcha.ephemeris.simulation_data_files import make_retriever
-from sorcha.ephemeris.orbit_conversion_utilities import universal_cartesian, universal_cometary
+from sorcha.ephemeris.orbit_conversion_utilities import (
+    universal_cartesian,
+    universal_cartesian_array,
+    universal_cometary,
+    universal_cometary_array,
+)
+
+
+def tdb_minus_tt(et_tt):
+    """
+    Computes the periodic difference between TDB and TT, as done by SPICE
+    when converting between TDT and TDB
+
+    Parameters
+    -------------
+    et_tt : float or array of floats
+        Seconds past J2000 in TT
+
+    Returns
+    -------------
+    : float or array of floats
+        TDB - TT, in seconds
+    """
+    mean_anomaly = TDB_MINUS_TT_M[0] + TDB_MINUS_TT_M[1] * et_tt
+    eccentric_anomaly = mean_anomaly + TDB_MINUS_TT_EB * np.sin(mean_anomaly)
+    return TDB_MINUS_TT_K * np.sin(eccentric_anomaly)
 
 
 def mjd_tai_to_epoch(mjd_tai):
     """
-    Converts a MJD value in TAI to SPICE ephemeris time
+    Converts MJD values in TAI to JD values in TDB
+
+    TT is TAI plus a fixed offset, and TDB - TT is computed with the same
+    periodic term as SPICE, so that no kernel is needed and whole arrays are
+    converted at once.
 
     Parameters
     -------------
-    mjd_tai : float
+    mjd_tai : float or array of floats
         Input mjd
 
     Returns
     -------------
-    epoch  : Ephemeris time
+    epoch  : float or array of floats
+        Julian dates in TDB
     """
-    jd = mjd_tai + 2400000.5 + 32.184 / (24 * 60 * 60)
-    epoch_str = "JD %lf TDT" % jd
-    epoch = spice.j2000() + spice.str2et(epoch_str) / (24 * 60 * 60)
-    return epoch
+    # seconds past J2000 in TT
+    et_tt = (np.asarray(mjd_tai, dtype=np.float64) - MJD_J2000) * (24 * 60 * 60) + TT_MINUS_TAI
+    et_tdb = et_tt + tdb_minus_tt(et_tt)
+
+    epoch = MJD_J2000 + 2400000.5 + et_tdb / (24 * 60 * 60)
+    return epoch[()] if np.ndim(epoch) == 0 else epoch
 
 
 def parse_orbit_row(row, epochJD_TDB, ephem, sun_dict, gm_sun, gm_total):
@@ -124,6 +165,81 @@ def parse_orbit_row(row, epochJD_TDB, ephem, sun_dict, gm_sun, gm_total):
     return tuple(np.concatenate([equatorial_coords, equatorial_velocities]))
 
 
+def parse_orbit_columns(orbits_df, epochJD_TDB, sun_states, gm_sun, gm_total):
+    """
+    Parses all the input orbits at once, converting them to the format expected by
+    the ephemeris generation code later on. This is the columnar equivalent of
+    `parse_orbit_row`: the orbits are converted one orbit format at a time, with
+    the element conversions run in parallel and a single rotation to the
+    equatorial frame.
+
+    Parameters
+    ---------------
+    orbits_df : Pandas dataframe
+        Dataframe with the input orbits
+    epochJD_TDB : float or array of floats
+        epoch of the elements of each orbit, in JD TDB
+    sun_states : array of floats
+        (N, 6) array with the barycentric position and velocity of the Sun at the
+        epoch of each orbit, as returned by `SunStates.get_states`
+    gm_sun : float
+        Standard gravitational parameter GM for the Sun
+    gm_total : float
+        Standard gravitational parameter GM for the Solar System barycenter
+
+    Returns
+    ------------
+    states : array of floats
+        (N, 6) array with the state vector (position, velocity) of each orbit,
+        in the order of the input dataframe
+
+    """
+    n = len(orbits_df)
+    epochJD_TDB = np.broadcast_to(np.asarray(epochJD_TDB, dtype=np.float64), (n,))
+    orbit_formats = orbits_df["FORMAT"].to_numpy()
+
+    states = np.empty((n, 6))
+    for orbit_format in np.unique(orbit_formats):
+        rows = np.flatnonzero(orbit_formats == orbit_format)
+        orbits = orbits_df.iloc[rows]
+        epochs = epochJD_TDB[rows]
+
+        if orbit_format in ["CART", "BCART"]:
+            states[rows] = orbits[["x", "y", "z", "xdot", "ydot", "zdot"]].to_numpy(dtype=np.float64)
+            continue
+
+        gm = gm_sun if orbit_format in ["COM", "KEP"] else gm_total
+        if orbit_format in ["COM", "BCOM"]:
+            q = orbits["q"].to_numpy(dtype=np.float64)
+            tp = orbits["t_p_MJD_TDB"].to_numpy(dtype=np.float64) + 2400000.5
+        elif orbit_format in ["KEP", "BKEP"]:
+            a = orbits["a"].to_numpy(dtype=np.float64)
+            q = a * (1 - orbits["e"].to_numpy(dtype=np.float64))
+            tp = epochs - (orbits["ma"].to_numpy(dtype=np.float64) * np.pi / 180.0) * np.sqrt(a**3 / gm)
+        else:
+            raise ValueError("Provided orbit format not supported.")
+
+        states[rows] = universal_cartesian_array(
+            gm,
+            q,
+            orbits["e"].to_numpy(dtype=np.float64),
+            orbits["inc"].to_numpy(dtype=np.float64) * np.pi / 180.0,
+            orbits["node"].to_numpy(dtype=np.float64) * np.pi / 180.0,
+            orbits["argPeri"].to_numpy(dtype=np.float64) * np.pi / 180.0,
+            tp,
+            epochs,
+        )
+
+    states[:, :3] = ecliptic_to_equatorial(states[:, :3])
+    states[:, 3:] = ecliptic_to_equatorial(states[:, 3:])
+
+    # heliocentric orbits are shifted to the barycenter
+    heliocentric = np.isin(orbit_formats, ["KEP", "COM", "CART"])
+    states[heliocentric] += sun_states[heliocentric]
+
+    return states
+
+
 def get_perihelion_row(row, epochJD_TDB, ephem, ssb_dict, gm_sun, gm_total):
     """
     Parses the input orbit row, computing the perihelion for the maximum
@@ -275,11 +391,175 @@ def get_perihelion_row(row, epochJD_TDB, ephem, ssb_dict, gm_sun, gm_total):
     return tuple(np.array([q, e, inc, node, argPeri, Tp]))
 
 
+def get_perihelion_columns(orbits_df, epochJD_TDB, sun_states, gm_sun, gm_total):
+    """
+    Parses all the input orbits at once, computing their heliocentric cometary
+    elements for the maximum apparent magnitude filter. This is the columnar
+    equivalent of `get_perihelion_row`, with each orbit taken at its own epoch.
+
+    Parameters
+    ---------------
+    orbits_df : Pandas dataframe
+        Dataframe with the input orbits
+    epochJD_TDB : float or array of floats
+        epoch of the elements of each orbit, in JD TDB
+    sun_states : array of floats
+        (N, 6) array with the barycentric position and velocity of the Sun at the
+        epoch of each orbit, as returned by `SunStates.get_states`
+    gm_sun : float
+        Standard gravitational parameter GM for the Sun
+    gm_total : float
+        Standard gravitational parameter GM for the Solar System barycenter
+
+    Returns
+    ------------
+    elements : array of floats
+        (N, 6) array with the cometary elements (q, e, inc, node, argPeri, Tp (in MJD!))
+        of each orbit, in the order of the input dataframe
+
+    """
+    n = len(orbits_df)
+    epochJD_TDB = np.broadcast_to(np.asarray(epochJD_TDB, dtype=np.float64), (n,))
+    orbit_formats = orbits_df["FORMAT"].to_numpy()
+
+    # position and velocity of the barycenter relative to the Sun, in the ecliptic frame
+    ssb_states = np.empty((n, 6))
+    ssb_states[:, :3] = -equatorial_to_ecliptic(sun_states[:, :3])
+    ssb_states[:, 3:] = -equatorial_to_ecliptic(sun_states[:, 3:])
+
+    elements = np.empty((n, 6))
+    for orbit_format in np.unique(orbit_formats):
+        rows = np.flatnonzero(orbit_formats == orbit_format)
+        orbits = orbits_df.iloc[rows]
+        epochs = epochJD_TDB[rows]
+
+        if orbit_format == "COM":
+            elements[rows] = orbits[["q", "e", "inc", "node", "argPeri", "t_p_MJD_TDB"]].to_numpy(
+                dtype=np.float64
+            )
+            continue
+        elif orbit_format == "KEP":
+            a = orbits["a"].to_numpy(dtype=np.float64)
+            M = orbits["ma"].to_numpy(dtype=np.float64) * np.pi / 180
+            M = np.where(M > np.pi, M - 2 * np.pi, M)
+            elements[rows, 0] = a * (1 - orbits["e"].to_numpy(dtype=np.float64))
+            elements[rows, 1:5] = orbits[["e", "inc", "node", "argPeri"]].to_numpy(dtype=np.float64)
+            elements[rows, 5] = epochs - M * np.sqrt(a**3 / gm_sun) - 2400000.5  # jd to mjd
+            continue
+        elif orbit_format in ["CART", "BCART"]:
+            states = orbits[["x", "y", "z", "xdot", "ydot", "zdot"]].to_numpy(dtype=np.float64)
+        elif orbit_format in ["BKEP", "BCOM"]:
+            # need to first go to BCART
+            if orbit_format == "BKEP":
+                a = orbits["a"].to_numpy(dtype=np.float64)
+                q = a * (1 - orbits["e"].to_numpy(dtype=np.float64))
+                tp = epochs - (orbits["ma"].to_numpy(dtype=np.float64) * np.pi / 180.0) * np.sqrt(
+                    a**3 / gm_total
+                )
+            else:
+                q = orbits["q"].to_numpy(dtype=np.float64)
+                tp = orbits["t_p_MJD_TDB"].to_numpy(dtype=np.float64) + 2400000.5
+            states = universal_cartesian_array(
+                gm_total,
+                q,
+                orbits["e"].to_numpy(dtype=np.float64),
+                orbits["inc"].to_numpy(dtype=np.float64) * np.pi / 180.0,
+                orbits["node"].to_numpy(dtype=np.float64) * np.pi / 180.0,
+                orbits["argPeri"].to_numpy(dtype=np.float64) * np.pi / 180.0,
+                tp,
+                epochs,
+            )
+        else:
+            raise ValueError("Provided orbit format not supported.")
+
+        # convert to helio here
+        if orbit_format != "CART":
+            states = states + ssb_states[rows]
+
+        elements[rows] = universal_cometary_array(gm_sun, *states.T, epochs)
+        elements[rows, 2:5] *= 180 / np.pi
+        elements[rows, 5] += -2400000.5
+
+    return elements
+
+
+class SunStates:
+    """
+    Cache of the barycentric states of the Sun read from an ASSIST ephemeris,
+    so that the ephemeris is queried only once for every epoch
+    """
+
+    # largest number of epochs kept in stateCache. Each epoch takes a few hundred
+    # bytes and the cache lives as long as its process, so it is kept to a few MB:
+    # the epochs asked for again are those of the input orbits, which are few, while
+    # the pointing times are only read once per run.
+    cache_size = 10_000
+
+    def __init__(self, ephem):
+        """
+        Initialization method
+
+        Parameters
+        ----------
+            ephem : Ephem
+                ASSIST ephemeris object the states are read from
+        """
+        self.ephem = ephem
+        # previously read states, keyed by JD TDB, least recently used first
+        self.stateCache = OrderedDict()
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+    def get_states(self, jd_tdb):
+        """
+        Returns the barycentric state of the Sun at a set of epochs
+
+        Parameters
+        ----------
+            jd_tdb : float or array of floats
+                epochs, in JD TDB
+
+        Returns
+        -------
+            states : array of floats
+                (..., 6) array with the position (au) and velocity (au/day) of the Sun
+                at each epoch, in the equatorial frame
+        """
+        jd_tdb = np.asarray(jd_tdb, dtype=np.float64)
+        epochs, inverse = np.unique(jd_tdb, return_inverse=True)
+
+        unique_states = np.empty((len(epochs), 6))
+        for i, epoch in enumerate(epochs.tolist()):
+            state = self.stateCache.get(epoch)
+            if state is None:
+                self.cacheMisses += 1
+                sun = self.ephem.get_particle("Sun", epoch - self.ephem.jd_ref)
+                state = (sun.x, sun.y, sun.z, sun.vx, sun.vy, sun.vz)
+                self.stateCache[epoch] = state
+                if len(self.stateCache) > self.cache_size:
+                    self.stateCache.popitem(last=False)
+            else:
+                self.cacheHits += 1
+                self.stateCache.move_to_end(epoch)
+            unique_states[i] = state
+
+        return unique_states[inverse.reshape(jd_tdb.shape)]
+
+
 class Observatory:
     """
     Class containing various utility tools related to the calculation of the observatory position
     """
 
+    # spacing (seconds) of the grid the Earth rotation matrices are interpolated on
+    rotation_grid_step = 3 * 60 * 60
+
+    # largest number of observatory states kept in observatoryPositionCache
+    position_cache_size = 100_000
+
+    # resolution (seconds) of the times observatory states are cached at
+    position_cache_resolution = 1e-6
+
     def __init__(self, args, auxconfigs, oc_file=None):
         """
         Initialization method
@@ -293,7 +573,12 @@ class Observatory:
             oc_file : str
                 Path for the file with observatory codes
         """
-        self.observatoryPositionCache = {}  # previously calculated positions to speed up the process
+        # previously calculated states to speed up the process, least recently used first
+        self.observatoryPositionCache = OrderedDict()
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.rotationCache = {}  # Earth rotation matrices at the nodes of the rotation grid
+        self.et_1962 = None  # start of the ITRF93 frame, looked up once the kernels are loaded
 
         if oc_file == None:
             retriever = make_retriever(auxconfigs, args.ar_data_file_path)
@@ -368,23 +653,183 @@ class Observatory:
             : array (3,)
                 Barycentric position of the observatory (x,y,z)
         """
+        pos, _ = self.barycentricObservatoryStates(et, obsCode, Rearth)
+        return pos[0]
+
+    def barycentricObservatoryStates(self, et, obsCode, Rearth=RADIUS_EARTH_KM):
+        """
+        Computes the barycentric positions and velocities of the observatory at an
+        array of times
+
+        The states are kept in a least-recently-used cache, observatoryPositionCache,
+        keyed by the observatory code, the radius of the Earth and the time rounded to
+        position_cache_resolution, so that repeated times are only computed once.
+
+        Parameters
+        ----------
+            et : float or array of floats
+                JPL internal ephemeris times
+            obsCode : str
+                MPC Observatory code
+            Rearth : float default=RADIUS_EARTH_KM
+                Radius of the Earth, units[km]
+        Returns
+        -------
+            : array (N,3)
+                Barycentric positions of the observatory (x,y,z), units[km]
+            : array (N,3)
+                Barycentric velocities of the observatory (vx,vy,vz), units[km/s]
+        """
+        et = np.atleast_1d(np.asarray(et, dtype=np.float64))
+
+        # batches larger than the cache would only evict themselves
+        if len(et) > self.position_cache_size:
+            return self.computeObservatoryStates(et, obsCode, Rearth)
+
+        pos = np.empty((len(et), 3))
+        vel = np.empty((len(et), 3))
+        keys = [(obsCode, Rearth, k) for k in np.round(et / self.position_cache_resolution).astype(np.int64)]
+
+        missing = []
+        for i, key in enumerate(keys):
+            state = self.observatoryPositionCache.get(key)
+            if state is None:
+                missing.append(i)
+            else:
+                self.observatoryPositionCache.move_to_end(key)
+                pos[i], vel[i] = state
+        self.cacheHits += len(et) - len(missing)
+        self.cacheMisses += len(missing)
+
+        if missing:
+            pos[missing], vel[missing] = self.computeObservatoryStates(et[missing], obsCode, Rearth)
+            for i in missing:
+                self.observatoryPositionCache[keys[i]] = (pos[i].copy(), vel[i].copy())
+            while len(self.observatoryPositionCache) > self.position_cache_size:
+                self.observatoryPositionCache.popitem(last=False)
+
+        return pos, vel
+
+    def computeObservatoryStates(self, et, obsCode, Rearth=RADIUS_EARTH_KM):
+        """
+        Computes the barycentric positions and velocities of the observatory at an
+        array of times, without going through observatoryPositionCache
 
-        # This JPL's quoted Earth radius (km)
-        # et is JPL's internal time
+        Parameters
+        ----------
+            et : array of floats
+                JPL internal ephemeris times
+            obsCode : str
+                MPC Observatory code
+            Rearth : float default=RADIUS_EARTH_KM
+                Radius of the Earth, units[km]
+        Returns
+        -------
+            : array (N,3)
+                Barycentric positions of the observatory (x,y,z), units[km]
+            : array (N,3)
+                Barycentric velocities of the observatory (vx,vy,vz), units[km/s]
+        """
+        # Get the barycentric states of Earth
+        posvel, _ = spice.spkezr("EARTH", et, "J2000", "NONE", "SSB")
+        posvel = np.reshape(posvel, (len(et), 6))
 
-        # Get the barycentric position of Earth
-        pos, _ = spice.spkpos("EARTH", et, "J2000", "NONE", "SSB")
+        # Rotate the MPC's vector from the geocenter to the observatory, and scale it
+        obsVec = np.array(self.ObservatoryXYZ[obsCode]) * Rearth
+        m, dm = self.earthRotationMatrices(et)
 
-        # Get the matrix that rotates from the Earth's equatorial body fixed frame to the J2000 equatorial frame.
-        m = spice.pxform("ITRF93", "J2000", et)
+        return posvel[:, :3] + m @ obsVec, posvel[:, 3:] + dm @ obsVec
+
+    def earthRotationMatrices(self, et):
+        """
+        Computes the matrices that rotate from the Earth's equatorial body fixed frame
+        (ITRF93, or IAU_EARTH before 1962) to the J2000 equatorial frame, and their
+        time derivatives.
+
+        The rotation is split into the Earth's spin at a fixed rate, which is computed
+        exactly, and a slowly-varying remainder (precession, nutation, polar motion
+        and changes in the length of day), which is interpolated linearly between
+        the nodes of a grid, every `rotation_grid_step` seconds. The matrices at the
+        nodes are cached.
+
+        Parameters
+        ----------
+            et : array of floats
+                JPL internal ephemeris times
+        Returns
+        -------
+            : array (N,3,3)
+                Rotation matrices
+            : array (N,3,3)
+                Time derivatives of the rotation matrices, units[1/s]
+        """
+        if self.et_1962 is None:
+            self.et_1962 = spice.str2et("1962-Jan-20")
 
-        # Get the MPC's unit vector from the geocenter to
-        # the observatory
-        # obsVec = Observatories.ObservatoryXYZ[obsCode]
-        obsVec = self.ObservatoryXYZ[obsCode]
-        obsVec = np.array(obsVec)
+        # the grid starts at the start of ITRF93, so that the nodes of a frame are within its coverage
+        x = (et - self.et_1962) / self.rotation_grid_step
+        node = np.floor(x).astype(np.int64)
+        frac = (x - node)[:, None, None]
 
-        # Carry out the rotation and scale
-        mVec = np.dot(m, obsVec) * Rearth
+        remainder = np.empty((len(et), 2, 3, 3))
+        for frame, in_frame in (("ITRF93", et >= self.et_1962), ("IAU_EARTH", et < self.et_1962)):
+            if np.any(in_frame):
+                remainder[in_frame, 0] = self.rotationNodes(frame, node[in_frame])
+                remainder[in_frame, 1] = self.rotationNodes(frame, node[in_frame] + 1)
+
+        q = remainder[:, 0] + frac * (remainder[:, 1] - remainder[:, 0])
+        dq = (remainder[:, 1] - remainder[:, 0]) / self.rotation_grid_step
+
+        spin, dspin = rotation_about_z(EARTH_ROTATION_RATE * et, EARTH_ROTATION_RATE)
+        return q @ spin, dq @ spin + q @ dspin
+
+    def rotationNodes(self, frame, nodes):
+        """
+        Looks up the slowly-varying part of the Earth rotation matrices at nodes of
+        the rotation grid, computing the missing ones with SPICE.
+
+        Parameters
+        ----------
+            frame : str
+                Earth body fixed frame (ITRF93 or IAU_EARTH)
+            nodes : array of ints
+                Indices of the nodes
+        Returns
+        -------
+            : array (N,3,3)
+                Rotation matrices with the Earth's spin removed
+        """
+        unique_nodes, inverse = np.unique(nodes, return_inverse=True)
+        for k in unique_nodes:
+            if (frame, k) not in self.rotationCache:
+                et_k = self.et_1962 + k * self.rotation_grid_step
+                spin, _ = rotation_about_z(np.array([EARTH_ROTATION_RATE * et_k]), EARTH_ROTATION_RATE)
+                self.rotationCache[(frame, k)] = spice.pxform(frame, "J2000", et_k) @ spin[0].T
+
+        return np.array([self.rotationCache[(frame, k)] for k in unique_nodes])[inverse]
+
+
+def rotation_about_z(angle, rate):
+    """
+    Computes the matrices rotating by angles about the z axis, and their time
+    derivatives for a constant rate of rotation
+
+    Parameters
+    ----------
+        angle : array of floats
+            Rotation angles, units[rad]
+        rate : float
+            Rate of rotation, units[rad/s]
+    Returns
+    -------
+        : array (N,3,3)
+            Rotation matrices
+        : array (N,3,3)
+            Time derivatives of the rotation matrices, units[1/s]
+    """
+    c, s = np.cos(angle), np.sin(angle)
+    zero, one = np.zeros_like(angle), np.ones_like(angle)
 
-        return pos + mVec
+    m = np.stack([c, -s, zero, s, c, zero, zero, zero, one], axis=-1).reshape(-1, 3, 3)
+    dm = rate * np.stack([-s, -c, zero, c, -s, zero, zero, zero, zero], axis=-1).reshape(-1, 3, 3)
+    return m, dm
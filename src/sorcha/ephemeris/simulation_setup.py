@@ -1,9 +1,11 @@
-from functools import partial
+import hashlib
+import pooch
 import spiceypy as spice
 from assist import Ephem
 from . import simulation_parsing as sp
 import rebound
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import assist
 import logging
 import sys
@@ -13,18 +15,42 @@ import numpy as np
 from sorcha.ephemeris.simulation_constants import *
 from sorcha.ephemeris.simulation_data_files import make_retriever
 
+from sorcha.ephemeris.kepler_propagation import KeplerSimulation, kepler_error_bound
 from sorcha.ephemeris.simulation_geometry import (
-    barycentricObservatoryRates,
-    get_hp_neighbors,
+    get_hp_discs,
     ra_dec2vec,
 )
 from sorcha.ephemeris.simulation_parsing import (
     Observatory,
+    SunStates,
     mjd_tai_to_epoch,
 )
 
 from sorcha.utilities.generate_meta_kernel import build_meta_kernel_file
 
+# bumped whenever the content of the pointing cache changes, so that older caches are ignored
+POINTING_CACHE_VERSION = 3
+
+# the precomputed pointing columns that are stored in the pointing cache
+POINTING_CACHE_COLUMNS = (
+    "fieldJD_TDB",
+    "r_obs_x",
+    "r_obs_y",
+    "r_obs_z",
+    "v_obs_x",
+    "v_obs_y",
+    "v_obs_z",
+    "r_sun_x",
+    "r_sun_y",
+    "r_sun_z",
+    "v_sun_x",
+    "v_sun_y",
+    "v_sun_z",
+)
+
+# Sun states shared by everything run in this process, keyed by the ephemeris files they were read from
+_SUN_STATES = {}
+
 
 def create_assist_ephemeris(args, auxconfigs) -> tuple:
     """Build the ASSIST ephemeris object
@@ -79,6 +105,34 @@ def _create_assist_ephemeris(auxconfigs, cache_dir=None) -> tuple:
     return ephem, gm_sun, gm_total
 
 
+def get_sun_states(ephem, auxconfigs, cache_dir=None):
+    """Returns the Sun states cache of the ASSIST ephemeris files given in the
+    auxiliary configuration. The cache lives for the whole process, so that every
+    chunk of orbits and the pointing precomputation share it.
+
+    Parameters
+    ---------
+    ephem : Ephem
+        The ASSIST ephemeris object built from the ephemeris files. It is used
+        to read the states that are not in the cache yet.
+    auxconfigs: dataclass
+        Dataclass of auxiliary configuration file arguments.
+    cache_dir: string, default=None
+        The base directory to place all downloaded files.
+
+    Returns
+    ---------
+    sun_states : SunStates
+        The Sun states cache
+    """
+    key = (cache_dir, auxconfigs.jpl_planets, auxconfigs.jpl_small_bodies)
+    if key not in _SUN_STATES:
+        _SUN_STATES[key] = SunStates(ephem)
+    sun_states = _SUN_STATES[key]
+    sun_states.ephem = ephem
+    return sun_states
+
+
 def furnish_spiceypy(args, auxconfigs):
     """
     Builds the SPICE kernel, downloading the required files if needed
@@ -118,7 +172,139 @@ def furnish_spiceypy(args, auxconfigs):
     spice.furnsh(meta_kernel)
 
 
-def generate_simulations(ephem, gm_sun, gm_total, orbits_df, args):
+class PointingPixels:
+    """
+    The healpix pixels near every pointing, as one flat array held in the attrs of
+    the pointings dataframe. pandas deep-copies the attrs of a dataframe into every
+    dataframe or row derived from it, so the pixels are kept read-only and shared
+    instead of copied.
+    """
+
+    def __init__(self, pixels):
+        """
+        Initialization function for the class
+
+        Parameters
+        ----------
+        pixels: array of int
+            The pixels of all the pointings, pointing i covering pixels[pixels_begin[i]:pixels_end[i]]
+        """
+        self.pixels = pixels
+        self.pixels.flags.writeable = False
+
+    @property
+    def nbytes(self):
+        """Memory held by the pixels"""
+        return self.pixels.nbytes
+
+    def __getitem__(self, key):
+        return self.pixels[key]
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class EphemerisContext:
+    """
+    The ASSIST ephemeris, SPICE kernels and observatory positions needed to
+    generate ephemerides. They are set up once and reused by the pointing
+    precomputation and by every chunk of orbits of a run.
+    """
+
+    def __init__(self, args, sconfigs):
+        """
+        Initialization method. Builds the ASSIST ephemeris object, furnishes the
+        SPICE kernels and reads the observatory codes.
+
+        Parameters
+        ----------
+            args : dictionary or `sorchaArguments` object
+                dictionary of command-line arguments.
+            sconfigs: dataclass
+                Dataclass of configuration file arguments.
+        """
+        pplogger = logging.getLogger(__name__)
+
+        pplogger.info("Building ASSIST ephemeris object.")
+        self.ephem, self.gm_sun, self.gm_total = create_assist_ephemeris(args, sconfigs.auxiliary)
+        pplogger.info("Furnishing SPICE kernels.")
+        furnish_spiceypy(args, sconfigs.auxiliary)
+        self.observatories = Observatory(args, sconfigs.auxiliary)
+        self.sun_states = get_sun_states(self.ephem, sconfigs.auxiliary, args.ar_data_file_path)
+
+        # hits and misses of the caches of all the processes, summed over the chunks
+        self.cache_counts = Counter()
+
+        # pool of worker processes, kept between chunks along with the arguments it was started with
+        self.executor = None
+        self._executor_setup = None
+
+    def get_executor(self, n_workers, initializer, initargs):
+        """
+        Returns a pool of worker processes, reusing the pool of the previous call
+        if it was started with the same number of workers and initialization.
+
+        Parameters
+        ----------
+            n_workers : int
+                Number of worker processes
+            initializer : callable
+                Function run once by each worker process when it starts
+            initargs : tuple
+                Arguments of initializer. They are compared by identity, so a new
+                pool is started whenever any of them is a different object.
+
+        Returns
+        -------
+            executor : ProcessPoolExecutor
+                The pool of worker processes
+        """
+        setup = (n_workers, initializer, tuple(id(arg) for arg in initargs))
+        if self.executor is None or setup != self._executor_setup:
+            self.shutdown_executor()
+            self.executor = ProcessPoolExecutor(
+                max_workers=n_workers, initializer=initializer, initargs=initargs
+            )
+            self._executor_setup = setup
+        return self.executor
+
+    def shutdown_executor(self):
+        """
+        Stops the pool of worker processes, if there is one.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self._executor_setup = None
+
+    def close(self):
+        """
+        Stops the pool of worker processes and unloads the SPICE kernels.
+        """
+        self.shutdown_executor()
+        spice.kclear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def generate_simulations(
+    ephem,
+    gm_sun,
+    gm_total,
+    orbits_df,
+    args,
+    particles_per_sim=1,
+    sun_states=None,
+    kepler_tolerance=None,
+    jd_span=None,
+):
     """
     Creates the dictionary of ASSIST simulations for the ephemeris generation
 
@@ -134,63 +320,110 @@ def generate_simulations(ephem, gm_sun, gm_total, orbits_df, args):
         Pandas dataframe with the input orbits
     args : dictionary or `sorchaArguments` object
         dictionary of command-line arguments.
+    particles_per_sim : int, default=1
+        Largest number of objects sharing a simulation. Objects whose orbits
+        have the same epoch are added as test particles to a common simulation,
+        so that they are integrated together.
+    sun_states : SunStates, default=None
+        Cache of the Sun states of the ephemeris. By default, a cache is made
+        for this call only.
+    kepler_tolerance : float, default=None
+        If given, the objects whose two-body propagation about the Solar System
+        barycentre stays within kepler_tolerance (arcseconds) of their full
+        integration over jd_span, according to kepler_error_bound, are propagated
+        by a KeplerSimulation instead of ASSIST.
+    jd_span : tuple of float, default=None
+        First and last times (JD TDB) at which the objects are observed. Needed
+        with kepler_tolerance.
 
     Returns
     ---------
     sim_dict : dict
-        Dictionary of ASSIST simulations
+        Dictionary of ASSIST simulations, keyed by ObjID. Each entry holds the
+        simulation ("sim"), its ASSIST extras ("ex") and the index of the
+        object's particle in the simulation ("index"). For the objects propagated
+        by a KeplerSimulation, the same KeplerSimulation is both "sim" and "ex".
 
     """
     sim_dict = defaultdict(dict)  # return
 
-    sun_dict = dict()  # This could be passed in and reused
-    for i, row in orbits_df.iterrows():
-        epoch = row["epochMJD_TDB"]
-        # convert from MJD to JD, if not done already.
-        if epoch < 2400000.5:
-            epoch += 2400000.5
-
-        try:
-            x, y, z, vx, vy, vz = sp.parse_orbit_row(row, epoch, ephem, sun_dict, gm_sun, gm_total)
-            if np.isnan(x):
-                args.pplogger.error(
-                    f"Input elements for orbit {i} failed - see documentation for suggested solutions"
-                )
-                sys.exit(f"Input elements for orbit {i} failed - see documentation for suggested solutions")
-        except ValueError as val_err:
-            args.pplogger.error(val_err)
-            sys.exit(val_err)
-
-        # Instantiate a rebound particle
-        ic = rebound.Particle(x=x, y=y, z=z, vx=vx, vy=vy, vz=vz)
-
-        # Instantiate a rebound simulation and set initial time and time step
-        # The time step is just a guess to start with.
-        sim = rebound.Simulation()
-        sim.t = epoch - ephem.jd_ref
-        sim.dt = 10
-        # This turns off the iterative timestep introduced in arXiv:2401.02849 and default since rebound 4.0.3
-        sim.ri_ias15.adaptive_mode = 1
-        # Add the particle to the simulation
-        sim.add(ic)
-
-        # Attach assist extras to the simulation
-        ex = assist.Extras(sim, ephem)
-
-        # Change the GR model for speed
-        forces = ex.forces
-        forces.remove("GR_EIH")
-        forces.append("GR_SIMPLE")
-        ex.forces = forces
-
-        # Save the simulation in the dictionary
-        sim_dict[row["ObjID"]]["sim"] = sim
-        sim_dict[row["ObjID"]]["ex"] = ex
+    if sun_states is None:
+        sun_states = SunStates(ephem)
+    epochs = orbits_df["epochMJD_TDB"].to_numpy(dtype=np.float64)
+    # convert from MJD to JD, if not done already.
+    epochs = np.where(epochs < 2400000.5, epochs + 2400000.5, epochs)
+
+    try:
+        states = sp.parse_orbit_columns(orbits_df, epochs, sun_states.get_states(epochs), gm_sun, gm_total)
+    except ValueError as val_err:
+        args.pplogger.error(val_err)
+        sys.exit(val_err)
+
+    failed = np.flatnonzero(np.isnan(states[:, 0]))
+    if len(failed) > 0:
+        i = orbits_df.index[failed[0]]
+        args.pplogger.error(
+            f"Input elements for orbit {i} failed - see documentation for suggested solutions"
+        )
+        sys.exit(f"Input elements for orbit {i} failed - see documentation for suggested solutions")
+
+    simulations = [None] * len(states)
+    kepler = np.zeros(len(states), dtype=bool)
+    if kepler_tolerance is not None:
+        t_start, t_end = np.asarray(jd_span, dtype=float) - ephem.jd_ref
+        bound = kepler_error_bound(gm_total, states, epochs - ephem.jd_ref, t_start, t_end)
+        kepler = bound <= np.radians(kepler_tolerance / 3600)
+
+        # the objects within the tolerance share two-body propagations, whatever their epochs
+        members = np.flatnonzero(kepler)
+        for block_start in range(0, len(members), particles_per_sim):
+            block = members[block_start : block_start + particles_per_sim]
+            sim = KeplerSimulation(gm_total, states[block], epochs[block] - ephem.jd_ref)
+            for index, j in enumerate(block):
+                simulations[j] = (sim, sim, index)
+
+    epoch_groups = defaultdict(list)
+    for j, epoch in enumerate(epochs):
+        if not kepler[j]:
+            epoch_groups[epoch].append(j)
+
+    for epoch, members in epoch_groups.items():
+        for block_start in range(0, len(members), particles_per_sim):
+            block = members[block_start : block_start + particles_per_sim]
+
+            # Instantiate a rebound simulation and set initial time and time step
+            # The time step is just a guess to start with.
+            sim = rebound.Simulation()
+            sim.t = epoch - ephem.jd_ref
+            sim.dt = 10
+            # This turns off the iterative timestep introduced in arXiv:2401.02849 and default since rebound 4.0.3
+            sim.ri_ias15.adaptive_mode = 1
+            # Add the particles to the simulation
+            for x, y, z, vx, vy, vz in states[block]:
+                sim.add(rebound.Particle(x=x, y=y, z=z, vx=vx, vy=vy, vz=vz))
+
+            # Attach assist extras to the simulation
+            ex = assist.Extras(sim, ephem)
+
+            # Change the GR model for speed
+            forces = ex.forces
+            forces.remove("GR_EIH")
+            forces.append("GR_SIMPLE")
+            ex.forces = forces
+
+            for index, j in enumerate(block):
+                simulations[j] = (sim, ex, index)
+
+    # Save the simulations in the dictionary, in the order of the input orbits
+    for obj_id, (sim, ex, index) in zip(orbits_df["ObjID"], simulations):
+        sim_dict[obj_id]["sim"] = sim
+        sim_dict[obj_id]["ex"] = ex
+        sim_dict[obj_id]["index"] = index
 
     return sim_dict
 
 
-def precompute_pointing_information(pointings_df, args, sconfigs):
+def precompute_pointing_information(pointings_df, args, sconfigs, context=None):
     """This function is meant to be run once to prime the pointings dataframe
     with additional information that Assist & Rebound needs for it's work.
 
@@ -202,17 +435,26 @@ def precompute_pointing_information(pointings_df, args, sconfigs):
         Command line arguments needed for initialization.
     sconfigs: dataclass
         Dataclass of configuration file arguments.
+    context : EphemerisContext, default=None
+        The ephemeris context of the run. By default, one is set up for this
+        call only.
 
     Returns
     --------
     pointings_df : pandas dataframe
         The original dataframe with several additional columns of precomputed values.
     """
-    ephem, _, _ = create_assist_ephemeris(args, sconfigs.auxiliary)
+    pplogger = logging.getLogger(__name__)
 
-    furnish_spiceypy(args, sconfigs.auxiliary)
-    obsCode = sconfigs.simulation.ar_obs_code
-    observatories = Observatory(args, sconfigs.auxiliary)
+    # pointings may carry their own observatory code, otherwise they are taken
+    # from the observatory given in the config file
+    if "observatoryCode" in pointings_df:
+        pointings_df["observatoryCode"] = pointings_df["observatoryCode"].fillna(
+            sconfigs.simulation.ar_obs_code
+        )
+    else:
+        pointings_df["observatoryCode"] = sconfigs.simulation.ar_obs_code
+    pointings_df["observatoryCode"] = pointings_df["observatoryCode"].astype(str).astype("category")
 
     # vectorize the calculation to get x,y,z vector from ra/dec
     vectors = ra_dec2vec(
@@ -222,26 +464,53 @@ def precompute_pointing_information(pointings_df, args, sconfigs):
     pointings_df["visit_vector_y"] = vectors[:, 1]
     pointings_df["visit_vector_z"] = vectors[:, 2]
 
-    # use pandas `apply` (even though it's slow) instead of looping over the df in a for loop
-    pointings_df["fieldJD_TDB"] = pointings_df.apply(
-        lambda row: mjd_tai_to_epoch(row["observationMidpointMJD_TAI"]), axis=1
-    )
-    et = (pointings_df["fieldJD_TDB"] - spice.j2000()) * 24 * 60 * 60
-
-    # create a partial function since most params don't change, and it makes the lambda easier to read
-    partial_get_hp_neighbors = partial(
-        get_hp_neighbors,
-        search_radius=sconfigs.simulation.ar_ang_fov + sconfigs.simulation.ar_fov_buffer,
+    # the healpix pixels near each pointing, looked up in the sky position
+    # dictionary of the objects: pointing i covers pixels[pixels_begin[i]:pixels_end[i]]
+    pixels_begin, pixels_end, pixels = get_hp_discs(
+        pointings_df["fieldRA_deg"].astype("float"),
+        pointings_df["fieldDec_deg"].astype("float"),
+        sconfigs.simulation.ar_ang_fov + sconfigs.simulation.ar_fov_buffer,
         nside=2**sconfigs.simulation.ar_healpix_order,
         nested=True,
     )
+    pointings_df["pixels_begin"] = pixels_begin
+    pointings_df["pixels_end"] = pixels_end
+    pointings_df.attrs["pixels"] = PointingPixels(pixels)
+
+    # the remaining columns only depend on the pointing times, the observatory
+    # and the auxiliary files, so they can be reused from an earlier run
+    cache_path = None
+    if sconfigs.simulation.ar_pointing_cache:
+        cache_key = pointing_cache_key(pointings_df, sconfigs.auxiliary, args.ar_data_file_path)
+        cache_path = os.path.join(sconfigs.simulation.ar_pointing_cache, f"pointings_{cache_key}.npz")
+        cached_columns = read_pointing_cache(cache_path)
+        if cached_columns is not None:
+            pplogger.info(f"Reading precomputed pointing information from {cache_path}")
+            for column_name, values in cached_columns.items():
+                pointings_df[column_name] = values
+            return pointings_df
+
+    own_context = context is None
+    if own_context:
+        context = EphemerisContext(args, sconfigs)
+    observatories = context.observatories
+
+    pointings_df["fieldJD_TDB"] = mjd_tai_to_epoch(pointings_df["observationMidpointMJD_TAI"].to_numpy())
+    et = (pointings_df["fieldJD_TDB"] - spice.j2000()) * 24 * 60 * 60
 
-    # create empty arrays for observatory position and velocity to be filled in
+    # create empty arrays for observatory position and velocity to be filled in, one observatory at a time
     r_obs = np.empty((len(pointings_df), 3))
     v_obs = np.empty((len(pointings_df), 3))
 
-    for idx, et_i in enumerate(et):
-        r_obs[idx], v_obs[idx] = barycentricObservatoryRates(et_i, obsCode, observatories=observatories)
+    for obsCode, rows in pointings_df.groupby("observatoryCode", observed=True).indices.items():
+        if None in observatories.ObservatoryXYZ.get(obsCode, (None,)):
+            pplogger.error(
+                f"ERROR: observatory code {obsCode} is not a ground-based observatory with a known position."
+            )
+            sys.exit(
+                f"ERROR: observatory code {obsCode} is not a ground-based observatory with a known position."
+            )
+        r_obs[rows], v_obs[rows] = observatories.barycentricObservatoryStates(et.to_numpy()[rows], obsCode)
 
     r_obs /= AU_KM  # convert to au
     v_obs *= (24 * 60 * 60) / AU_KM  # convert to au/day
@@ -253,21 +522,110 @@ def precompute_pointing_information(pointings_df, args, sconfigs):
     pointings_df["v_obs_y"] = v_obs[:, 1]
     pointings_df["v_obs_z"] = v_obs[:, 2]
 
-    # create empty arrays for sun position and velocity to be filled in
-    r_sun = np.empty((len(pointings_df), 3))
-    v_sun = np.empty((len(pointings_df), 3))
-    time_offsets = pointings_df["fieldJD_TDB"] - ephem.jd_ref
-    for idx, time_offset_i in enumerate(time_offsets):
-        sun = ephem.get_particle("Sun", time_offset_i)
-        r_sun[idx] = np.array((sun.x, sun.y, sun.z))
-        v_sun[idx] = np.array((sun.vx, sun.vy, sun.vz))
-
-    pointings_df["r_sun_x"] = r_sun[:, 0]
-    pointings_df["r_sun_y"] = r_sun[:, 1]
-    pointings_df["r_sun_z"] = r_sun[:, 2]
-    pointings_df["v_sun_x"] = v_sun[:, 0]
-    pointings_df["v_sun_y"] = v_sun[:, 1]
-    pointings_df["v_sun_z"] = v_sun[:, 2]
-
-    spice.kclear()
+    sun = context.sun_states.get_states(pointings_df["fieldJD_TDB"].to_numpy())
+
+    pointings_df["r_sun_x"] = sun[:, 0]
+    pointings_df["r_sun_y"] = sun[:, 1]
+    pointings_df["r_sun_z"] = sun[:, 2]
+    pointings_df["v_sun_x"] = sun[:, 3]
+    pointings_df["v_sun_y"] = sun[:, 4]
+    pointings_df["v_sun_z"] = sun[:, 5]
+
+    if cache_path is not None:
+        pplogger.info(f"Writing precomputed pointing information to {cache_path}")
+        write_pointing_cache(
+            cache_path, {column_name: pointings_df[column_name] for column_name in POINTING_CACHE_COLUMNS}
+        )
+
+    if own_context:
+        context.close()
     return pointings_df
+
+
+def pointing_cache_key(pointings_df, auxconfigs, data_dir=None):
+    """Computes the key identifying the precomputed information of a set of pointings,
+    from the pointing times, their observatory codes and the auxiliary files used.
+
+    The auxiliary files are identified by their name, size and modification time,
+    as hashing the content of the ephemeris files would take longer than the
+    precomputation itself.
+
+    Parameters
+    -----------
+    pointings_df : pandas dataframe
+        Contains the telescope pointing database, with the observatory code of each pointing.
+    auxconfigs: dataclass
+        Dataclass of auxiliary configuration file arguments.
+    data_dir : string, default=None
+        The directory holding the auxiliary files. Defaults to the Pooch cache.
+
+    Returns
+    --------
+    : string
+        The hexadecimal key.
+    """
+    data_dir = data_dir or pooch.os_cache("sorcha")
+
+    hasher = hashlib.sha256()
+    hasher.update(f"{POINTING_CACHE_VERSION}|".encode())
+    hasher.update("|".join(pointings_df["observatoryCode"].astype(str)).encode())
+    hasher.update(pointings_df["observationMidpointMJD_TAI"].to_numpy(dtype=np.float64).tobytes())
+    for file_name in sorted(auxconfigs.registry):
+        file_path = os.path.join(data_dir, file_name)
+        if os.path.exists(file_path):
+            file_stat = os.stat(file_path)
+            hasher.update(f"|{file_name}:{file_stat.st_size}:{file_stat.st_mtime_ns}".encode())
+        else:
+            hasher.update(f"|{file_name}".encode())
+
+    return hasher.hexdigest()[:32]
+
+
+def read_pointing_cache(cache_path):
+    """Reads the precomputed pointing information from a cache file.
+
+    Parameters
+    -----------
+    cache_path : string
+        Path of the cache file.
+
+    Returns
+    --------
+    : dictionary or None
+        The cached columns, or None if the file is missing or cannot be read.
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path) as cache:
+            return {column_name: cache[column_name] for column_name in POINTING_CACHE_COLUMNS}
+    except (OSError, KeyError, ValueError):
+        logging.getLogger(__name__).warning(
+            f"WARNING: could not read the pointing cache {cache_path}. It will be recomputed."
+        )
+        return None
+
+
+def write_pointing_cache(cache_path, columns):
+    """Writes the precomputed pointing information to a cache file.
+
+    The file is written under a temporary name and then renamed, so that runs
+    sharing the cache never read a partially written file.
+
+    Parameters
+    -----------
+    cache_path : string
+        Path of the cache file.
+    columns : dictionary
+        The columns to cache, as arrays.
+
+    Returns
+    --------
+    None
+    """
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        np.savez(f, **{column_name: np.asarray(values) for column_name, values in columns.items()})
+    os.replace(temporary_path, cache_path)
@@ -1,14 +1,13 @@
-from sorcha.ephemeris.simulation_parsing import get_perihelion_row
+from sorcha.ephemeris.simulation_parsing import get_perihelion_columns
 from sorcha.lightcurves.lightcurve_registration import LC_METHODS
 from sorcha.activity.activity_registration import CA_METHODS
 
-from collections import namedtuple
 import numpy as np
 import pandas as pd
 
 
 def PPFaintObjectCullingFilter(
-    aux_df, filterpointing, mainfilter, observing_filters, lightcurve_choice, activity_choice
+    aux_df, filterpointing, mainfilter, observing_filters, lightcurve_choice, activity_choice, sun_states=None
 ):
     """Performs a first pass over a dataframe of the orbits and physical parameters information
     to remove any objects that will definitely not be detected.
@@ -37,6 +36,11 @@ def PPFaintObjectCullingFilter(
     activity_choice: None or str
         Name of activity model, if using.
 
+    sun_states: SunStates, default=None
+        Cache of the barycentric states of the Sun, used to move barycentric
+        orbits to heliocentric ones. By default, all the orbits are taken to be
+        heliocentric.
+
     Returns
     --------
     Pandas dataframe
@@ -50,7 +54,7 @@ def PPFaintObjectCullingFilter(
     )
 
     if "q" not in aux_df.columns:
-        aux_df["q"] = PPEstimatePerihelion(aux_df)
+        aux_df["q"] = PPEstimatePerihelion(aux_df, sun_states)
 
     # this only works if object perihelion
     aux_df_dropped = aux_df[aux_df["q"] >= 2]
@@ -100,7 +104,7 @@ def PPFaintObjectCullingFilter(
     return output
 
 
-def PPEstimatePerihelion(aux_df):
+def PPEstimatePerihelion(aux_df, sun_states=None):
     """Estimates perihelion for a dataframe of orbital data given in another format.
 
     Parameters
@@ -108,6 +112,11 @@ def PPEstimatePerihelion(aux_df):
     aux_df : Pandas dataframe
         Dataframe of joined orbits and physical parameters from input files
 
+    sun_states : SunStates, default=None
+        Cache of the barycentric states of the Sun. Barycentric orbits (BCART,
+        BKEP and BCOM) are moved to heliocentric ones with the state of the Sun
+        at the epoch of each orbit. By default, they are taken to be heliocentric.
+
     Returns
     --------
     q : Pandas series
@@ -120,16 +129,17 @@ def PPEstimatePerihelion(aux_df):
     gm_sun = 2.9591220828559115e-04
     gm_total = 2.9630927487993194e-04
 
-    Sun = namedtuple("Sun", "x y z vx vy vz")
+    epochJD_TDB = aux_df["epochMJD_TDB"].to_numpy(dtype=np.float64)
+    # convert from MJD to JD, if not done already.
+    epochJD_TDB = np.where(epochJD_TDB < 2400000.5, epochJD_TDB + 2400000.5, epochJD_TDB)
 
-    # just assume heliocentric
-    sun_epoch = Sun(x=0, y=0, z=0, vx=0, vy=0, vz=0)
+    # without the Sun states, just assume heliocentric
+    states = np.zeros((len(aux_df), 6))
+    if sun_states is not None:
+        barycentric = aux_df["FORMAT"].isin(["BCART", "BKEP", "BCOM"]).to_numpy()
+        if np.any(barycentric):
+            states[barycentric] = sun_states.get_states(epochJD_TDB[barycentric])
 
-    epochJD_TDB = aux_df["epochMJD_TDB"].iloc[0]  # what if the epoch is different for different objects?
-    sun_dict = {epochJD_TDB: sun_epoch}
-
-    q = aux_df.apply(
-        lambda row: get_perihelion_row(row, epochJD_TDB, None, sun_dict, gm_sun, gm_total)[0], axis=1
-    )
+    elements = get_perihelion_columns(aux_df, epochJD_TDB, states, gm_sun, gm_total)
 
-    return q
+    return pd.Series(elements[:, 0], index=aux_df.index)
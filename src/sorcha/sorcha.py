@@ -8,8 +8,8 @@ import pandas as pd
 import os
 import logging
 
-from sorcha.ephemeris.simulation_driver import create_ephemeris
-from sorcha.ephemeris.simulation_setup import precompute_pointing_information
+from sorcha.ephemeris.simulation_driver import create_ephemeris, log_cache_counts
+from sorcha.ephemeris.simulation_setup import EphemerisContext, precompute_pointing_information
 
 from sorcha.modules.PPReadPointingDatabase import PPReadPointingDatabase
 from sorcha.modules.PPLinkingFilter import PPLinkingFilter
@@ -40,6 +40,7 @@ from sorcha.activity.activity_registration import update_activity_subclasses
 from sorcha.lightcurves.lightcurve_registration import update_lc_subclasses
 
 from sorcha.utilities.sorchaArguments import sorchaArguments
+from sorcha.utilities.sorchaCheckpoint import sorchaCheckpoint
 from sorcha.utilities.sorchaConfigs import sorchaConfigs, PrintConfigsToLog
 from sorcha.utilities.sorchaCommandLineParser import sorchaCommandLineParser
 from sorcha.utilities.fileAccessUtils import FindFileOrExit
@@ -136,8 +137,12 @@ def runLSSTSimulation(args, sconfigs, return_only=False):
     # if we are going to compute the ephemerides, then we should pre-compute all
     # of the needed values derived from the pointing information.
     if sconfigs.input.ephemerides_type.casefold() != "external":
+        # the ASSIST ephemeris, SPICE kernels and observatory positions are set up once for the whole run
+        ephemeris_context = EphemerisContext(args, sconfigs)
         verboselog("Pre-computing pointing information for ephemeris generation")
-        filterpointing = precompute_pointing_information(filterpointing, args, sconfigs)
+        filterpointing = precompute_pointing_information(
+            filterpointing, args, sconfigs, context=ephemeris_context
+        )
 
     # Set up the data readers.
     ephem_type = sconfigs.input.ephemerides_type
@@ -171,6 +176,22 @@ def runLSSTSimulation(args, sconfigs, return_only=False):
     # Get number of objects in total.
     lenf = len(reader.aux_data_readers[0].obj_id_table)
 
+    # The checkpoint is rewritten before every chunk of every run that writes its output, with
+    # or without --resume, so that any interrupted run can be resumed.
+    checkpoint = None
+    if not return_only:
+        checkpoint = sorchaCheckpoint(args, sconfigs, lenf)
+        if args.resume:
+            startChunk, finished = checkpoint.resume()
+            if finished:
+                pplogger.info("The run being resumed had already completed. No output will be written.")
+                if sconfigs.input.ephemerides_type.casefold() != "external":
+                    ephemeris_context.close()
+                return
+            endChunk = startChunk
+            loopCounter = startChunk // sconfigs.input.size_serial_chunk
+            reader.block_start = startChunk
+
     footprint = None
     if sconfigs.fov.camera_model == "footprint":
         verboselog("Creating sensor footprint object for filtering")
@@ -182,6 +203,9 @@ def runLSSTSimulation(args, sconfigs, return_only=False):
         result_stats = []
 
     while endChunk < lenf:
+        if checkpoint is not None:
+            checkpoint.save(startChunk)
+
         verboselog("Starting main Sorcha processing loop round {}".format(loopCounter))
         endChunk = startChunk + sconfigs.input.size_serial_chunk
         verboselog("Working on objects {}-{}".format(startChunk, endChunk))
@@ -207,6 +231,7 @@ def runLSSTSimulation(args, sconfigs, return_only=False):
                     sconfigs.filters.observing_filters,
                     sconfigs.lightcurve.lc_model,
                     sconfigs.activity.comet_activity,
+                    sun_states=ephemeris_context.sun_states,
                 )
                 verboselog(
                     "Number of rows After removing faint objects in faint object culling filter: "
@@ -221,7 +246,9 @@ def runLSSTSimulation(args, sconfigs, return_only=False):
                     continue
 
             verboselog("Starting ephemeris generation")
-            observations = create_ephemeris(orbits_df, filterpointing, args, sconfigs)
+            observations = create_ephemeris(
+                orbits_df, filterpointing, args, sconfigs, context=ephemeris_context
+            )
             verboselog("Ephemeris generation completed")
 
         verboselog("Start post processing for this chunk")
@@ -393,12 +420,19 @@ def runLSSTSimulation(args, sconfigs, return_only=False):
         loopCounter = loopCounter + 1
         # end for
 
+    if sconfigs.input.ephemerides_type.casefold() != "external":
+        log_cache_counts(ephemeris_context.cache_counts, verboselog)
+        ephemeris_context.close()
+
     if sconfigs.output.output_format == "sqlite3" and os.path.isfile(
         os.path.join(args.outpath, args.outfilestem + ".db")
     ):
         pplogger.info("Indexing output SQLite database...")
         PPIndexSQLDatabase(os.path.join(args.outpath, args.outfilestem + ".db"))
 
+    if checkpoint is not None:
+        checkpoint.save(lenf, finished=True)
+
     pplogger.info("Sorcha process is completed.")
 
     if return_only:
@@ -37,6 +37,9 @@ class sorchaArguments:
     linking: bool = True
     """Turns on or off the rejection of unlinked sources"""
 
+    resume: bool = False
+    """Resume an interrupted run from its checkpoint"""
+
     _rngs = None
     """A collection of per-module random number generators"""
 
@@ -79,6 +82,7 @@ class sorchaArguments:
         self.visits = args["visits_database"]
 
         self.surveyname = args["surveyname"]
+        self.resume = args.get("resume", False)
 
         if "complex_physical_parameters" in args.keys():
             self.complex_parameters = args["complex_physical_parameters"]
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+from sorcha.utilities.sorchaModuleRNG import PerModuleRNG
+
+
+class sorchaCheckpoint:
+    """
+    Checkpoint of a run, kept in the output directory and rewritten before
+    every chunk of objects. It records the chunks of objects completed so far,
+    the states of the random number generators and the size of every output
+    file, so that an interrupted run can be resumed from the next chunk and
+    give the same output as an uninterrupted run.
+    """
+
+    def __init__(self, args, sconfigs, n_objects):
+        """
+        Initialization function for the class
+
+        Parameters
+        ----------
+        args: sorchaArguments object or similar
+            Command-line arguments from Sorcha.
+        sconfigs: dataclass
+            Dataclass of configuration file arguments.
+        n_objects: int
+            Number of objects in the input files.
+        """
+        self.args = args
+        self.sconfigs = sconfigs
+        self.n_objects = n_objects
+        self.filename = os.path.join(args.outpath, args.outfilestem + "_checkpoint.json")
+
+    def output_files(self):
+        """
+        Paths of the output files that are appended to chunk by chunk
+
+        Returns
+        -------
+        files: list of strings
+            Paths of the output files, which may not exist yet.
+        """
+        args, sconfigs = self.args, self.sconfigs
+
+        suffix = {"csv": ".csv", "sqlite3": ".db", "hdf5": ".h5", "h5": ".h5"}
+        files = [os.path.join(args.outpath, args.outfilestem + suffix[sconfigs.output.output_format])]
+        if args.stats is not None:
+            files.append(os.path.join(args.outpath, args.stats + ".csv"))
+        if (
+            getattr(args, "output_ephemeris_file", None)
+            and sconfigs.input.ephemerides_type.casefold() == "ar"
+        ):
+            ephemeris_suffix = ".csv" if sconfigs.input.eph_format in ["csv", "whitespace"] else ".h5"
+            files.append(os.path.join(args.outpath, args.output_ephemeris_file + ephemeris_suffix))
+        return files
+
+    def run_description(self):
+        """
+        Description of the inputs of the run, which must not change when it is resumed
+
+        Returns
+        -------
+        description: dictionary
+            Chunk size, number of objects, hash of the configuration file and
+            sizes of the input files.
+        """
+        args = self.args
+
+        with open(args.configfile, "rb") as f:
+            config_hash = hashlib.sha256(f.read()).hexdigest()
+
+        inputs = [
+            args.paramsinput,
+            args.orbinfile,
+            args.input_ephemeris_file,
+            args.complex_parameters,
+            args.pointing_database,
+        ]
+        return {
+            "size_serial_chunk": self.sconfigs.input.size_serial_chunk,
+            "n_objects": self.n_objects,
+            "config_sha256": config_hash,
+            "input_sizes": {path: os.path.getsize(path) for path in inputs if path},
+        }
+
+    def save(self, next_object, finished=False):
+        """
+        Writes the checkpoint, replacing the previous one in a single step
+
+        Parameters
+        ----------
+        next_object: int
+            Index of the first object of the next chunk. All the objects
+            before it have been processed and their output written.
+        finished: bool, default=False
+            Whether the run has completed.
+        """
+        size = self.sconfigs.input.size_serial_chunk
+        manifest = self.run_description()
+        manifest.update(
+            {
+                "seed": self.args._rngs.base_seed,
+                "completed_chunks": [[i, min(i + size, self.n_objects)] for i in range(0, next_object, size)],
+                "next_object": next_object,
+                "rng_states": self.args._rngs.get_states(),
+                "output_offsets": {
+                    os.path.relpath(path, self.args.outpath): measure_output(path)
+                    for path in self.output_files()
+                },
+                "finished": finished,
+            }
+        )
+
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_filename, self.filename)
+
+    def resume(self):
+        """
+        Restores the state of the run from the checkpoint: the output files are
+        cut back to their sizes when the checkpoint was written, and the random
+        number generators are restored.
+
+        Returns
+        -------
+        next_object: int
+            Index of the first object of the next chunk to process.
+        finished: bool
+            Whether the checkpointed run had already completed.
+        """
+        pplogger = logging.getLogger(__name__)
+
+        if not os.path.isfile(self.filename):
+            pplogger.error(f"ERROR: no checkpoint to resume from at {self.filename}.")
+            sys.exit(f"ERROR: no checkpoint to resume from at {self.filename}.")
+
+        with open(self.filename) as f:
+            manifest = json.load(f)
+
+        for key, value in self.run_description().items():
+            if manifest[key] != value:
+                pplogger.error(f"ERROR: {key} has changed since the checkpoint was written. Cannot resume.")
+                sys.exit(f"ERROR: {key} has changed since the checkpoint was written. Cannot resume.")
+
+        if manifest["finished"]:
+            return manifest["next_object"], True
+
+        for path in self.output_files():
+            truncate_output(path, manifest["output_offsets"].get(os.path.relpath(path, self.args.outpath)))
+
+        self.args._rngs = PerModuleRNG(manifest["seed"], self.args.pplogger)
+        self.args._rngs.set_states(manifest["rng_states"])
+
+        pplogger.info(
+            f"Resuming from the checkpoint {self.filename}, "
+            f"with {len(manifest['completed_chunks'])} chunks completed."
+        )
+        return manifest["next_object"], False
+
+
+def measure_output(path):
+    """
+    Measures how much has been written to an output file
+
+    Parameters
+    ----------
+    path: string
+        Path of a CSV, SQLite or HDF5 output file.
+
+    Returns
+    -------
+    offset: None, int or dictionary
+        None if the file does not exist, the size in bytes of a CSV file,
+        or the number of rows of each table of a SQLite or HDF5 file.
+    """
+    if not os.path.isfile(path):
+        return None
+
+    if path.endswith(".db"):
+        cnx = sqlite3.connect(path)
+        tables = [t for (t,) in cnx.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        # the tables are only appended to, so their rowids run from 1 to the number of rows
+        offset = {t: cnx.execute(f'SELECT MAX(rowid) FROM "{t}"').fetchone()[0] or 0 for t in tables}
+        cnx.close()
+        return offset
+
+    if path.endswith(".h5"):
+        with pd.HDFStore(path, mode="r") as store:
+            return {key: int(store.get_storer(key).nrows) for key in _hdf5_tables(store)}
+
+    return os.path.getsize(path)
+
+
+def _hdf5_tables(store):
+    """Keys of the tables of an HDF5 output file, without the metadata that pandas keeps for them"""
+    return [key for key in store.keys() if "/meta/" not in key]
+
+
+def truncate_output(path, offset):
+    """
+    Cuts an output file back to what had been written to it when it was measured
+
+    Parameters
+    ----------
+    path: string
+        Path of a CSV, SQLite or HDF5 output file.
+    offset: None, int or dictionary
+        Measure of the file, as returned by measure_output.
+    """
+    if offset is None:
+        if os.path.isfile(path):
+            os.remove(path)
+        return
+
+    if path.endswith(".db"):
+        cnx = sqlite3.connect(path)
+        # the indices are only created once the run completes
+        indices = cnx.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"
+        ).fetchall()
+        for (name,) in indices:
+            cnx.execute(f'DROP INDEX "{name}"')
+        for (table,) in cnx.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+            if table in offset:
+                cnx.execute(f'DELETE FROM "{table}" WHERE rowid > ?', (offset[table],))
+            else:
+                cnx.execute(f'DROP TABLE "{table}"')
+        cnx.commit()
+        cnx.close()
+    elif path.endswith(".h5"):
+        with pd.HDFStore(path) as store:
+            for key in _hdf5_tables(store):
+                if key not in offset:
+                    store.remove(key)
+                elif store.get_storer(key).nrows > offset[key]:
+                    store.remove(key, start=offset[key])
+    else:
+        os.truncate(path, offset)
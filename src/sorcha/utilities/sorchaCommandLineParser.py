@@ -82,8 +82,11 @@ def sorchaCommandLineParser(args):
     else:
         cmd_args_dict["visits_database"] = args.vd
 
+    # a resumed run appends to the output files of the interrupted one
+    cmd_args_dict["resume"] = args.resume
+
     # if a value was provided, warn the user about overwriting if the file exists
-    if cmd_args_dict["output_ephemeris_file"]:
+    if cmd_args_dict["output_ephemeris_file"] and not cmd_args_dict["resume"]:
         warn_or_remove_file(
             os.path.join(cmd_args_dict["outpath"], cmd_args_dict["output_ephemeris_file"] + ".*"),
             args.f,
@@ -95,7 +98,7 @@ def sorchaCommandLineParser(args):
     cmd_args_dict["loglevel"] = args.l
     cmd_args_dict["stats"] = args.st
 
-    if cmd_args_dict["stats"] is not None:
+    if cmd_args_dict["stats"] is not None and not cmd_args_dict["resume"]:
         warn_or_remove_file(
             os.path.join(cmd_args_dict["outpath"], cmd_args_dict["stats"] + ".csv"), args.f, pplogger
         )
@@ -104,9 +107,10 @@ def sorchaCommandLineParser(args):
     if cmd_args_dict["ar_data_path"]:
         FindDirectoryOrExit(cmd_args_dict["ar_data_path"], "-ar, --ar_data_path")
 
-    warn_or_remove_file(
-        os.path.join(cmd_args_dict["outpath"], cmd_args_dict["outfilestem"] + ".*"), args.f, pplogger
-    )
+    if not cmd_args_dict["resume"]:
+        warn_or_remove_file(
+            os.path.join(cmd_args_dict["outpath"], cmd_args_dict["outfilestem"] + ".*"), args.f, pplogger
+        )
 
     # Log all the command line settings to INFO.
     for flag, value in cmd_args_dict.items():
@@ -71,6 +71,15 @@ class simulationConfigs:
     ar_picket: float = None
     """imprecise discretization of time that allows us to move progress our simulations forward without getting too granular when we don't have to. the unit is number of days."""
 
+    ar_picket_min: float = None
+    """shortest picket interval, in days, used for fast-moving objects. defaults to ar_picket."""
+
+    ar_picket_max: float = None
+    """longest picket interval, in days, used for slow-moving objects. defaults to ar_picket."""
+
+    ar_picket_max_motion: float = 2.0
+    """largest angular motion of an object over its picket interval, in degrees, when the picket interval adapts to each object (default: 2.0)"""
+
     ar_obs_code: str = None
     """the obscode is the MPC observatory code for the provided telescope."""
 
@@ -80,6 +89,45 @@ class simulationConfigs:
     ar_n_sub_intervals: int = 101
     """Number of sub-intervals for the Lagrange ephemerides interpolation (default: 101)"""
 
+    ar_n_workers: int = 1
+    """Number of worker processes the ephemeris generation is spread over (default: 1)"""
+
+    ar_particles_per_sim: int = 1
+    """Largest number of objects sharing an ASSIST simulation in the ephemeris generation (default: 1)"""
+
+    ar_lt_tolerance: float = 1e-9
+    """Convergence tolerance of the light travel time iterations, in days (default: 1e-9)"""
+
+    ar_interpolation: str = "lagrange"
+    """Interpolation of the sky positions between integrations: 'lagrange' (three pickets) or 'chebyshev' (default: lagrange)"""
+
+    ar_chebyshev_order: int = 8
+    """Order of the Chebyshev polynomials when ar_interpolation is chebyshev (default: 8)"""
+
+    ar_chebyshev_window: float = 16.0
+    """Longest window, in days, a Chebyshev polynomial is fitted over (default: 16.0)"""
+
+    ar_chebyshev_tolerance: float = 1e-3
+    """Largest estimated Chebyshev interpolation error, in degrees, before the window of an object is halved (default: 1e-3)"""
+
+    ar_prune_horizon: float = None
+    """Time, in days, for which the objects that cannot reach any pointing are left out of the picket refreshes (default: no pruning)"""
+
+    ar_state_grid_spacing: float = None
+    """Spacing, in days, of the nodes the states of the objects in the fields are interpolated from over each night of visits (default: no interpolation, the objects are integrated to every visit)"""
+
+    ar_sweep: str = "pointing"
+    """How the objects in each field are found: 'pointing' walks through the pointings, 'object' follows the objects, 'auto' picks one from the numbers of objects and pointings (default: pointing)"""
+
+    ar_propagator: str = "assist"
+    """How the objects are propagated: 'assist' integrates them all with ASSIST, 'kepler' propagates the objects within ar_kepler_tolerance of their integration on two-body orbits (default: assist)"""
+
+    ar_kepler_tolerance: float = 0.01
+    """Largest bound on the angular error, in arcseconds, of an object propagated on a two-body orbit when ar_propagator is kepler (default: 0.01)"""
+
+    ar_pointing_cache: str = None
+    """Directory in which the precomputed pointing information is cached and reused between runs (default: no caching)"""
+
     _ephemerides_type: str = None
     """Simulation used for ephemeris input."""
 
@@ -113,8 +161,40 @@ class simulationConfigs:
             self.ar_ang_fov = cast_as_float(self.ar_ang_fov, "ar_ang_fov")
             self.ar_fov_buffer = cast_as_float(self.ar_fov_buffer, "ar_fov_buffer")
             self.ar_picket = cast_as_int(self.ar_picket, "ar_picket")
+            self._validate_picket_intervals()
             self.ar_healpix_order = cast_as_int(self.ar_healpix_order, "ar_healpix_order")
             self.ar_n_sub_intervals = cast_as_int(self.ar_n_sub_intervals, "ar_n_sub_intervals")
+            self.ar_n_workers = cast_as_int(self.ar_n_workers, "ar_n_workers")
+            if self.ar_n_workers < 1:
+                logging.error("ERROR: ar_n_workers must be a positive integer.")
+                sys.exit("ERROR: ar_n_workers must be a positive integer.")
+            self.ar_particles_per_sim = cast_as_int(self.ar_particles_per_sim, "ar_particles_per_sim")
+            if self.ar_particles_per_sim < 1:
+                logging.error("ERROR: ar_particles_per_sim must be a positive integer.")
+                sys.exit("ERROR: ar_particles_per_sim must be a positive integer.")
+            self.ar_lt_tolerance = cast_as_float(self.ar_lt_tolerance, "ar_lt_tolerance")
+            if self.ar_lt_tolerance <= 0:
+                logging.error("ERROR: ar_lt_tolerance must be positive.")
+                sys.exit("ERROR: ar_lt_tolerance must be positive.")
+            if self.ar_prune_horizon is not None:
+                self.ar_prune_horizon = cast_as_float(self.ar_prune_horizon, "ar_prune_horizon")
+                if self.ar_prune_horizon <= 0:
+                    logging.error("ERROR: ar_prune_horizon must be positive.")
+                    sys.exit("ERROR: ar_prune_horizon must be positive.")
+            if self.ar_state_grid_spacing is not None:
+                self.ar_state_grid_spacing = cast_as_float(
+                    self.ar_state_grid_spacing, "ar_state_grid_spacing"
+                )
+                if self.ar_state_grid_spacing <= 0:
+                    logging.error("ERROR: ar_state_grid_spacing must be positive.")
+                    sys.exit("ERROR: ar_state_grid_spacing must be positive.")
+            check_value_in_list(self.ar_sweep, ["auto", "pointing", "object"], "ar_sweep")
+            check_value_in_list(self.ar_propagator, ["assist", "kepler"], "ar_propagator")
+            self.ar_kepler_tolerance = cast_as_float(self.ar_kepler_tolerance, "ar_kepler_tolerance")
+            if self.ar_kepler_tolerance <= 0:
+                logging.error("ERROR: ar_kepler_tolerance must be positive.")
+                sys.exit("ERROR: ar_kepler_tolerance must be positive.")
+            self._validate_interpolation()
         elif self._ephemerides_type == "external":
             # makes sure when these are not needed that they are not populated
             check_key_doesnt_exist(self.ar_ang_fov, "ar_ang_fov", "but ephemerides type is external")
@@ -125,6 +205,66 @@ class simulationConfigs:
                 self.ar_healpix_order, "ar_healpix_order", "but ephemerides type is external"
             )
 
+    def _validate_picket_intervals(self):
+        """
+        Validates the adaptive picket interval attributes.
+
+        Parameters
+        -----------
+        None.
+
+        Returns
+        ----------
+        None
+        """
+        self.ar_picket_min = (
+            self.ar_picket
+            if self.ar_picket_min is None
+            else cast_as_float(self.ar_picket_min, "ar_picket_min")
+        )
+        self.ar_picket_max = (
+            self.ar_picket
+            if self.ar_picket_max is None
+            else cast_as_float(self.ar_picket_max, "ar_picket_max")
+        )
+        self.ar_picket_max_motion = cast_as_float(self.ar_picket_max_motion, "ar_picket_max_motion")
+
+        if not 0 < self.ar_picket_min <= self.ar_picket <= self.ar_picket_max:
+            logging.error(
+                "ERROR: picket intervals must satisfy 0 < ar_picket_min <= ar_picket <= ar_picket_max."
+            )
+            sys.exit("ERROR: picket intervals must satisfy 0 < ar_picket_min <= ar_picket <= ar_picket_max.")
+        if self.ar_picket_max_motion <= 0:
+            logging.error("ERROR: ar_picket_max_motion must be positive.")
+            sys.exit("ERROR: ar_picket_max_motion must be positive.")
+
+    def _validate_interpolation(self):
+        """
+        Validates the sky position interpolation attributes.
+
+        Parameters
+        -----------
+        None.
+
+        Returns
+        ----------
+        None
+        """
+        check_value_in_list(self.ar_interpolation, ["lagrange", "chebyshev"], "ar_interpolation")
+        self.ar_chebyshev_order = cast_as_int(self.ar_chebyshev_order, "ar_chebyshev_order")
+        self.ar_chebyshev_window = cast_as_float(self.ar_chebyshev_window, "ar_chebyshev_window")
+        self.ar_chebyshev_tolerance = cast_as_float(self.ar_chebyshev_tolerance, "ar_chebyshev_tolerance")
+
+        if self.ar_chebyshev_order < 2:
+            logging.error("ERROR: ar_chebyshev_order must be at least 2.")
+            sys.exit("ERROR: ar_chebyshev_order must be at least 2.")
+        if self.ar_chebyshev_window <= 0:
+            logging.error("ERROR: ar_chebyshev_window must be positive.")
+            sys.exit("ERROR: ar_chebyshev_window must be positive.")
+        if self.ar_chebyshev_tolerance <= 0:
+            logging.error("ERROR: ar_chebyshev_tolerance must be positive.")
+            sys.exit("ERROR: ar_chebyshev_tolerance must be positive.")
+
 
 @dataclass
 class filtersConfigs:
@@ -1711,9 +1851,59 @@ def PrintConfigsToLog(sconfigs, cmd_args):
         pplogger.info("...the field's angular FOV is: " + str(sconfigs.simulation.ar_ang_fov))
         pplogger.info("...the buffer around the FOV is: " + str(sconfigs.simulation.ar_fov_buffer))
         pplogger.info("...the picket interval is: " + str(sconfigs.simulation.ar_picket))
+        if sconfigs.simulation.ar_picket_min != sconfigs.simulation.ar_picket_max:
+            pplogger.info(
+                "...the picket interval adapts to each object between: "
+                + str(sconfigs.simulation.ar_picket_min)
+                + " and "
+                + str(sconfigs.simulation.ar_picket_max)
+            )
+            pplogger.info(
+                "...the largest angular motion over a picket interval is: "
+                + str(sconfigs.simulation.ar_picket_max_motion)
+            )
         pplogger.info("...the observatory code is: " + str(sconfigs.simulation.ar_obs_code))
         pplogger.info("...the healpix order is: " + str(sconfigs.simulation.ar_healpix_order))
         pplogger.info("...the number of sub-intervals is: " + str(sconfigs.simulation.ar_n_sub_intervals))
+        pplogger.info("...the number of worker processes is: " + str(sconfigs.simulation.ar_n_workers))
+        pplogger.info(
+            "...the number of objects per ASSIST simulation is: "
+            + str(sconfigs.simulation.ar_particles_per_sim)
+        )
+        pplogger.info("...the light travel time tolerance is: " + str(sconfigs.simulation.ar_lt_tolerance))
+        pplogger.info("...the sky position interpolation is: " + str(sconfigs.simulation.ar_interpolation))
+        if sconfigs.simulation.ar_interpolation == "chebyshev":
+            pplogger.info(
+                "...the Chebyshev polynomial order is: " + str(sconfigs.simulation.ar_chebyshev_order)
+            )
+            pplogger.info(
+                "...the longest Chebyshev window is: " + str(sconfigs.simulation.ar_chebyshev_window)
+            )
+            pplogger.info(
+                "...the Chebyshev error tolerance is: " + str(sconfigs.simulation.ar_chebyshev_tolerance)
+            )
+        pplogger.info("...the ephemeris sweep is: " + str(sconfigs.simulation.ar_sweep))
+        if sconfigs.simulation.ar_prune_horizon is not None:
+            pplogger.info(
+                "...the picket refreshes are pruned over a horizon of: "
+                + str(sconfigs.simulation.ar_prune_horizon)
+            )
+        if sconfigs.simulation.ar_state_grid_spacing is not None:
+            pplogger.info(
+                "...the states of the objects in the fields are interpolated from nodes spaced by: "
+                + str(sconfigs.simulation.ar_state_grid_spacing)
+            )
+        pplogger.info("...the propagator is: " + str(sconfigs.simulation.ar_propagator))
+        if sconfigs.simulation.ar_propagator == "kepler":
+            pplogger.info(
+                "...the two-body propagation error tolerance is: "
+                + str(sconfigs.simulation.ar_kepler_tolerance)
+            )
+        if sconfigs.simulation.ar_pointing_cache:
+            pplogger.info(
+                "...the precomputed pointing information is cached in: "
+                + str(sconfigs.simulation.ar_pointing_cache)
+            )
     else:
         pplogger.info("ASSIST+REBOUND Simulation is turned OFF.")
 
@@ -49,3 +49,33 @@ class PerModuleRNG:
             self.pplogger.info(f"the rng seed for the {module_name} module is {module_seed}")
 
         return new_rng
+
+    @property
+    def base_seed(self):
+        """The base seed of the random number generators"""
+        return self._base_seed
+
+    def get_states(self):
+        """
+        Return the states of all the random number generators created so far.
+
+        Returns
+        ----------
+        states : dictionary
+            The bit generator state of each random number generator, keyed
+            by module name.
+        """
+        return {name: rng.bit_generator.state for name, rng in self._rngs.items()}
+
+    def set_states(self, states):
+        """
+        Restore the states of random number generators, creating them as needed.
+
+        Parameters
+        -----------
+        states : dictionary
+            The bit generator state of each random number generator, keyed
+            by module name, as returned by get_states.
+        """
+        for module_name, state in states.items():
+            self.getModuleRNG(module_name).bit_generator.state = state
@@ -96,6 +96,13 @@ def main():
         action="store_true",
         default=False,
     )
+    optional.add_argument(
+        "--resume",
+        help="Resume an interrupted run from the checkpoint in the output directory. Default False.",
+        dest="resume",
+        action="store_true",
+        default=False,
+    )
     optional.add_argument(
         "-s", "--survey", help="Survey to simulate", type=str, dest="s", default="rubin_sim"
     )
@@ -228,6 +235,9 @@ def execute(args):
             )
         )
     elif cmd_args["surveyname"] in ["DES", "des"]:
+        if cmd_args["resume"]:
+            pplogger.error("ERROR: --resume is not supported for the DES survey")
+            sys.exit("ERROR: --resume is not supported for the DES survey")
         try:
             args = sorchaArguments(cmd_args)
         except Exception as err:
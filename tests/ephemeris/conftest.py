@@ -0,0 +1,17 @@
+import pytest
+
+
+class KeplerExtras:
+    """Stands in for the ASSIST extras of a plain two-body REBOUND simulation."""
+
+    def __init__(self, sim):
+        self.sim = sim
+
+    def integrate_or_interpolate(self, t):
+        self.sim.integrate(t, exact_finish_time=1)
+
+
+@pytest.fixture
+def kepler_extras():
+    """Makes the stand-ins for the ASSIST extras of plain two-body REBOUND simulations."""
+    return KeplerExtras
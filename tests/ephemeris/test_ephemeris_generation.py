@@ -155,6 +155,46 @@ def test_ephemeris_end2end(single_synthetic_pointing, tmp_path):
         assert not re.match(r".+\.csv", file)
 
 
+def test_ephemeris_n_workers(single_synthetic_pointing, tmp_path):
+    cmd_args_dict = {
+        "paramsinput": get_test_filepath("PPReadAllInput_params.txt"),
+        "orbinfile": get_test_filepath("PPReadAllInput_orbits.des"),
+        "configfile": get_test_filepath("test_ephem_config.ini"),
+        "pointing_database": get_demo_filepath("baseline_v2.0_1yr.db"),
+        "outpath": tmp_path,
+        "surveyname": "rubin_sim",
+        "outfilestem": f"out_400k",
+        "loglevel": False,
+        "stats": None,
+        "visits_database": None,
+    }
+
+    args = sorchaArguments(cmd_args_dict)
+    configs = sorchaConfigs(args.configfile, args.surveyname)
+
+    filterpointing = PPReadPointingDatabase(
+        args.pointing_database,
+        configs.filters.observing_filters,
+        configs.input.pointing_sql_query,
+        "rubin_sim",
+    )
+    filterpointing = precompute_pointing_information(filterpointing, args, configs)
+
+    # a few objects on neighbouring orbits, so that the shards share pointings
+    orbits_df = pd.concat([single_synthetic_pointing] * 4, ignore_index=True)
+    orbits_df["ObjID"] = ["6", "7", "8", "9"]
+    orbits_df["xdot"] *= [1.0, 1.0002, 0.9998, 1.0004]
+
+    configs.simulation.ar_n_workers = 1
+    serial = create_ephemeris(orbits_df.copy(), filterpointing, args, configs)
+    configs.simulation.ar_n_workers = 2
+    sharded = create_ephemeris(orbits_df.copy(), filterpointing, args, configs)
+
+    assert serial["ObjID"].nunique() > 1
+    # the rows, and their order, do not depend on the number of workers
+    pd.testing.assert_frame_equal(sharded, serial)
+
+
 def test_ephemeris_writeread_csv(single_synthetic_ephemeris, tmp_path):
     """Tests to ensure the ephemeris file is written out correctly AND
     can be read back in by Sorcha. CSV version.
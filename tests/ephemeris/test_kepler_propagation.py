@@ -0,0 +1,76 @@
+import numpy as np
+import rebound
+
+from sorcha.ephemeris.kepler_propagation import KeplerSimulation, kepler_error_bound
+from sorcha.ephemeris.simulation_constants import MAX_OBSERVER_DISTANCE, PERTURBER_GM
+from sorcha.ephemeris.simulation_geometry import integrate_light_time_objects
+
+GM_SUN = PERTURBER_GM[0]
+
+
+def make_two_body_simulation():
+    sim = rebound.Simulation()
+    sim.G = 1.0
+    sim.add(m=GM_SUN)
+    for a, e, inc in [(45.0, 0.1, 0.2), (2.5, 0.2, 0.05), (-300.0, 1.5, 1.0)]:
+        sim.add(a=a, e=e, inc=inc, f=1.0)
+    return sim
+
+
+def test_kepler_simulation():
+    sim = make_two_body_simulation()
+    states = np.array([[*p.xyz, *p.vxyz] for p in sim.particles[1:]])
+    kepler = KeplerSimulation(GM_SUN, states, np.zeros(3))
+    assert kepler.N == 3
+
+    for t in (30.0, -12.5):
+        sim.integrate(t, exact_finish_time=1)
+        kepler.integrate_or_interpolate(t)
+        xyz, vxyz = np.empty((3, 3)), np.empty((3, 3))
+        kepler.serialize_particle_data(xyz=xyz, vxvyvz=vxyz)
+        for i, particle in enumerate(kepler.particles):
+            assert np.allclose(xyz[i], sim.particles[i + 1].xyz, rtol=1e-12, atol=0)
+            assert np.allclose(vxyz[i], sim.particles[i + 1].vxyz, rtol=1e-11, atol=0)
+            assert np.array_equal(particle.xyz, xyz[i])
+            assert np.array_equal(particle.vxyz, vxyz[i])
+
+    # the simulation stands in for both an ASSIST simulation and its extras
+    r_obs = np.array([0.5, -0.8, 0.1])
+    sim_dict = {k: {"sim": kepler, "ex": kepler, "index": k} for k in range(3)}
+    rho, rho_mag, lt, r_ast, v_ast = integrate_light_time_objects(sim_dict, [2, 0], 10.0, r_obs, lt0=0.01)
+    for k, r_ast_k in zip([2, 0], r_ast):
+        exact = make_two_body_simulation()
+        exact.integrate(10.0 - np.linalg.norm(r_ast_k - r_obs) / 173.1446326846693, exact_finish_time=1)
+        assert np.allclose(r_ast_k, exact.particles[k + 1].xyz, rtol=0, atol=1e-9)
+
+
+def test_kepler_error_bound():
+    # the Sun and the giant planets, with the objects as test particles
+    rng = np.random.default_rng(11)
+    sim = rebound.Simulation()
+    sim.G = 1.0
+    sim.add(m=GM_SUN)
+    for gm, a in zip(PERTURBER_GM[5:9], [5.2, 9.58, 19.2, 30.07]):
+        sim.add(m=gm, a=a, f=rng.uniform(0, 2 * np.pi), primary=sim.particles[0])
+    sim.N_active = sim.N
+    for a, e, inc in [(45.0, 0.05, 0.2), (300.0, 0.8, 1.0), (80.0, 0.3, 0.4), (12.0, 0.1, 0.1)]:
+        sim.add(a=a, e=e, inc=inc, f=2.0, primary=sim.particles[0])
+    sim.move_to_com()
+
+    objects = range(5, sim.N)
+    states = np.array([[*sim.particles[k].xyz, *sim.particles[k].vxyz] for k in objects])
+    mu = np.sum(PERTURBER_GM[[0, 5, 6, 7, 8]])
+    kepler = KeplerSimulation(mu, states, np.zeros(len(states)))
+
+    for t in (10.0, 365.0):
+        sim.integrate(t, exact_finish_time=1)
+        kepler.integrate_or_interpolate(t)
+        xyz = np.array([sim.particles[k].xyz for k in objects])
+        error = np.linalg.norm(xyz - kepler.states[:, :3], axis=1) / (
+            np.linalg.norm(xyz, axis=1) - MAX_OBSERVER_DISTANCE
+        )
+
+        bound = kepler_error_bound(mu, states, np.zeros(len(states)), 0.0, t)
+        assert np.all(error[:3] <= bound[:3])
+        # the bound does not hold within the orbits of the planets
+        assert bound[3] == np.inf
@@ -276,3 +276,88 @@ def test_orbit_conversion_realdata():
     assert np.isclose(orbit_types["KEP"]["node"], newlan * 180 / np.pi, 1e-8)
     assert np.isclose(orbit_types["KEP"]["argPeri"], newaop * 180 / np.pi, 1e-8)
     assert np.isclose(orbit_types["KEP"]["ma"] - 360.0, newma * 180 / np.pi, 1e-8)  # same
+
+
+def make_mixed_orbits():
+    """Returns a dataframe of random orbits in all the supported formats, with (made-up) Sun states
+    at two epochs and the epoch of each orbit"""
+    import pandas as pd
+    from collections import namedtuple
+
+    # hardcoded (made-up) Sun states at two epochs, as in test_orbit_conversion_realdata
+    Sun = namedtuple("Sun", "x y z vx vy vz")
+    epochs = np.array([2457545.5, 2460000.5])
+    sun_dict = {
+        epochs[0]: Sun(3.74e-03, 2.36e-03, 8.44e-04, -7.10e-07, 6.42e-06, 2.79e-06),
+        epochs[1]: Sun(-2.51e-03, 6.10e-03, 2.67e-03, -7.91e-06, -1.32e-06, -3.70e-07),
+    }
+
+    rng = np.random.default_rng(2024)
+    formats = ["COM", "BCOM", "KEP", "BKEP", "CART", "BCART"] * 4
+    n = len(formats)
+    a = rng.uniform(0.8, 40.0, n)
+    e = rng.uniform(0.0, 0.9, n)
+    orbits_df = pd.DataFrame(
+        {
+            "FORMAT": formats,
+            "q": a * (1 - e),
+            "a": a,
+            "e": e,
+            "inc": rng.uniform(0.0, 60.0, n),
+            "node": rng.uniform(0.0, 360.0, n),
+            "argPeri": rng.uniform(0.0, 360.0, n),
+            "ma": rng.uniform(0.0, 360.0, n),
+            "t_p_MJD_TDB": rng.uniform(57000.0, 61000.0, n),
+            "x": rng.uniform(-5.0, 5.0, n),
+            "y": rng.uniform(-5.0, 5.0, n),
+            "z": rng.uniform(-1.0, 1.0, n),
+            "xdot": rng.uniform(-0.01, 0.01, n),
+            "ydot": rng.uniform(-0.01, 0.01, n),
+            "zdot": rng.uniform(-0.001, 0.001, n),
+        }
+    )
+    epochJD_TDB = epochs[np.arange(n) % 5 % 2]
+
+    return orbits_df, sun_dict, epochJD_TDB
+
+
+def test_parse_orbit_columns():
+    import pytest
+    from sorcha.ephemeris.simulation_parsing import parse_orbit_columns, parse_orbit_row
+
+    gm_sun = 2.9591220828559115e-04
+    gm_total = 2.9630927487993194e-04
+    orbits_df, sun_dict, epochJD_TDB = make_mixed_orbits()
+    sun_states = np.array([sun_dict[epoch] for epoch in epochJD_TDB])
+
+    states = parse_orbit_columns(orbits_df, epochJD_TDB, sun_states, gm_sun, gm_total)
+
+    assert states.shape == (len(orbits_df), 6)
+    for (_, row), epoch, state in zip(orbits_df.iterrows(), epochJD_TDB, states):
+        expected = parse_orbit_row(row, epoch, None, sun_dict, gm_sun, gm_total)
+        assert np.allclose(state, expected, rtol=1e-13, atol=1e-15)
+
+    orbits_df.loc[3, "FORMAT"] = "EQ"
+    with pytest.raises(ValueError, match="not supported"):
+        parse_orbit_columns(orbits_df, epochJD_TDB, sun_states, gm_sun, gm_total)
+
+
+def test_get_perihelion_columns():
+    import pytest
+    from sorcha.ephemeris.simulation_parsing import get_perihelion_columns, get_perihelion_row
+
+    gm_sun = 2.9591220828559115e-04
+    gm_total = 2.9630927487993194e-04
+    orbits_df, sun_dict, epochJD_TDB = make_mixed_orbits()
+    sun_states = np.array([sun_dict[epoch] for epoch in epochJD_TDB])
+
+    elements = get_perihelion_columns(orbits_df, epochJD_TDB, sun_states, gm_sun, gm_total)
+
+    assert elements.shape == (len(orbits_df), 6)
+    for (_, row), epoch, elements_row in zip(orbits_df.iterrows(), epochJD_TDB, elements):
+        expected = get_perihelion_row(row, epoch, None, sun_dict, gm_sun, gm_total)
+        assert np.allclose(elements_row, expected, rtol=1e-12, atol=1e-12)
+
+    orbits_df.loc[3, "FORMAT"] = "EQ"
+    with pytest.raises(ValueError, match="not supported"):
+        get_perihelion_columns(orbits_df, epochJD_TDB, sun_states, gm_sun, gm_total)
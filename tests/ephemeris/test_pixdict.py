@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+import pytest
 from sorcha.utilities.dataUtilitiesForTests import get_test_filepath, get_demo_filepath
 from sorcha.utilities.sorchaArguments import sorchaArguments
 from sorcha.modules.PPReadPointingDatabase import PPReadPointingDatabase
@@ -10,10 +11,18 @@ from sorcha.ephemeris.simulation_setup import (
     furnish_spiceypy,
 )
 
-from sorcha.ephemeris.pixel_dict import PixelDict
+from sorcha.ephemeris.pixel_dict import (
+    PixelDict,
+    ChebyshevPixelDict,
+    PicketStateCache,
+    build_pixel_index,
+    max_orbital_speed,
+    picket_interval_ladder,
+)
 from sorcha.ephemeris.simulation_parsing import Observatory
 from sorcha.ephemeris.simulation_geometry import ecliptic_to_equatorial
-from sorcha.ephemeris.simulation_constants import SPEED_OF_LIGHT
+from sorcha.ephemeris.simulation_constants import AU_KM, SPEED_OF_LIGHT, PERTURBER_GM, PLUTO_GM
+from sorcha.ephemeris.orbit_conversion_utilities import universal_cartesian
 from sorcha.utilities.sorchaConfigs import sorchaConfigs
 
 
@@ -117,10 +126,11 @@ def test_pixeldict(tmp_path):
     reference /= np.linalg.norm(reference)
 
     # now let's query our object
-    unit_vec = pixdict.interpolate_unit_vectors(pixdict.sim_dict.keys(), 54800.0 + 2400000.5)
+    unit_vec = pixdict.interpolate_unit_vectors(np.arange(len(pixdict.desigs)), 54800.0 + 2400000.5)
 
     # note this also means that the predicted RA/Dec are equal
-    assert np.isclose(np.linalg.norm(reference - unit_vec["6"]), 0)
+    assert pixdict.desigs[0] == "6"
+    assert np.isclose(np.linalg.norm(reference - unit_vec[0]), 0)
 
     pixdict.compute_pixel_traversed()
 
@@ -128,17 +138,20 @@ def test_pixeldict(tmp_path):
     pixels = [4432, 4433, 4434, 4435, 4436, 4437, 4438, 4439, 4440, 4441, 4444, 4445]
 
     # check if lists are subsets of each other
+    index_pixels, offsets, index_objects = pixdict.pixel_index[0]
     crossed = []
-    for i in pixdict.pixel_dict:
+    for i in index_pixels:
         assert i in pixels
         crossed.append(i)
     for i in pixels:
         assert i in crossed
+    assert list(index_objects) == [0] * len(pixels)
 
     # use proper ra/dec to try and recover the object
     obj = pixdict.get_designations(54800.0 + 2400000.5, 39.81424, -0.18774, 2)
 
     assert "6" in obj
+    assert list(pixdict.get_object_indices(54800.0 + 2400000.5, 39.81424, -0.18774, 2)) == [0]
 
     # finally, let's test the Lagrange interpolation
     # with a really simple construction:
@@ -159,3 +172,260 @@ def test_pixeldict(tmp_path):
 
     assert Lp[0, 0] == 0
     assert Lp[1, 0] == 0
+
+
+def test_build_pixel_index():
+    pixels = np.array([7, 3, 7, -1, 3, 12, 7])
+    objects = np.array([2, 0, 0, 1, 0, 1, 1])
+
+    unique_pixels, offsets, object_indices = build_pixel_index(pixels, objects)
+
+    # missing neighbours (-1) are dropped, and each object appears once per pixel
+    assert list(unique_pixels) == [3, 7, 12]
+    assert list(offsets) == [0, 1, 4, 5]
+    assert list(object_indices[offsets[0] : offsets[1]]) == [0]
+    assert list(object_indices[offsets[1] : offsets[2]]) == [0, 1, 2]
+    assert list(object_indices[offsets[2] : offsets[3]]) == [1]
+
+
+def test_picket_interval_ladder():
+    assert list(picket_interval_ladder(1)) == [1.0]
+    assert list(picket_interval_ladder(1, 0.125, 4)) == [0.125, 0.25, 0.5, 1.0, 2.0, 4.0]
+    # the limits are rounded inwards to the nearest power of two
+    assert list(picket_interval_ladder(2, 0.3, 5)) == [0.5, 1.0, 2.0, 4.0]
+
+
+class GreatCircleMotion:
+    """Mixin for PixelDicts whose objects move along great circles at fixed angular rates (rad/day),
+    at 1 au from the observatory. The times the objects are computed at are recorded in computed_times."""
+
+    def __init__(self, jd_tdb, rates, **kwargs):
+        self.rates = np.asarray(rates)
+        self.computed_times = []
+        sim_dict = {str(i): None for i in range(len(rates))}
+        super().__init__(jd_tdb, sim_dict, None, "X05", None, **kwargs)
+
+    def get_observatory_position(self, t):
+        return np.zeros(3)
+
+    def get_object_unit_vectors(self, desigs, r_obs, t, lt0=0.01):
+        self.computed_times.append(t)
+        obj_indices = desigs.astype(int)
+        phase = self.rates[obj_indices] * t
+        rho_hat = np.column_stack([np.cos(phase), np.sin(phase), np.zeros(len(phase))])
+        if self.prune_horizon is not None:
+            self.known_time[obj_indices] = t
+            self.known_rho_hat[obj_indices] = rho_hat
+            self.known_distance[obj_indices] = 1.0
+            self.known_max_speed[obj_indices] = self.rates[obj_indices]
+        return rho_hat
+
+
+class GreatCirclePixelDict(GreatCircleMotion, ChebyshevPixelDict):
+    """ChebyshevPixelDict whose objects move along great circles."""
+
+
+class GreatCircleLagrangePixelDict(GreatCircleMotion, PixelDict):
+    """PixelDict whose objects move along great circles."""
+
+
+def test_pixeldict_observatory_position():
+    class FixedObservatory:
+        """Stands in for an Observatory at a fixed barycentric position, recording the times asked for."""
+
+        r_obs = np.array([0.5, -0.8, 0.1])
+
+        def __init__(self):
+            self.et = []
+
+        def barycentricObservatoryStates(self, et, obsCode):
+            self.et.append(et)
+            return np.atleast_2d(self.r_obs * AU_KM), np.zeros((1, 3))
+
+    pixdict = GreatCircleLagrangePixelDict(100.0, np.array([0.01]), nside=64)
+    pixdict.observatory = FixedObservatory()
+
+    # the mixin's stand-in is bypassed, so that the position comes from the observatory
+    r_obs = PixelDict.get_observatory_position(pixdict, 2451546.0)
+    assert np.allclose(r_obs, FixedObservatory.r_obs, rtol=0, atol=1e-15)
+    assert pixdict.observatory.et == [86400.0]
+
+
+def test_chebyshev_pixeldict():
+    rates = np.array([0.001, 0.05, 1.0])
+    pixdict = GreatCirclePixelDict(100.0, rates, order=8, window=16.0, tolerance=1e-6, nside=64)
+
+    # the faster an object moves, the shorter its window
+    windows = pixdict.intervals[pixdict.level]
+    assert windows[0] >= windows[1] > windows[2]
+    assert np.all(pixdict.get_error_estimate(np.arange(3)) <= 1e-6)
+
+    for jd in [100.0, 100.3, 103.7, 115.9, 131.2]:
+        uv = pixdict.interpolate_unit_vectors(np.arange(3), jd)
+        exact = pixdict.get_object_unit_vectors(pixdict.desigs, None, jd)
+        error = np.degrees(np.linalg.norm(uv - exact, axis=1))
+        assert np.all(error < 1e-6)
+
+        # every window contains the current time
+        start = pixdict.level_start[pixdict.level]
+        assert np.all((start <= jd) & (jd < start + pixdict.intervals[pixdict.level]))
+
+    # the objects are found in the pixel they are in
+    jd = 131.2
+    uv = pixdict.get_object_unit_vectors(pixdict.desigs, None, jd)
+    for i, (x, y, z) in enumerate(uv):
+        ra, dec = np.degrees(np.arctan2(y, x)), np.degrees(np.arcsin(z))
+        assert i in pixdict.get_object_indices(jd, ra, dec, 1.0)
+
+
+def test_pixeldict_schedule():
+    rates = np.array([0.001, 0.05, 0.2])
+    # three nights of pointings, the last one after a long gap
+    schedule = np.concatenate([np.linspace(night, night + 0.3, 20) for night in (100.0, 101.0, 110.0)])
+    pixdict = GreatCircleLagrangePixelDict(100.0, rates, nside=64, schedule=schedule)
+
+    # only the traversal times around the pointings are indexed
+    needed = pixdict.get_scheduled_samples(pixdict.get_traversal_times(0))
+    assert 0 < np.count_nonzero(needed) < len(needed)
+    needed = pixdict.get_scheduled_samples(np.array([90.0, 95.0, 100.1, 105.0, 106.0]))
+    assert list(needed) == [False, True, True, True, False]
+
+    for jd in schedule:
+        uv = pixdict.get_object_unit_vectors(pixdict.desigs, None, jd)
+        for i, (x, y, z) in enumerate(uv):
+            ra, dec = np.degrees(np.arctan2(y, x)), np.degrees(np.arcsin(z))
+            assert i in pixdict.get_object_indices(jd, ra, dec, 1.0)
+
+    # the pickets between the second and last nights are jumped over
+    assert pixdict.t0[0] == 110.0
+    assert pixdict.skipped_pickets == 9 - 3
+
+    # a move of two intervals reuses the last picket and computes the other two
+    pixdict.computed_times.clear()
+    pixdict.update_pickets(112.0)
+    assert pixdict.computed_times == [112.0, 113.0]
+    exact = pixdict.get_object_unit_vectors(pixdict.desigs, None, 111.0)
+    assert np.allclose(pixdict.rho_hat_m, exact, rtol=0, atol=1e-12)
+    assert pixdict.skipped_pickets == 9 - 3
+
+
+def test_pixeldict_pruning():
+    rates = np.array([0.001, 0.2])
+    # a field on the equator at RA 180 degrees, pointed at every night
+    schedule = np.arange(100.0, 131.0)
+    fields = np.tile([-1.0, 0.0, 0.0], (len(schedule), 1))
+
+    with pytest.raises(ValueError):
+        GreatCircleLagrangePixelDict(100.0, rates, nside=64, schedule=schedule, prune_horizon=5.0)
+
+    pixdict = GreatCircleLagrangePixelDict(
+        100.0, rates, nside=64, schedule=schedule, fields=fields, field_radius=2.0, prune_horizon=5.0
+    )
+    for jd in schedule:
+        found = pixdict.get_object_indices(jd, 180.0, 0.0, 2.0)
+        # the angular distance of each object from the field
+        distance = np.degrees(np.abs(np.angle(-np.exp(1j * rates * jd))))
+        in_field = np.flatnonzero(distance < 2.0)
+        assert set(in_field) <= set(found)
+
+    # the slow object never comes near the field, and is not computed after its first pickets
+    assert pixdict.deferred[0]
+    assert pixdict.deferred_refreshes > 0
+    assert pixdict.known_time[0] == 101.0
+
+    # the fast object sweeps through the field and is kept up to date
+    assert not pixdict.deferred[1]
+    assert pixdict.known_time[1] == 131.0
+
+
+def kepler_states(q, e, t_p, times):
+    """Barycentric states of an object on a two-body orbit in the x-y plane, with its perihelion along x."""
+    gm = PERTURBER_GM.sum() + PLUTO_GM
+    return np.array([universal_cartesian(gm, q, e, 0.0, 0.0, 0.0, t_p, t) for t in times])
+
+
+def test_max_orbital_speed():
+    times = np.linspace(60000.0, 61000.0, 2001)
+    for q, e in [(1.5, 0.1), (0.3, 0.8), (0.5, 1.0), (0.5, 1.5)]:
+        states = kepler_states(q, e, 60500.0, times)
+        speeds = np.linalg.norm(states[:, 3:], axis=1)
+        bound = max_orbital_speed(states[:, :3], states[:, 3:])
+
+        # the bound is the perihelion speed, wherever the object is along its orbit
+        assert np.allclose(bound, speeds[1000], rtol=1e-9)
+        assert np.all(speeds <= bound * (1 + 1e-9))
+
+    # far from perihelion, an eccentric object is much slower than twice its perihelion speed
+    assert speeds[0] * 2 < bound[0]
+    assert max_orbital_speed(np.array([[1.0, 0.0, 0.0]]), np.array([[-0.01, 0.0, 0.0]]))[0] == np.inf
+
+
+class KeplerMotion:
+    """Mixin for PixelDicts with one object on an eccentric two-body orbit, seen from the barycentre"""
+
+    def __init__(self, jd_tdb, q, e, t_p, **kwargs):
+        self.orbit = (q, e, t_p)
+        super().__init__(jd_tdb, {"0": None}, None, "X05", None, **kwargs)
+
+    def get_observatory_position(self, t):
+        return np.zeros(3)
+
+    def get_object_unit_vectors(self, desigs, r_obs, t, lt0=0.01):
+        state = kepler_states(*self.orbit, [t])
+        distance = np.linalg.norm(state[:, :3], axis=1)
+        rho_hat = state[:, :3] / distance[:, np.newaxis]
+        if self.prune_horizon is not None:
+            self.known_time[0] = t
+            self.known_rho_hat[0] = rho_hat[0]
+            self.known_distance[0] = distance[0]
+            self.known_max_speed[0] = max_orbital_speed(state[:, :3], state[:, 3:])[0]
+        return np.repeat(rho_hat, len(desigs), axis=0)
+
+
+class KeplerPixelDict(KeplerMotion, PixelDict):
+    """PixelDict with an object on an eccentric orbit."""
+
+
+def test_pixeldict_pruning_eccentric():
+    # a field along the perihelion direction, pointed at every night
+    schedule = np.arange(100.0, 164.0)
+    fields = np.tile([1.0, 0.0, 0.0], (len(schedule), 1))
+    q, e, t_p = 0.2, 0.95, 160.0
+
+    pixdict = KeplerPixelDict(
+        100.0, q, e, t_p, nside=64, schedule=schedule, fields=fields, field_radius=2.0, prune_horizon=10.0
+    )
+    in_field = []
+    for jd in schedule:
+        found = pixdict.get_object_indices(jd, 0.0, 0.0, 2.0)
+        position = kepler_states(q, e, t_p, [jd])[0, :3]
+        if np.degrees(np.arctan2(abs(position[1]), position[0])) < 2.0:
+            in_field.append(jd)
+            assert list(found) == [0]
+
+    # the object is deferred while far from the field, then speeds up into it
+    assert pixdict.deferred_refreshes > 0
+    assert in_field == [160.0]
+
+
+def test_picket_state_cache():
+    cache = PicketStateCache(max_times=2)
+    states = np.arange(30.0).reshape(10, 3)
+
+    cache.store(100.0, np.array([4, 1, 7]), states[[4, 1, 7]], -states[[4, 1, 7]], np.array([0.4, 0.1, 0.7]))
+    cache.store(100.0, np.array([2]), states[[2]], -states[[2]], np.array([0.2]))
+
+    # times are matched to the resolution of the cache
+    found, target, vtarget, lt = cache.lookup(100.0 + 1e-10, np.array([7, 3, 2, 1]))
+    assert list(found) == [True, False, True, True]
+    assert np.array_equal(target[found], states[[7, 2, 1]])
+    assert np.array_equal(vtarget[found], -states[[7, 2, 1]])
+    assert np.array_equal(lt[found], [0.7, 0.2, 0.1])
+    assert not np.any(cache.lookup(100.001, np.array([7]))[0])
+
+    # the least recently used time is dropped first
+    cache.store(101.0, np.array([0]), states[[0]], states[[0]], np.zeros(1))
+    cache.store(100.0, np.array([3]), states[[3]], states[[3]], np.zeros(1))
+    cache.store(102.0, np.array([0]), states[[0]], states[[0]], np.zeros(1))
+    assert cache.lookup(100.0, np.array([1]))[0][0]
+    assert not cache.lookup(101.0, np.array([0]))[0][0]
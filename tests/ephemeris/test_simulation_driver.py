@@ -1,6 +1,21 @@
+import types
+
 import numpy as np
 import pandas as pd
-from sorcha.ephemeris.simulation_driver import calculate_rates_and_geometry, EphemerisGeometryParameters
+import rebound
+from sorcha.ephemeris.simulation_constants import AU_KM
+from sorcha.ephemeris.simulation_driver import (
+    calculate_rates_and_geometry,
+    EphemerisAccumulator,
+    EphemerisGeometryParameters,
+    get_cache_counts,
+    log_cache_counts,
+    merge_ephemeris_shards,
+    select_sweep,
+    sweep_objects,
+)
+from sorcha.ephemeris.simulation_geometry import integrate_light_time_objects, ra_dec2vec
+from sorcha.utilities.sorchaConfigs import simulationConfigs
 
 
 def test_calculate_rates_and_geometry():
@@ -76,3 +91,214 @@ def test_calculate_rates_and_geometry():
     )
 
     assert np.allclose(output_tuple[1:], expected_tuple[1:])
+
+
+def test_calculate_rates_and_geometry_batch():
+    pointing = pd.Series(
+        {
+            "FieldID": 848,
+            "fieldJD_TDB": 2460219.484998981,
+            "r_obs_x": 0.9825025212987633,
+            "r_obs_y": 0.12894773431445178,
+            "r_obs_z": 0.056115072741286603,
+            "v_obs_x": -0.002514846222194574,
+            "v_obs_y": 0.015645226468919866,
+            "v_obs_z": 0.006740310710189443,
+            "r_sun_x": -0.008375571318557293,
+            "r_sun_y": -0.0021278397223137443,
+            "r_sun_z": -0.0006896179222345509,
+            "v_sun_x": 4.014508061373484e-06,
+            "v_sun_y": -7.199434717117629e-06,
+            "v_sun_z": -3.1502131721138966e-06,
+        }
+    )
+
+    r_ast = np.asarray([[2.22134111, -1.4666382, -0.88530195], [-1.5, 2.5, 0.3]])
+    v_ast = np.asarray([[0.00608846, 0.00585226, 0.00487886], [-0.007, -0.004, 0.001]])
+    r_obs = np.asarray([pointing["r_obs_x"], pointing["r_obs_y"], pointing["r_obs_z"]])
+    rho = r_ast - r_obs
+    rho_mag = np.linalg.norm(rho, axis=1)
+
+    batch = EphemerisGeometryParameters()
+    batch.obj_id = np.array(["a", "b"], dtype=object)
+    batch.mjd_tai = 60218.98462644687
+    batch.rho = rho
+    batch.rho_mag = rho_mag
+    batch.rho_hat = rho / rho_mag[:, np.newaxis]
+    batch.r_ast = r_ast
+    batch.v_ast = v_ast
+
+    batch_tuple = calculate_rates_and_geometry(pointing, batch)
+
+    # each row of the batch must match the single-object calculation
+    for i in range(2):
+        single = EphemerisGeometryParameters()
+        single.obj_id = batch.obj_id[i]
+        single.mjd_tai = batch.mjd_tai
+        single.rho = rho[i]
+        single.rho_mag = rho_mag[i]
+        single.rho_hat = batch.rho_hat[i]
+        single.r_ast = r_ast[i]
+        single.v_ast = v_ast[i]
+        single_tuple = calculate_rates_and_geometry(pointing, single)
+
+        assert single_tuple[0] == batch_tuple[0][i]
+        for single_value, batch_value in zip(single_tuple[1:], batch_tuple[1:]):
+            assert np.isclose(single_value, np.broadcast_to(batch_value, 2)[i])
+
+
+def test_ephemeris_accumulator():
+    column_names = ("ObjID", "FieldID", "fieldMJD_TAI", "RA_deg")
+    column_types = {"ObjID": object, "FieldID": np.int64, "fieldMJD_TAI": np.float64, "RA_deg": np.float64}
+
+    accumulator = EphemerisAccumulator(column_names, column_types, initial_capacity=2)
+
+    # scalars are shared by all the rows of a batch, and batches larger than
+    # the preallocated buffers make them grow
+    accumulator.append((np.array(["a", "b", "c"], dtype=object), 10, 60000.5, np.array([1.0, 2.0, 3.0])))
+    accumulator.append(("d", 11, 60001.5, 4.0))
+    accumulator.append((np.array(["e"], dtype=object), 12, 60002.5, np.array([5.0])))
+
+    ephemeris_df = accumulator.to_dataframe()
+
+    assert list(ephemeris_df.columns) == list(column_names)
+    assert list(ephemeris_df["ObjID"]) == ["a", "b", "c", "d", "e"]
+    assert list(ephemeris_df["FieldID"]) == [10, 10, 10, 11, 12]
+    assert ephemeris_df["FieldID"].dtype == np.int64
+    assert np.allclose(ephemeris_df["fieldMJD_TAI"], [60000.5, 60000.5, 60000.5, 60001.5, 60002.5])
+    assert np.allclose(ephemeris_df["RA_deg"], [1.0, 2.0, 3.0, 4.0, 5.0])
+
+    empty_df = EphemerisAccumulator(column_names, column_types).to_dataframe()
+    assert len(empty_df) == 0
+    assert list(empty_df.columns) == list(column_names)
+
+
+def test_merge_ephemeris_shards():
+    # the objects a-c and d-e are two contiguous shards of the input orbits
+    shard_1 = (pd.DataFrame({"ObjID": ["a", "c", "b"], "FieldID": [1, 1, 3]}), np.array([0, 0, 2]))
+    shard_2 = (pd.DataFrame({"ObjID": ["d", "e", "d"], "FieldID": [1, 2, 3]}), np.array([0, 1, 2]))
+
+    merged_df = merge_ephemeris_shards([shard_1, shard_2])
+
+    assert list(merged_df["ObjID"]) == ["a", "c", "d", "e", "b", "d"]
+    assert list(merged_df["FieldID"]) == [1, 1, 1, 2, 3, 3]
+    assert list(merged_df.index) == list(range(6))
+
+    single_df = merge_ephemeris_shards([shard_1])
+    assert list(single_df["ObjID"]) == ["a", "c", "b"]
+
+
+def test_cache_counts():
+    context = types.SimpleNamespace(
+        observatories=types.SimpleNamespace(cacheHits=5, cacheMisses=2),
+        sun_states=types.SimpleNamespace(cacheHits=1, cacheMisses=3),
+    )
+    before = get_cache_counts(context)
+    context.observatories.cacheHits += 4
+    context.sun_states.cacheMisses += 1
+
+    # the counts of a shard are what it added, whatever the process counted before
+    shard_counts = get_cache_counts(context)
+    shard_counts.subtract(before)
+    total = get_cache_counts(context)
+    total.update(shard_counts)
+    assert total == dict(observatory_hits=13, observatory_misses=2, sun_hits=1, sun_misses=5)
+
+    lines = []
+    log_cache_counts(total, lines.append)
+    assert lines == [
+        "Observatory position cache: 13 hits, 2 misses.",
+        "Sun state cache: 1 hits, 5 misses.",
+    ]
+
+
+def test_select_sweep():
+    simulation = dict(
+        _ephemerides_type="ar",
+        ar_ang_fov=2.0,
+        ar_fov_buffer=0.2,
+        ar_picket=1,
+        ar_obs_code="X05",
+        ar_healpix_order=6,
+    )
+    # the pointing sweep is the default
+    sconfigs = types.SimpleNamespace(simulation=simulationConfigs(**simulation))
+    assert select_sweep(10, 100_000, sconfigs) == "pointing"
+
+    # with auto, a small population over many pointings is followed object by object
+    sconfigs = types.SimpleNamespace(simulation=simulationConfigs(**simulation, ar_sweep="auto"))
+    assert select_sweep(10, 100_000, sconfigs) == "object"
+    assert select_sweep(100_000, 100_000, sconfigs) == "pointing"
+
+    # unless one of the features of the pointing sweep is turned on
+    for key, value in [("ar_interpolation", "chebyshev"), ("ar_prune_horizon", 5)]:
+        sconfigs = types.SimpleNamespace(
+            simulation=simulationConfigs(**simulation, ar_sweep="auto", **{key: value})
+        )
+        assert select_sweep(10, 100_000, sconfigs) == "pointing"
+
+    sconfigs = types.SimpleNamespace(simulation=simulationConfigs(**simulation, ar_sweep="object"))
+    assert select_sweep(100_000, 10, sconfigs) == "object"
+
+
+class FixedObservatory:
+    """Stands in for an Observatory that stays at the same barycentric position."""
+
+    r_obs = np.array([0.5, -0.8, 0.1])
+
+    def barycentricObservatoryStates(self, et, obsCode):
+        return np.atleast_2d(self.r_obs * AU_KM), np.zeros((1, 3))
+
+
+def test_sweep_objects(kepler_extras):
+    sim = rebound.Simulation()
+    sim.G = 2.959122082855911e-4  # au^3 / day^2 for a solar mass
+    sim.add(m=1.0)
+    for a, e, inc in [(1.2, 0.3, 0.1), (2.7, 0.1, 0.2), (0.8, 0.5, 0.3), (30.0, 0.05, 0.0)]:
+        sim.add(a=a, e=e, inc=inc)
+    sim.N_active = 1
+    ex = kepler_extras(sim)
+    sim_dict = {f"obj{index}": {"sim": sim, "ex": ex, "index": index} for index in range(1, 5)}
+    desigs = np.array(list(sim_dict.keys()), dtype=object)
+    ephem = types.SimpleNamespace(jd_ref=0.0)
+    r_obs = FixedObservatory.r_obs
+
+    # fields around the objects, and a few away from all of them, over three nights with a gap
+    rng = np.random.default_rng(3)
+    times = np.sort(np.concatenate([night + rng.uniform(0, 0.3, 30) for night in (10.0, 11.0, 16.0)]))
+    fields = np.empty((len(times), 3))
+    for i, t in enumerate(times):
+        rho, rho_mag, *_ = integrate_light_time_objects(sim_dict, desigs[[i % 4]], t, r_obs, lt0=0.01)
+        ra = np.degrees(np.arctan2(rho[0, 1], rho[0, 0])) + rng.normal(0, 1.5) + (90 if i % 7 == 0 else 0)
+        dec = np.degrees(np.arcsin(rho[0, 2] / rho_mag[0])) + rng.normal(0, 1.5)
+        fields[i] = ra_dec2vec(ra, dec)
+    pointings_df = pd.DataFrame(
+        {
+            "fieldJD_TDB": times,
+            "observatoryCode": "X05",
+            "visit_vector_x": fields[:, 0],
+            "visit_vector_y": fields[:, 1],
+            "visit_vector_z": fields[:, 2],
+        }
+    )
+    sconfigs = types.SimpleNamespace(
+        simulation=types.SimpleNamespace(ar_picket=1, ar_ang_fov=2.0, ar_fov_buffer=0.2, ar_lt_tolerance=1e-9)
+    )
+
+    found = {
+        i_pointing: list(obj_ids)
+        for i_pointing, _, obj_ids in sweep_objects(
+            sim_dict, pointings_df, ephem, FixedObservatory(), sconfigs
+        )
+    }
+    assert list(found) == sorted(found)
+
+    # every object in a field is found, in the order of the simulation dictionary
+    n_in_fields = 0
+    for i, t in enumerate(times):
+        rho, rho_mag, *_ = integrate_light_time_objects(sim_dict, desigs, t, r_obs, lt0=0.01)
+        ang = np.degrees(np.arccos(np.clip(rho @ fields[i] / rho_mag, -1, 1)))
+        in_field = list(desigs[ang < 2.2])
+        n_in_fields += len(in_field)
+        assert found.get(i, []) == in_field
+    assert n_in_fields > 30
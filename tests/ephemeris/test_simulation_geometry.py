@@ -0,0 +1,239 @@
+import healpy as hp
+import numpy as np
+import rebound
+
+from sorcha.ephemeris.simulation_constants import SPEED_OF_LIGHT
+from sorcha.ephemeris.simulation_geometry import (
+    extrapolate_light_time,
+    get_hp_discs,
+    get_hp_neighbors,
+    get_particle_states,
+    ra_dec2vec,
+    integrate_light_time,
+    integrate_light_time_objects,
+    integrate_light_time_particles,
+    ParticleStateGrid,
+)
+
+
+def make_simulation():
+    sim = rebound.Simulation()
+    sim.G = 2.959122082855911e-4  # au^3 / day^2 for a solar mass
+    sim.add(m=1.0)
+    for a, e, inc in [(1.2, 0.3, 0.1), (2.7, 0.1, 0.2), (0.8, 0.5, 0.3)]:
+        sim.add(a=a, e=e, inc=inc)
+    sim.N_active = 1
+    return sim
+
+
+def test_get_particle_states(kepler_extras):
+    t = np.array([0.003, 0.021, 0.012])
+    index = [1, 2, 3]
+
+    sim = make_simulation()
+    xyz, vxyz = get_particle_states(sim, kepler_extras(sim), index, t)
+
+    for i, (k, t_k) in enumerate(zip(index, t)):
+        exact = make_simulation()
+        exact.integrate(t_k, exact_finish_time=1)
+        assert np.allclose(xyz[i], exact.particles[k].xyz, rtol=0, atol=1e-13)
+        assert np.allclose(vxyz[i], exact.particles[k].vxyz, rtol=0, atol=1e-11)
+
+    # with a single time the states are taken directly from the simulation
+    sim = make_simulation()
+    xyz, vxyz = get_particle_states(sim, kepler_extras(sim), index, np.full(3, 0.01))
+    exact = make_simulation()
+    exact.integrate(0.01, exact_finish_time=1)
+    assert np.array_equal(xyz, [exact.particles[k].xyz for k in index])
+    assert np.array_equal(vxyz, [exact.particles[k].vxyz for k in index])
+
+
+def test_integrate_light_time_particles(kepler_extras):
+    r_obs = np.array([0.5, -0.8, 0.1])
+    index = [1, 2, 3]
+
+    sim = make_simulation()
+    sim.integrate(10.0, exact_finish_time=1)
+    rho, rho_mag, lt, r_ast, v_ast = integrate_light_time_particles(
+        sim, kepler_extras(sim), index, 10.0, r_obs, lt0=0.01
+    )
+
+    assert rho.shape == (3, 3)
+    assert np.allclose(rho, r_ast - r_obs)
+    assert np.allclose(rho_mag, np.linalg.norm(rho, axis=1))
+    assert np.allclose(lt, rho_mag / SPEED_OF_LIGHT)
+
+
+def test_integrate_light_time_objects(kepler_extras):
+    r_obs = np.array([0.5, -0.8, 0.1])
+
+    # two simulations, with the objects of the first one listed out of order
+    sims = [make_simulation(), make_simulation()]
+    sim_dict = {}
+    for i, sim in enumerate(sims):
+        sim.integrate(10.0, exact_finish_time=1)
+        ex = kepler_extras(sim)
+        for index in (1, 2, 3):
+            sim_dict[f"{i}_{index}"] = {"sim": sim, "ex": ex, "index": index}
+    desigs = ["0_3", "1_1", "0_1", "1_2"]
+
+    rho, rho_mag, lt, r_ast, v_ast = integrate_light_time_objects(sim_dict, desigs, 10.0, r_obs, lt0=0.01)
+
+    assert rho.shape == (4, 3)
+    # the light travel times are consistent with the positions they were computed from
+    assert np.allclose(lt, rho_mag / SPEED_OF_LIGHT, rtol=0, atol=1e-12)
+
+    for k, rho_k in zip(desigs, rho):
+        i, index = k.split("_")
+        sim = make_simulation()
+        single = {"sim": sim, "ex": kepler_extras(sim), "index": int(index)}
+        sim.integrate(10.0, exact_finish_time=1)
+        rho_single, *_ = integrate_light_time_objects({k: single}, [k], 10.0, r_obs, lt0=0.01)
+        assert np.allclose(rho_k, rho_single[0], rtol=0, atol=1e-12)
+
+
+def test_particle_state_grid(kepler_extras):
+    t = np.array([10.003, 10.021, 10.012, 10.0])
+    index = [1, 2, 3, 1]
+
+    sim = make_simulation()
+    grid = ParticleStateGrid(node_spacing=0.01)
+    xyz, vxyz = grid.get_states(sim, kepler_extras(sim), index, t)
+
+    for i, (k, t_k) in enumerate(zip(index, t)):
+        exact = make_simulation()
+        exact.integrate(t_k, exact_finish_time=1)
+        assert np.allclose(xyz[i], exact.particles[k].xyz, rtol=0, atol=1e-13)
+        assert np.allclose(vxyz[i], exact.particles[k].vxyz, rtol=0, atol=1e-11)
+    assert grid.integrations == 4
+
+    # the nodes are kept, until the grid is cleared
+    grid.get_states(sim, kepler_extras(sim), [2], [10.015])
+    assert grid.integrations == 4
+    grid.clear()
+    grid.get_states(sim, kepler_extras(sim), [2], [10.015])
+    assert grid.integrations == 6
+
+    # the light travel time correction gives the same objects' states with the grid
+    r_obs = np.array([0.5, -0.8, 0.1])
+    sim_dict = {k: {"sim": sim, "ex": kepler_extras(sim), "index": k} for k in (1, 2, 3)}
+    rho, rho_mag, lt, r_ast, v_ast = integrate_light_time_objects(sim_dict, [1, 2, 3], 10.0, r_obs, lt0=0.01)
+    grid_rho, grid_rho_mag, grid_lt, grid_r_ast, grid_v_ast = integrate_light_time_objects(
+        sim_dict, [1, 2, 3], 10.0, r_obs, lt0=0.01, grid=ParticleStateGrid()
+    )
+    assert np.allclose(grid_rho, rho, rtol=0, atol=1e-13)
+    assert np.allclose(grid_lt, lt, rtol=0, atol=1e-15)
+    assert np.allclose(grid_v_ast, v_ast, rtol=0, atol=1e-11)
+
+
+def test_particle_state_grid_fast_neo(kepler_extras):
+    def make_neo_simulation():
+        # a near-Earth object passing perihelion at 0.1 au, at about 130 km/s, during the night
+        sim = rebound.Simulation()
+        sim.G = 2.959122082855911e-4  # au^3 / day^2 for a solar mass
+        sim.add(m=1.0)
+        sim.add(a=1.0, e=0.9, inc=0.2, M=-0.001)
+        sim.N_active = 1
+        return sim
+
+    # seen from 0.011 au away, so that it moves by about 100 degrees over the night
+    sim = make_neo_simulation()
+    sim.integrate(0.2, exact_finish_time=1)
+    r_obs = np.array(sim.particles[1].xyz) + np.array([0.01, 0.005, 0.0])
+
+    sim = make_neo_simulation()
+    sim_dict = {"neo": {"sim": sim, "ex": kepler_extras(sim), "index": 1}}
+    grid = ParticleStateGrid(node_spacing=0.01)
+    for t in np.linspace(0.0, 0.4, 41):
+        rho, rho_mag, lt, _, _ = integrate_light_time_objects(
+            sim_dict, ["neo"], t, r_obs, lt0=0.0, lt_tol=1e-12, grid=grid
+        )
+
+        exact = make_neo_simulation()
+        exact_rho, exact_rho_mag, exact_lt, _, _ = integrate_light_time(
+            exact, kepler_extras(exact), t, r_obs, lt0=0.0, iter=10, index=1
+        )
+        # the interpolated positions are within 0.01 milliarcseconds and 15 cm of the integrated ones
+        error = np.degrees(np.linalg.norm(rho[0] / rho_mag[0] - exact_rho / exact_rho_mag)) * 3600
+        assert error < 1e-5
+        assert abs(rho_mag[0] - exact_rho_mag) < 1e-12
+        assert abs(lt[0] - exact_lt) < 1e-14
+
+
+def test_shared_simulation_tolerance(kepler_extras):
+    # from a trans-Neptunian object to a near-Sun object with perihelion at 0.055 au,
+    # so that the step of the shared simulation is set by the most demanding one
+    orbits = [(40.0, 0.05, 0.1, 0.5), (2.7, 0.1, 0.2, 0.0), (0.8, 0.5, 0.3, 2.0), (1.1, 0.95, 0.2, 4.0)]
+
+    def make_orbit_simulation(orbits):
+        sim = rebound.Simulation()
+        sim.G = 2.959122082855911e-4  # au^3 / day^2 for a solar mass
+        sim.add(m=1.0)
+        for a, e, inc, M in orbits:
+            sim.add(a=a, e=e, inc=inc, M=M)
+        sim.N_active = 1
+        return sim
+
+    shared = make_orbit_simulation(orbits)
+    shared_dict = {
+        i: {"sim": shared, "ex": kepler_extras(shared), "index": i + 1} for i in range(len(orbits))
+    }
+    single_dict = {}
+    for i, orbit in enumerate(orbits):
+        sim = make_orbit_simulation([orbit])
+        single_dict[i] = {"sim": sim, "ex": kepler_extras(sim), "index": 1}
+    desigs = list(range(len(orbits)))
+
+    # over ten years, the objects integrated together stay within 0.01 milliarcseconds
+    # and 10 m (7e-11 au) of the same objects integrated in their own simulations
+    for t in np.linspace(1.0, 3652.5, 97):
+        r_obs = np.array([np.cos(t / 365.25 * 2 * np.pi), np.sin(t / 365.25 * 2 * np.pi), 0.0])
+        rho, rho_mag, *_ = integrate_light_time_objects(shared_dict, desigs, t, r_obs, lt0=0.01)
+        single_rho, single_rho_mag, *_ = integrate_light_time_objects(single_dict, desigs, t, r_obs, lt0=0.01)
+
+        error = np.degrees(
+            np.linalg.norm(rho / rho_mag[:, None] - single_rho / single_rho_mag[:, None], axis=1)
+        )
+        assert np.all(error * 3600 < 1e-5)
+        assert np.allclose(rho, single_rho, rtol=0, atol=7e-11)
+
+
+def test_extrapolate_light_time(kepler_extras):
+    r_obs = np.array([0.5, -0.8, 0.1])
+    # a second observatory an Earth radius away
+    r_obs_other = r_obs + np.array([3e-5, -2e-5, 1.5e-5])
+
+    sim = make_simulation()
+    sim.integrate(10.0, exact_finish_time=1)
+    sim_dict = {k: {"sim": sim, "ex": kepler_extras(sim), "index": k} for k in (1, 2, 3)}
+    desigs = [1, 2, 3]
+
+    _, _, lt, r_ast, v_ast = integrate_light_time_objects(sim_dict, desigs, 10.0, r_obs, lt0=0.01)
+    rho, rho_mag, lt_other = extrapolate_light_time(r_ast, v_ast, lt, r_obs_other)
+
+    exact_rho, exact_rho_mag, exact_lt, _, _ = integrate_light_time_objects(
+        sim_dict, desigs, 10.0, r_obs_other, lt0=0.01
+    )
+    # to within the accuracy of the interpolated particle states (1e-11 au is 1.5 m)
+    assert np.allclose(rho, exact_rho, rtol=0, atol=1e-11)
+    assert np.allclose(rho_mag, exact_rho_mag, rtol=0, atol=1e-11)
+    assert np.allclose(lt_other, exact_lt, rtol=0, atol=1e-12)
+
+
+def test_get_hp_discs():
+    rng = np.random.default_rng(7)
+    ra = rng.uniform(0, 360, 500)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, 500)))
+    nside, radius = 64, 2.1
+
+    begin, end, pixels = get_hp_discs(ra, dec, radius, nside=nside, block_size=128)
+    assert len(begin) == len(end) == 500
+
+    max_distance = np.radians(radius) + hp.max_pixrad(nside)
+    for i in range(len(ra)):
+        disc = pixels[begin[i] : end[i]]
+        assert np.all(np.diff(disc) > 0)
+        # every pixel of the inclusive disc query is found, and none too far away
+        assert np.all(np.isin(get_hp_neighbors(ra[i], dec[i], radius, nside=nside), disc))
+        centres = np.column_stack(hp.pix2vec(nside, disc, nest=True))
+        assert np.all(centres @ ra_dec2vec(ra[i], dec[i]) >= np.cos(max_distance) - 1e-12)
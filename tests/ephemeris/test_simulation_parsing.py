@@ -1,3 +1,5 @@
+import types
+
 import numpy as np
 import sorcha.ephemeris.simulation_parsing as sp
 from sorcha.utilities.dataUtilitiesForTests import get_test_filepath
@@ -48,3 +50,185 @@ def test_observatory_before_1962():
     assert np.isclose(pos[0], x, 5)
     assert np.isclose(pos[1], y, 5)
     assert np.isclose(pos[2], z, 5)
+
+
+def write_text_kernel(path, variables):
+    """Writes a SPICE text kernel assigning the given kernel pool variables."""
+    path.write_text("\\begindata\n" + "".join(f"{k} = {v}\n" for k, v in variables.items()) + "\\begintext\n")
+    return str(path)
+
+
+# the time scale constants of naif0012.tls
+TEST_LEAPSECONDS = {
+    "DELTET/DELTA_T_A": "32.184",
+    "DELTET/K": "1.657D-3",
+    "DELTET/EB": "1.671D-2",
+    "DELTET/M": "( 6.239996D0 1.99096871D-7 )",
+    "DELTET/DELTA_AT": "( 10, @1972-JAN-1 37, @2017-JAN-1 )",
+}
+
+
+def test_mjd_tai_to_epoch(tmp_path):
+    import spiceypy as spice
+
+    spice.furnsh(write_text_kernel(tmp_path / "test_leapseconds.tls", TEST_LEAPSECONDS))
+    try:
+        mjd_tai = np.linspace(50000.0, 70000.0, 1001)
+        et_tt = (mjd_tai - 51544.5) * 86400 + 32.184
+
+        et_tdb = np.array([spice.unitim(et, "TDT", "TDB") for et in et_tt])
+        # agrees with SPICE to well below a microsecond
+        assert np.allclose(et_tt + sp.tdb_minus_tt(et_tt), et_tdb, rtol=0, atol=1e-7)
+        assert np.allclose(sp.mjd_tai_to_epoch(mjd_tai), spice.j2000() + et_tdb / 86400, rtol=0, atol=1e-11)
+    finally:
+        spice.kclear()
+
+    # scalars stay scalars
+    assert np.isscalar(sp.mjd_tai_to_epoch(60000.0))
+    assert sp.mjd_tai_to_epoch(60000.0) == sp.mjd_tai_to_epoch(np.array([60000.0]))[0]
+
+
+def test_earth_rotation_matrices(tmp_path):
+    import spiceypy as spice
+
+    # the IAU_EARTH orientation constants of pck00010.tpc, used before 1962
+    orientation = {
+        "BODY399_POLE_RA": "( 0. -0.641 0. )",
+        "BODY399_POLE_DEC": "( 90. -0.557 0. )",
+        "BODY399_PM": "( 190.147 360.9856235 0. )",
+    }
+    spice.furnsh(write_text_kernel(tmp_path / "test_leapseconds.tls", TEST_LEAPSECONDS))
+    spice.furnsh(write_text_kernel(tmp_path / "test_orientation.tpc", orientation))
+    try:
+        observatory = sp.Observatory(
+            auxconfigs=auxiliaryConfigs(), args=None, oc_file=get_test_filepath("ObsCodes_test.json")
+        )
+        et = np.linspace(-1.5e9, -1.3e9, 50)
+        m, dm = observatory.earthRotationMatrices(et)
+
+        m_spice = np.array([spice.pxform("IAU_EARTH", "J2000", et_i) for et_i in et])
+        dm_spice = np.array(
+            [
+                (spice.pxform("IAU_EARTH", "J2000", et_i + 1) - spice.pxform("IAU_EARTH", "J2000", et_i - 1))
+                / 2
+                for et_i in et
+            ]
+        )
+        # an error of 1e-10 is below a millimetre on the Earth's surface
+        assert np.allclose(m, m_spice, rtol=0, atol=1e-10)
+        assert np.allclose(dm, dm_spice, rtol=0, atol=1e-11)
+
+        # the nodes of the grid are only computed once
+        n_nodes = len(observatory.rotationCache)
+        observatory.earthRotationMatrices(et[::-1])
+        assert len(observatory.rotationCache) == n_nodes
+    finally:
+        spice.kclear()
+
+
+def test_earth_rotation_matrices_itrf93():
+    import spiceypy as spice
+
+    auxconfigs = auxiliaryConfigs()
+    ss.furnish_spiceypy(types.SimpleNamespace(ar_data_file_path=None), auxconfigs)
+    try:
+        observatory = sp.Observatory(
+            auxconfigs=auxconfigs, args=None, oc_file=get_test_filepath("ObsCodes_test.json")
+        )
+        # times over a month of the survey, spread between the nodes of the grid
+        step = observatory.rotation_grid_step
+        et_1962 = spice.str2et("1962-Jan-20")
+        first_node = np.floor((spice.str2et("2025-Jun-01") - et_1962) / step)
+        nodes = first_node + np.arange(0, 240, 7)
+        et = et_1962 + (nodes + np.linspace(0.05, 0.95, len(nodes))) * step
+
+        m, dm = observatory.earthRotationMatrices(et)
+
+        m_spice = np.array([spice.pxform("ITRF93", "J2000", et_i) for et_i in et])
+        dm_spice = np.array(
+            [
+                (spice.pxform("ITRF93", "J2000", et_i + 1) - spice.pxform("ITRF93", "J2000", et_i - 1)) / 2
+                for et_i in et
+            ]
+        )
+        # the linear interpolation of the precession, nutation and polar motion over
+        # the grid is good to 1e-9, below a centimetre on the Earth's surface
+        assert np.allclose(m, m_spice, rtol=0, atol=1e-9)
+        # and to 1e-12 /s in its derivative, below 0.01 mm/s
+        assert np.allclose(dm, dm_spice, rtol=0, atol=1e-12)
+    finally:
+        spice.kclear()
+
+
+def test_observatory_position_cache():
+    observatory = sp.Observatory(
+        auxconfigs=auxiliaryConfigs(), args=None, oc_file=get_test_filepath("ObsCodes_test.json")
+    )
+    observatory.position_cache_size = 4
+
+    computed = []
+
+    def compute_states(et, obsCode, Rearth):
+        computed.extend(et)
+        return np.outer(et, [1.0, 2.0, 3.0]), np.outer(et, [-1.0, -2.0, -3.0])
+
+    observatory.computeObservatoryStates = compute_states
+
+    pos, vel = observatory.barycentricObservatoryStates([1.0, 2.0, 3.0], "X05")
+    assert computed == [1.0, 2.0, 3.0]
+    assert np.array_equal(pos[:, 0], [1.0, 2.0, 3.0])
+
+    # modifying the returned states leaves the cache untouched
+    pos /= 10.0
+    pos, vel = observatory.barycentricObservatoryStates([2.0, 4.0], "X05")
+    assert computed == [1.0, 2.0, 3.0, 4.0]
+    assert np.array_equal(pos[:, 1], [4.0, 8.0])
+    assert np.array_equal(vel[:, 2], [-6.0, -12.0])
+    assert (observatory.cacheHits, observatory.cacheMisses) == (1, 4)
+
+    # the least recently used state (1.0) is evicted first
+    observatory.barycentricObservatoryStates([5.0], "X05")
+    observatory.barycentricObservatoryStates([2.0, 3.0, 1.0], "X05")
+    assert computed == [1.0, 2.0, 3.0, 4.0, 5.0, 1.0]
+
+    # states are cached separately for each observatory
+    assert np.array_equal(observatory.barycentricObservatory(2.0, "I11"), [2.0, 4.0, 6.0])
+    assert computed[-1] == 2.0
+
+
+class FakeEphem:
+    """Stands in for an ASSIST ephemeris, with the Sun at (t, 2t, 3t) moving at (1, 2, 3)"""
+
+    jd_ref = 2451545.0
+
+    def __init__(self):
+        self.queried = []
+
+    def get_particle(self, body, t):
+        from types import SimpleNamespace
+
+        self.queried.append(t + self.jd_ref)
+        return SimpleNamespace(x=t, y=2 * t, z=3 * t, vx=1.0, vy=2.0, vz=3.0)
+
+
+def test_sun_states():
+    ephem = FakeEphem()
+    sun_states = sp.SunStates(ephem)
+    sun_states.cache_size = 3
+
+    epochs = 2451545.0 + np.array([10.0, 20.0, 10.0, 30.0])
+    states = sun_states.get_states(epochs)
+    assert states.shape == (4, 6)
+    assert np.array_equal(states[:, 2], [30.0, 60.0, 30.0, 90.0])
+    assert np.array_equal(states[:, 3:], np.tile([1.0, 2.0, 3.0], (4, 1)))
+    # each epoch is only read once from the ephemeris
+    assert ephem.queried == list(np.unique(epochs))
+
+    # scalars and repeated epochs are served from the cache
+    assert np.array_equal(sun_states.get_states(epochs[1]), [20.0, 40.0, 60.0, 1.0, 2.0, 3.0])
+    assert (sun_states.cacheHits, sun_states.cacheMisses) == (1, 3)
+
+    # the least recently used epoch (10.0) is evicted first
+    sun_states.get_states(2451545.0 + 40.0)
+    sun_states.get_states(2451545.0 + np.array([20.0, 10.0]))
+    assert ephem.queried[3:] == [2451545.0 + 40.0, 2451545.0 + 10.0]
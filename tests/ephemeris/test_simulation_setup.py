@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from sorcha.ephemeris import simulation_setup
+from sorcha.ephemeris.simulation_setup import (
+    EphemerisContext,
+    POINTING_CACHE_COLUMNS,
+    PointingPixels,
+    get_sun_states,
+    pointing_cache_key,
+    read_pointing_cache,
+    write_pointing_cache,
+)
+from sorcha.utilities.sorchaConfigs import auxiliaryConfigs
+
+
+def test_pointing_cache_key(tmp_path):
+    auxconfigs = auxiliaryConfigs()
+    pointings_df = pd.DataFrame(
+        {"observationMidpointMJD_TAI": [60000.1, 60000.2, 60001.3], "observatoryCode": ["X05", "X05", "W84"]}
+    )
+
+    key = pointing_cache_key(pointings_df, auxconfigs, tmp_path)
+    assert key == pointing_cache_key(pointings_df.copy(), auxconfigs, tmp_path)
+
+    # a different observatory, set of pointings or auxiliary file gives a different key
+    other_site = pointings_df.assign(observatoryCode=["X05", "W84", "W84"])
+    assert key != pointing_cache_key(other_site, auxconfigs, tmp_path)
+    assert key != pointing_cache_key(pointings_df.iloc[:2], auxconfigs, tmp_path)
+    with open(os.path.join(tmp_path, auxconfigs.leap_seconds), "w") as f:
+        f.write("leap seconds")
+    assert key != pointing_cache_key(pointings_df, auxconfigs, tmp_path)
+
+
+def test_pointing_cache_round_trip(tmp_path):
+    cache_path = os.path.join(tmp_path, "cache", "pointings_test.npz")
+    assert read_pointing_cache(cache_path) is None
+
+    columns = {column_name: np.random.rand(5) for column_name in POINTING_CACHE_COLUMNS}
+    write_pointing_cache(cache_path, columns)
+
+    # only the cache itself is left behind
+    assert os.listdir(os.path.dirname(cache_path)) == ["pointings_test.npz"]
+    cached_columns = read_pointing_cache(cache_path)
+    for column_name in POINTING_CACHE_COLUMNS:
+        assert np.array_equal(cached_columns[column_name], columns[column_name])
+
+    # a corrupted cache is ignored
+    with open(cache_path, "wb") as f:
+        f.write(b"not a cache")
+    assert read_pointing_cache(cache_path) is None
+
+
+def test_get_sun_states(monkeypatch):
+    # start from an empty cache, and leave the module's cache as it was
+    monkeypatch.setattr(simulation_setup, "_SUN_STATES", {})
+    auxconfigs = auxiliaryConfigs()
+    first_ephem, second_ephem = object(), object()
+
+    # states are shared by every ephemeris built from the same files
+    sun_states = get_sun_states(first_ephem, auxconfigs, "sun_states_test")
+    assert get_sun_states(second_ephem, auxconfigs, "sun_states_test") is sun_states
+    assert sun_states.ephem is second_ephem
+
+    assert get_sun_states(first_ephem, auxconfigs, "other_sun_states_test") is not sun_states
+
+
+def test_ephemeris_context_executor():
+    # the pool of worker processes does not need the ephemeris files, so they are not loaded
+    context = EphemerisContext.__new__(EphemerisContext)
+    context.executor = None
+    context._executor_setup = None
+
+    shared = [1, 2, 3]
+    executor = context.get_executor(2, len, (shared,))
+    assert context.get_executor(2, len, (shared,)) is executor
+
+    # a pool started with other inputs or another number of workers is replaced
+    other = context.get_executor(2, len, ([1, 2, 3],))
+    assert other is not executor
+    assert context.get_executor(3, len, ([1, 2, 3],)) is not other
+
+    context.shutdown_executor()
+    assert context.executor is None
+
+
+def test_pointing_pixels():
+    pointings_df = pd.DataFrame({"pixels_begin": [0, 2], "pixels_end": [2, 5]})
+    pointings_df.attrs["pixels"] = PointingPixels(np.array([3, 4, 10, 11, 12]))
+
+    # the pixels are shared by the rows and frames derived from the pointings, not copied
+    for _, pointing in pointings_df.iterrows():
+        assert pointing.attrs["pixels"] is pointings_df.attrs["pixels"]
+    assert pointings_df.iloc[1:].attrs["pixels"] is pointings_df.attrs["pixels"]
+
+    pixels = pointings_df.attrs["pixels"]
+    assert list(pixels[pointings_df["pixels_begin"][1] : pointings_df["pixels_end"][1]]) == [10, 11, 12]
+    assert pixels.nbytes == 5 * 8
+    assert not pixels.pixels.flags.writeable
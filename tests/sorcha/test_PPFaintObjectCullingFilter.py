@@ -148,3 +148,99 @@ def test_PPEstimatePerihelion():
     assert_almost_equal(np.round(est_q, 3), q, decimal=5)
 
     return
+
+
+def test_PPEstimatePerihelion_mixed_formats():
+    from sorcha.ephemeris.orbit_conversion_utilities import universal_cartesian
+    from sorcha.modules.PPFaintObjectCullingFilter import PPEstimatePerihelion
+
+    gm_sun = 2.9591220828559115e-04
+
+    # the same orbit given in three formats, each at its own epoch
+    q, e, inc, node, argPeri, t_p = 5.0, 0.3, 12.0, 80.0, 140.0, 60200.0
+    a = q / (1 - e)
+    epochs = [60000.0, 60676.0, 61000.0]
+
+    x, y, z, vx, vy, vz = universal_cartesian(
+        gm_sun, q, e, inc * np.pi / 180, node * np.pi / 180, argPeri * np.pi / 180, t_p, epochs[1]
+    )
+    ma = (epochs[2] - t_p) * np.sqrt(gm_sun / a**3) * 180 / np.pi % 360
+
+    aux_df = pd.DataFrame(
+        {
+            "ObjID": ["com", "cart", "kep"],
+            "FORMAT": ["COM", "CART", "KEP"],
+            "q": [q, np.nan, np.nan],
+            "a": [np.nan, np.nan, a],
+            "e": [e, np.nan, e],
+            "inc": [inc, np.nan, inc],
+            "node": [node, np.nan, node],
+            "argPeri": [argPeri, np.nan, argPeri],
+            "t_p_MJD_TDB": [t_p, np.nan, np.nan],
+            "ma": [np.nan, np.nan, ma],
+            "x": [np.nan, x, np.nan],
+            "y": [np.nan, y, np.nan],
+            "z": [np.nan, z, np.nan],
+            "xdot": [np.nan, vx, np.nan],
+            "ydot": [np.nan, vy, np.nan],
+            "zdot": [np.nan, vz, np.nan],
+            "epochMJD_TDB": epochs,
+        },
+        index=[10, 11, 12],
+    )
+
+    est_q = PPEstimatePerihelion(aux_df)
+
+    assert list(est_q.index) == [10, 11, 12]
+    assert_almost_equal(est_q.to_numpy(), q, decimal=10)
+
+
+def test_PPEstimatePerihelion_barycentric():
+    from sorcha.ephemeris.orbit_conversion_utilities import universal_cartesian
+    from sorcha.ephemeris.simulation_geometry import equatorial_to_ecliptic
+    from sorcha.modules.PPFaintObjectCullingFilter import PPEstimatePerihelion
+
+    gm_sun = 2.9591220828559115e-04
+
+    q, e, inc, node, argPeri, t_p = 1.2, 0.4, 8.0, 30.0, 250.0, 60200.0
+    epochs = np.array([60000.0, 60100.0])
+    helio = np.array(
+        [
+            universal_cartesian(
+                gm_sun, q, e, inc * np.pi / 180, node * np.pi / 180, argPeri * np.pi / 180, t_p, epoch
+            )
+            for epoch in epochs
+        ]
+    )
+
+    # barycentric states of the Sun, in the equatorial frame, that change with the epoch
+    class SunStates:
+        def get_states(self, jd_tdb):
+            offset = np.array([4.0e-3, -6.0e-3, 2.0e-3, 5.0e-6, 3.0e-6, -1.0e-6])
+            return np.outer(1 + (jd_tdb - 2460000.5) / 100.0, offset)
+
+    sun = SunStates().get_states(epochs + 2400000.5)
+    sun_ecliptic = np.hstack([equatorial_to_ecliptic(sun[:, :3]), equatorial_to_ecliptic(sun[:, 3:])])
+    bary = helio + sun_ecliptic
+
+    states = np.vstack([bary, helio])
+    aux_df = pd.DataFrame(
+        {
+            "ObjID": ["bcart0", "bcart1", "cart0", "cart1"],
+            "FORMAT": ["BCART", "BCART", "CART", "CART"],
+            "x": states[:, 0],
+            "y": states[:, 1],
+            "z": states[:, 2],
+            "xdot": states[:, 3],
+            "ydot": states[:, 4],
+            "zdot": states[:, 5],
+            "epochMJD_TDB": np.tile(epochs, 2),
+        }
+    )
+
+    assert_almost_equal(PPEstimatePerihelion(aux_df, SunStates()).to_numpy(), q, decimal=10)
+
+    # without the states of the Sun, the barycentric orbits are taken to be heliocentric
+    est_q = PPEstimatePerihelion(aux_df).to_numpy()
+    assert_almost_equal(est_q[2:], q, decimal=10)
+    assert np.all(np.abs(est_q[:2] - q) > 1e-4)
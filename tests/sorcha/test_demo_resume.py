@@ -0,0 +1,99 @@
+import json
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import sorcha.sorcha
+from sorcha.sorcha import runLSSTSimulation
+from sorcha.utilities.dataUtilitiesForTests import get_demo_filepath, get_test_filepath
+from sorcha.utilities.sorchaArguments import sorchaArguments
+from sorcha.utilities.sorchaConfigs import fadingfunctionConfigs, sorchaConfigs
+
+
+def run_resume_test(outpath, output_format, resume=False):
+    """Runs Sorcha on the demo objects one at a time, with the randomisation and fading function on."""
+    os.makedirs(outpath, exist_ok=True)
+    cmd_args_dict = {
+        "paramsinput": get_demo_filepath("sspp_testset_colours.txt"),
+        "orbinfile": get_demo_filepath("sspp_testset_orbits.des"),
+        "input_ephemeris_file": get_demo_filepath("example_ephem_output.txt"),
+        "configfile": get_test_filepath("PPConfig_test_chunked.ini"),
+        "pointing_database": get_test_filepath("baseline_10klines_2.0.db"),
+        "surveyname": "rubin_sim",
+        "outfilestem": "out_resume",
+        "outpath": str(outpath),
+        "loglevel": False,
+        "stats": "stats_resume",
+        "visits_database": None,
+        "seed": 24601,
+        "resume": resume,
+    }
+    args = sorchaArguments(cmd_args_dict)
+    sconfigs = sorchaConfigs(args.configfile, args.surveyname)
+    sconfigs.input.size_serial_chunk = 1
+    sconfigs.expert.randomization_on = True
+    sconfigs.fadingfunction = fadingfunctionConfigs(
+        fading_function_on=True,
+        fading_function_width=0.1,
+        fading_function_peak_efficiency=0.9,
+        survey_name=args.surveyname,
+    )
+    sconfigs.output.output_format = output_format
+    runLSSTSimulation(args, sconfigs)
+
+
+def read_output(path):
+    if path.endswith(".db"):
+        cnx = sqlite3.connect(path)
+        output = pd.read_sql("SELECT * FROM sorcha_results", cnx)
+        cnx.close()
+        return output
+    if path.endswith(".h5"):
+        return pd.read_hdf(path, key="sorcha_results")
+    return pd.read_csv(path)
+
+
+@pytest.mark.parametrize("output_format, suffix", [("csv", ".csv"), ("sqlite3", ".db"), ("hdf5", ".h5")])
+def test_demo_resume(tmp_path, monkeypatch, output_format, suffix):
+    """Interrupts a run once it has written the output of its second chunk with
+    detections, before the chunk is checkpointed, and checks that resuming it
+    gives the same output as an uninterrupted run."""
+
+    run_resume_test(tmp_path / "uninterrupted", output_format)
+
+    write_output, n_writes = sorcha.sorcha.PPWriteOutput, []
+
+    def interrupted_write_output(*args, **kwargs):
+        write_output(*args, **kwargs)
+        n_writes.append(len(args[2]))
+        if len(n_writes) == 2:
+            raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(sorcha.sorcha, "PPWriteOutput", interrupted_write_output)
+        with pytest.raises(KeyboardInterrupt):
+            run_resume_test(tmp_path / "resumed", output_format)
+
+    # the output of the second chunk is written, but the checkpoint still points at its start,
+    # after the random numbers drawn for the first chunk
+    with open(tmp_path / "resumed" / "out_resume_checkpoint.json") as f:
+        checkpoint = json.load(f)
+    assert not checkpoint["finished"] and checkpoint["next_object"] > 0
+    expected = read_output(str(tmp_path / "uninterrupted" / ("out_resume" + suffix)))
+    assert len(read_output(str(tmp_path / "resumed" / ("out_resume" + suffix)))) == sum(n_writes)
+
+    run_resume_test(tmp_path / "resumed", output_format, resume=True)
+
+    resumed = read_output(str(tmp_path / "resumed" / ("out_resume" + suffix)))
+    pd.testing.assert_frame_equal(resumed, expected)
+    # including the columns drawn from the random number generators
+    randomised = ["RA_deg", "Dec_deg", "trailedSourceMag", "trailedSourceMagSigma"]
+    pd.testing.assert_frame_equal(resumed[randomised], expected[randomised])
+
+    # the CSV files are byte-identical
+    for filename in ["stats_resume.csv"] + (["out_resume.csv"] if output_format == "csv" else []):
+        assert (tmp_path / "resumed" / filename).read_bytes() == (
+            tmp_path / "uninterrupted" / filename
+        ).read_bytes()
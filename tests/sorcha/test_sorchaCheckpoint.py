@@ -0,0 +1,139 @@
+import os
+import shutil
+import sqlite3
+import types
+
+import pandas as pd
+import pytest
+
+from sorcha.modules.PPOutput import PPOutWriteCSV, PPOutWriteHDF5, PPOutWriteSqlite3, PPIndexSQLDatabase
+from sorcha.utilities.dataUtilitiesForTests import get_test_filepath
+from sorcha.utilities.sorchaArguments import sorchaArguments
+from sorcha.utilities.sorchaCheckpoint import sorchaCheckpoint, measure_output, truncate_output
+
+
+def make_chunk(first, n=3):
+    return pd.DataFrame(
+        {
+            "ObjID": [f"obj{i}" for i in range(first, first + n)],
+            "fieldMJD_TAI": [60000.0 + i for i in range(first, first + n)],
+            "optFilter": pd.Categorical(["r"] * n, categories=["g", "r", "i"]),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "filename, write",
+    [
+        ("out.csv", PPOutWriteCSV),
+        ("out.db", PPOutWriteSqlite3),
+        ("out.h5", PPOutWriteHDF5),
+    ],
+)
+def test_truncate_output(tmp_path, filename, write):
+    path = os.path.join(tmp_path, filename)
+    assert measure_output(path) is None
+
+    write(make_chunk(0), path)
+    offset = measure_output(path)
+    write(make_chunk(3), path)
+    assert measure_output(path) != offset
+
+    truncate_output(path, offset)
+    assert measure_output(path) == offset
+    write(make_chunk(3), path)
+
+    # the file holds the same rows as one written without being cut back
+    expected = os.path.join(tmp_path, "expected_" + filename)
+    write(make_chunk(0), expected)
+    write(make_chunk(3), expected)
+    if filename.endswith(".csv"):
+        with open(path) as f, open(expected) as g:
+            assert f.read() == g.read()
+    elif filename.endswith(".db"):
+        read = lambda p: pd.read_sql("SELECT * FROM sorcha_results", sqlite3.connect(p))
+        pd.testing.assert_frame_equal(read(path), read(expected))
+    else:
+        pd.testing.assert_frame_equal(pd.read_hdf(path, key="sorcha_results"), pd.read_hdf(expected))
+
+    truncate_output(path, None)
+    assert not os.path.exists(path)
+
+
+def test_truncate_output_indexed_database(tmp_path):
+    path = os.path.join(tmp_path, "out.db")
+    PPOutWriteSqlite3(make_chunk(0), path)
+    offset = measure_output(path)
+    PPOutWriteSqlite3(make_chunk(3), path)
+    PPOutWriteSqlite3(make_chunk(3), path, tablename="other")
+    PPIndexSQLDatabase(path)
+
+    # the tables created after the file was measured are dropped, and the
+    # database can be indexed again
+    truncate_output(path, offset)
+    assert measure_output(path) == {"sorcha_results": 3}
+    PPIndexSQLDatabase(path)
+
+
+def make_checkpoint(tmp_path, configfile, n_objects=10):
+    cmd_args_dict = {
+        "paramsinput": get_test_filepath("testcolour.txt"),
+        "orbinfile": get_test_filepath("testorb.des"),
+        "input_ephemeris_file": get_test_filepath("ephemtestoutput.txt"),
+        "configfile": configfile,
+        "outpath": str(tmp_path),
+        "surveyname": "rubin_sim",
+        "outfilestem": "out",
+        "loglevel": False,
+        "pointing_database": get_test_filepath("baseline_10klines_2.0.db"),
+        "stats": "stats",
+        "visits_database": None,
+        "seed": 24601,
+    }
+    sconfigs = types.SimpleNamespace(
+        input=types.SimpleNamespace(size_serial_chunk=3, ephemerides_type="external", eph_format="csv"),
+        output=types.SimpleNamespace(output_format="csv"),
+    )
+    args = sorchaArguments(cmd_args_dict)
+    return args, sorchaCheckpoint(args, sconfigs, n_objects)
+
+
+def test_sorchaCheckpoint(tmp_path):
+    configfile = os.path.join(tmp_path, "config.ini")
+    shutil.copy(get_test_filepath("test_PPConfig.ini"), configfile)
+    out, stats = os.path.join(tmp_path, "out.csv"), os.path.join(tmp_path, "stats.csv")
+
+    args, checkpoint = make_checkpoint(tmp_path, configfile)
+    args._rngs.getModuleRNG("module1").random(5)
+    checkpoint.save(0)
+    PPOutWriteCSV(make_chunk(0), out)
+    checkpoint.save(3)
+    with open(out) as f:
+        expected_out = f.read()
+    expected = args._rngs.getModuleRNG("module1").random(4)
+
+    # the run is interrupted while writing the second chunk
+    PPOutWriteCSV(make_chunk(3), out)
+    PPOutWriteCSV(make_chunk(3), stats)
+
+    args, checkpoint = make_checkpoint(tmp_path, configfile)
+    assert checkpoint.resume() == (3, False)
+    with open(out) as f:
+        assert f.read() == expected_out
+    assert not os.path.exists(stats)
+    assert (args._rngs.getModuleRNG("module1").random(4) == expected).all()
+
+    checkpoint.save(10, finished=True)
+    assert checkpoint.resume() == (10, True)
+
+    # a run cannot be resumed with different inputs
+    with pytest.raises(SystemExit):
+        make_checkpoint(tmp_path, configfile, n_objects=11)[1].resume()
+    with open(configfile, "a") as f:
+        f.write("\n")
+    with pytest.raises(SystemExit):
+        make_checkpoint(tmp_path, configfile)[1].resume()
+
+    os.remove(checkpoint.filename)
+    with pytest.raises(SystemExit):
+        checkpoint.resume()
@@ -5,7 +5,7 @@ from sorcha.utilities.dataUtilitiesForTests import get_test_filepath
 
 
 class args:
-    def __init__(self, cp, t="testout", o="./", f=False):
+    def __init__(self, cp, t="testout", o="./", f=False, resume=False):
         self.p = get_test_filepath("testcolour.txt")
         self.ob = get_test_filepath("testorb.des")
         self.er = get_test_filepath("ephemtestoutput.txt")
@@ -21,6 +21,7 @@ class args:
         self.ar = None
         self.st = "test.csv"
         self.vd = None
+        self.resume = resume
 
 
 def test_sorchaCommandLineParser():
@@ -43,6 +44,7 @@ def test_sorchaCommandLineParser():
         "output_ephemeris_file": None,
         "stats": "test.csv",
         "visits_database": None,
+        "resume": False,
     }
 
     cmd_dict_2 = sorchaCommandLineParser(args(get_test_filepath("testcomet.txt")))
@@ -61,6 +63,7 @@ def test_sorchaCommandLineParser():
         "output_ephemeris_file": None,
         "stats": "test.csv",
         "visits_database": None,
+        "resume": False,
     }
 
     with open(os.path.join(tmp_path, "dummy_file.txt"), "w") as _:
@@ -69,6 +72,10 @@ def test_sorchaCommandLineParser():
     with pytest.raises(SystemExit) as e:
         _ = sorchaCommandLineParser(args(False, o=tmp_path, t="dummy_file"))
 
+    # resuming a run keeps its output files
+    _ = sorchaCommandLineParser(args(False, o=tmp_path, t="dummy_file", resume=True))
+    assert os.path.isfile(os.path.join(tmp_path, "dummy_file.txt"))
+
     _ = sorchaCommandLineParser(args(False, o=tmp_path, t="dummy_file", f=True))
 
     assert cmd_dict_1 == expected_1
@@ -34,9 +34,25 @@ correct_simulation = {
     "ar_ang_fov": 2.06,
     "ar_fov_buffer": 0.2,
     "ar_picket": 1,
+    "ar_picket_min": 1,
+    "ar_picket_max": 1,
+    "ar_picket_max_motion": 2.0,
     "ar_obs_code": "X05",
     "ar_healpix_order": 6,
     "ar_n_sub_intervals": 101,
+    "ar_n_workers": 1,
+    "ar_particles_per_sim": 1,
+    "ar_lt_tolerance": 1e-9,
+    "ar_interpolation": "lagrange",
+    "ar_chebyshev_order": 8,
+    "ar_chebyshev_window": 16.0,
+    "ar_chebyshev_tolerance": 1e-3,
+    "ar_prune_horizon": None,
+    "ar_state_grid_spacing": None,
+    "ar_sweep": "pointing",
+    "ar_propagator": "assist",
+    "ar_kepler_tolerance": 0.01,
+    "ar_pointing_cache": None,
 }
 
 correct_filters_read = {"observing_filters": "r,g,i,z,u,y", "survey_name": "rubin_sim"}
@@ -275,7 +291,22 @@ def test_inputConfigs_inlist(key_name, expected_list):
 # simulation configs test
 
 
-@pytest.mark.parametrize("key_name", ["ar_ang_fov", "ar_fov_buffer"])
+@pytest.mark.parametrize(
+    "key_name",
+    [
+        "ar_ang_fov",
+        "ar_fov_buffer",
+        "ar_lt_tolerance",
+        "ar_picket_min",
+        "ar_picket_max",
+        "ar_picket_max_motion",
+        "ar_chebyshev_window",
+        "ar_chebyshev_tolerance",
+        "ar_prune_horizon",
+        "ar_state_grid_spacing",
+        "ar_kepler_tolerance",
+    ],
+)
 def test_simulationConfigs_float(key_name):
     """
     Tests that wrong inputs for simulationConfigs float attributes is caught correctly
@@ -296,7 +327,17 @@ def test_simulationConfigs_float(key_name):
     )
 
 
-@pytest.mark.parametrize("key_name", ["ar_picket", "ar_healpix_order", "ar_n_sub_intervals"])
+@pytest.mark.parametrize(
+    "key_name",
+    [
+        "ar_picket",
+        "ar_healpix_order",
+        "ar_n_sub_intervals",
+        "ar_n_workers",
+        "ar_particles_per_sim",
+        "ar_chebyshev_order",
+    ],
+)
 def test_simulationConfigs_int(key_name):
     """
     Tests that wrong inputs for simulationConfigs int attributes is caught correctly
@@ -361,6 +402,174 @@ def test_simulationConfigs_notrequired(key_name):
     )
 
 
+@pytest.mark.parametrize("key_name", ["ar_n_workers", "ar_particles_per_sim"])
+def test_simulationConfigs_positive(key_name):
+    """
+    Makes sure that counts below one are caught correctly
+    """
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs[key_name] = 0
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert error_text.value.code == f"ERROR: {key_name} must be a positive integer."
+
+
+@pytest.mark.parametrize(
+    "key_name, value",
+    [("ar_picket_min", 0.0), ("ar_picket_min", 2.0), ("ar_picket_max", 0.5), ("ar_picket_max_motion", 0.0)],
+)
+def test_simulationConfigs_picket_intervals(key_name, value):
+    """
+    Makes sure that inconsistent adaptive picket intervals are caught correctly
+    """
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_picket_min"] = 0.25
+    simulation_configs["ar_picket_max"] = 4.0
+    test_configs = simulationConfigs(**simulation_configs)
+    assert test_configs.__dict__ == simulation_configs
+
+    simulation_configs[key_name] = value
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    if key_name == "ar_picket_max_motion":
+        assert error_text.value.code == "ERROR: ar_picket_max_motion must be positive."
+    else:
+        assert (
+            error_text.value.code
+            == "ERROR: picket intervals must satisfy 0 < ar_picket_min <= ar_picket <= ar_picket_max."
+        )
+
+
+def test_simulationConfigs_lt_tolerance():
+    """
+    Makes sure that a light travel time tolerance that isn't positive is caught correctly
+    """
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_lt_tolerance"] = 0.0
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert error_text.value.code == "ERROR: ar_lt_tolerance must be positive."
+
+
+def test_simulationConfigs_prune_horizon():
+    """
+    Makes sure that a pruning horizon that isn't positive is caught correctly
+    """
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_prune_horizon"] = 5.0
+    test_configs = simulationConfigs(**simulation_configs)
+    assert test_configs.__dict__ == simulation_configs
+
+    simulation_configs["ar_prune_horizon"] = 0.0
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert error_text.value.code == "ERROR: ar_prune_horizon must be positive."
+
+
+def test_simulationConfigs_state_grid_spacing():
+    """
+    Makes sure that a state grid spacing that isn't positive is caught correctly
+    """
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_state_grid_spacing"] = 0.01
+    test_configs = simulationConfigs(**simulation_configs)
+    assert test_configs.__dict__ == simulation_configs
+
+    simulation_configs["ar_state_grid_spacing"] = -0.01
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert error_text.value.code == "ERROR: ar_state_grid_spacing must be positive."
+
+
+def test_simulationConfigs_propagator():
+    """
+    Makes sure that the propagation keys are validated correctly
+    """
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_propagator"] = "kepler"
+    test_configs = simulationConfigs(**simulation_configs)
+    assert test_configs.__dict__ == simulation_configs
+
+    simulation_configs["ar_propagator"] = "definitely_fake_bad_key"
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert (
+        error_text.value.code
+        == "ERROR: value definitely_fake_bad_key for config parameter ar_propagator not recognised. Expecting one of: ['assist', 'kepler']."
+    )
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_kepler_tolerance"] = -1.0
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert error_text.value.code == "ERROR: ar_kepler_tolerance must be positive."
+
+
+def test_simulationConfigs_interpolation():
+    """
+    Makes sure that the sky position interpolation keys are validated correctly
+    """
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_interpolation"] = "definitely_fake_bad_key"
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert (
+        error_text.value.code
+        == "ERROR: value definitely_fake_bad_key for config parameter ar_interpolation not recognised. Expecting one of: ['lagrange', 'chebyshev']."
+    )
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_sweep"] = "definitely_fake_bad_key"
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert (
+        error_text.value.code
+        == "ERROR: value definitely_fake_bad_key for config parameter ar_sweep not recognised. Expecting one of: ['auto', 'pointing', 'object']."
+    )
+
+    simulation_configs = correct_simulation.copy()
+    simulation_configs["ar_chebyshev_order"] = 1
+
+    with pytest.raises(SystemExit) as error_text:
+        test_configs = simulationConfigs(**simulation_configs)
+
+    assert error_text.value.code == "ERROR: ar_chebyshev_order must be at least 2."
+
+    for key_name in ["ar_chebyshev_window", "ar_chebyshev_tolerance"]:
+        simulation_configs = correct_simulation.copy()
+        simulation_configs[key_name] = 0.0
+
+        with pytest.raises(SystemExit) as error_text:
+            test_configs = simulationConfigs(**simulation_configs)
+
+        assert error_text.value.code == f"ERROR: {key_name} must be positive."
+
+
 ##################################################################################################################################
 
 # filters config test
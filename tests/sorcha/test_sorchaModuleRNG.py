@@ -13,3 +13,19 @@ def test_PerModuleRNG():
     assert rng1 is rng3
     assert rng1 is not rng2
     assert rng3 is not rng2
+
+
+def test_PerModuleRNG_states():
+    rngs = PerModuleRNG(2021)
+    rngs.getModuleRNG("module1").random(5)
+    rngs.getModuleRNG("module2").normal(size=3)
+    states = rngs.get_states()
+
+    expected = [rngs.getModuleRNG(name).random(4) for name in ("module1", "module2", "module3")]
+
+    # generators restored from the states continue the same sequences, and
+    # those not created yet start from the base seed as before
+    restored = PerModuleRNG(rngs.base_seed)
+    restored.set_states(states)
+    for name, values in zip(("module1", "module2", "module3"), expected):
+        assert (restored.getModuleRNG(name).random(4) == values).all()